@@ -0,0 +1,220 @@
+"""
+Batch Job Store for the RAG Service
+Persists /generate/batch jobs and their results in SQLite
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    request TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    key TEXT,
+    prompt TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    seq INTEGER,
+    result TEXT,
+    error TEXT,
+    finished REAL,
+    PRIMARY KEY (job_id, position)
+);
+CREATE INDEX IF NOT EXISTS items_by_seq ON items (job_id, seq);
+"""
+
+ACTIVE = ("queued", "running")
+FINISHED = ("completed", "cancelled", "failed")
+
+
+class BatchJobStore:
+    """
+    Batch generation jobs and their per-item results in a SQLite file
+
+    A job is queued with its shared request settings and one row per
+    prompt. As items finish they get the next `seq` number in their job, so
+    clients can poll or stream "results after seq N" in completion order.
+    The file can be shared by several workers: status changes (including
+    cancellation) go through the database, and a job whose `updated` stamp
+    stops moving is claimed and resumed by another worker.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def create(self, job_id: str, request: dict, items: Sequence[Tuple[Optional[str], str]]):
+        """Queue a job: `request` holds the settings shared by all items, `items` is (key, prompt) pairs"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, status, request, total, created, updated) VALUES (?, 'queued', ?, ?, ?, ?)",
+                    (job_id, json.dumps(request), len(items), now, now)
+                )
+                self._conn.executemany(
+                    "INSERT INTO items (job_id, position, key, prompt) VALUES (?, ?, ?, ?)",
+                    [(job_id, position, key, prompt) for position, (key, prompt) in enumerate(items)]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _job(self, row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["request"] = json.loads(job["request"])
+        job["pending"] = job["total"] - job["completed"] - job["failed"]
+        return job
+
+    def job(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def jobs(self, limit: int = 50) -> List[dict]:
+        """The most recent jobs, newest first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def status(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    def pending_items(self, job_id: str) -> List[dict]:
+        """Items still to run, in submission order"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT position, key, prompt FROM items WHERE job_id = ? AND status = 'pending' ORDER BY position",
+                (job_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None) -> bool:
+        """Move an active job to `status`; a job that has finished (or was cancelled) stays as it is"""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ? AND status IN {ACTIVE}",
+                (status, error, time.time(), job_id)
+            )
+        return cursor.rowcount == 1
+
+    def finish_item(self, job_id: str, position: int, result: Optional[dict] = None, error: Optional[str] = None):
+        """Record an item's result (or error) and give it the job's next seq number"""
+        status = "failed" if error is not None else "done"
+        counter = "failed" if error is not None else "completed"
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM items WHERE job_id = ?", (job_id,)
+                ).fetchone()[0]
+                cursor = self._conn.execute(
+                    "UPDATE items SET status = ?, seq = ?, result = ?, error = ?, finished = ? "
+                    "WHERE job_id = ? AND position = ? AND status = 'pending'",
+                    (status, seq, json.dumps(result) if result is not None else None, error, now, job_id, position)
+                )
+                if cursor.rowcount:
+                    self._conn.execute(
+                        f"UPDATE jobs SET {counter} = {counter} + 1, updated = ? WHERE id = ?", (now, job_id)
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def results(self, job_id: str, after: int = 0, limit: int = 100) -> List[dict]:
+        """Finished items with seq > `after`, in completion order"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT position, key, prompt, status, seq, result, error, finished FROM items "
+                "WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (job_id, after, limit)
+            ).fetchall()
+        results = []
+        for row in rows:
+            item = dict(row)
+            result = json.loads(item.pop("result")) if row["result"] else {}
+            if item["error"] is None:
+                del item["error"]
+            results.append({**item, **result})
+        return results
+
+    def heartbeat(self, job_ids: Sequence[str]):
+        """Mark jobs running here as alive, so other workers don't claim them"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                f"UPDATE jobs SET updated = ? WHERE id = ? AND status IN {ACTIVE}",
+                [(now, job_id) for job_id in job_ids]
+            )
+
+    def claim_stale(self, stale_seconds: float) -> List[str]:
+        """
+        Take over active jobs nobody has touched for `stale_seconds`
+
+        Covers jobs queued before a restart and jobs whose worker died. The
+        claim is a conditional UPDATE, so only one worker wins each job.
+        """
+        now = time.time()
+        claimed = []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, updated FROM jobs WHERE status IN {ACTIVE} AND updated < ?",
+                (now - stale_seconds,)
+            ).fetchall()
+            for row in rows:
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET updated = ? WHERE id = ? AND updated = ?", (now, row["id"], row["updated"])
+                )
+                if cursor.rowcount:
+                    claimed.append(row["id"])
+        return claimed
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Delete finished jobs older than `max_age_seconds`"""
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                old = [row["id"] for row in self._conn.execute(
+                    f"SELECT id FROM jobs WHERE status IN {FINISHED} AND updated < ?", (cutoff,)
+                )]
+                self._conn.executemany("DELETE FROM items WHERE job_id = ?", [(job_id,) for job_id in old])
+                self._conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in old])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(old)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {"path": self.path, "jobs": {row["status"]: row["n"] for row in rows}}
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+ANN Recall / Latency Benchmark
+==============================
+
+Measures how Chroma's HNSW index trades recall against latency and memory as
+a track grows, for the HNSW settings a track can configure in
+rag_config.toml ([tracks.<name>.hnsw]: space, M, construction_ef, search_ef).
+
+For every corpus size and HNSW setting it builds a collection of synthetic
+MiniLM-sized (384-d, normalized, clustered) vectors, then reports:
+
+  build     insert time and throughput
+  memory    process RSS growth while the index was built, and size on disk
+  latency   p50 / p99 / mean of single-query `collection.query` calls
+  recall@k  overlap with exact top-k computed by brute force in NumPy
+
+Results are written as JSON together with the Chroma/NumPy versions and the
+git commit, and --compare prints the change against an earlier results file.
+Large corpora take a while to insert: start with --sizes 10000,100000.
+
+Usage:
+    python3 bench_ann.py --sizes 10000,100000
+    python3 bench_ann.py --hnsw "" --hnsw "search_ef=50" --hnsw "M=32,construction_ef=200,search_ef=100"
+    python3 bench_ann.py --sizes 10000,100000,1000000 --output ann.json --compare ann_previous.json
+"""
+
+from typing import Dict, List, Tuple
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from rag_config import HNSW_KEYS
+
+DEFAULT_HNSW = ["", "search_ef=50", "M=32,construction_ef=200,search_ef=100"]
+
+
+def parse_hnsw(value: str) -> Dict[str, object]:
+    """"M=32,search_ef=100" -> {"M": 32, "search_ef": 100}; "" means Chroma's defaults"""
+    settings: Dict[str, object] = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        key, raw = item.split("=", 1)
+        key = key.strip()
+        if key not in HNSW_KEYS:
+            raise SystemExit(f"❌ Unknown HNSW setting {key} (valid: {sorted(HNSW_KEYS)})")
+        settings[key] = raw.strip() if key == "space" else int(raw)
+    return settings
+
+
+def hnsw_label(settings: Dict[str, object]) -> str:
+    return ",".join(f"{key}={value}" for key, value in sorted(settings.items())) or "defaults"
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Peak, not current, on macOS
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def directory_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total / 2 ** 20
+
+
+def make_corpus(size: int, dim: int, n_queries: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Clustered unit vectors (like sentence embeddings of related chunks) and queries near them"""
+    rng = np.random.default_rng(seed)
+    n_clusters = max(16, size // 1000)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    corpus = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, 100_000):
+        end = min(size, start + 100_000)
+        labels = rng.integers(0, n_clusters, end - start)
+        corpus[start:end] = centers[labels] + 0.6 * rng.standard_normal((end - start, dim)).astype(np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    picks = rng.integers(0, size, n_queries)
+    queries = corpus[picks] + 0.3 * rng.standard_normal((n_queries, dim)).astype(np.float32) / np.sqrt(dim) * 4
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return corpus, queries.astype(np.float32)
+
+
+def brute_force_topk(corpus: np.ndarray, queries: np.ndarray, k: int, space: str) -> np.ndarray:
+    """Exact top-k ids per query, ranked by the same distance Chroma uses for the space"""
+    best_ids = np.empty((len(queries), 0), dtype=np.int64)
+    best_dist = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(corpus), 100_000):
+        block = corpus[start:start + 100_000]
+        scores = queries @ block.T
+        if space == "l2":
+            distances = np.einsum("ij,ij->i", block, block)[None, :] - 2 * scores
+        elif space == "cosine":
+            distances = 1 - scores / (np.linalg.norm(block, axis=1)[None, :] * np.linalg.norm(queries, axis=1)[:, None])
+        else:
+            distances = 1 - scores
+        take = min(k, block.shape[0])
+        top = np.argpartition(distances, take - 1, axis=1)[:, :take]
+        best_ids = np.concatenate([best_ids, top + start], axis=1)
+        best_dist = np.concatenate([best_dist, np.take_along_axis(distances, top, axis=1)], axis=1)
+    order = np.argsort(best_dist, axis=1)[:, :k]
+    return np.take_along_axis(best_ids, order, axis=1)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def max_batch_size(client) -> int:
+    for attr in ("get_max_batch_size", "max_batch_size"):
+        value = getattr(client, attr, None)
+        value = value() if callable(value) else value
+        if value:
+            return int(value)
+    return 5000
+
+
+def run_one(client, corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray, settings: Dict[str, object], args) -> Dict[str, object]:
+    """Build one collection with the given HNSW settings and measure it"""
+    name = f"bench_ann_{len(corpus)}"
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    gc.collect()
+    rss_before = rss_mb()
+    metadata = {f"hnsw:{key}": value for key, value in settings.items()}
+    collection = client.create_collection(name=name, metadata=metadata or None, embedding_function=None)
+
+    batch = min(args.batch_size, max_batch_size(client))
+    started = time.perf_counter()
+    for start in range(0, len(corpus), batch):
+        end = min(len(corpus), start + batch)
+        collection.add(ids=[f"c{i}" for i in range(start, end)], embeddings=corpus[start:end].tolist())
+        if len(corpus) >= 100_000 and (end // batch) % 20 == 0:
+            print(f"   ... {end:,}/{len(corpus):,} inserted")
+    build_s = time.perf_counter() - started
+    rss_after = rss_mb()
+
+    for query in queries[:min(10, len(queries))]:
+        collection.query(query_embeddings=[query.tolist()], n_results=args.k, include=["distances"])
+
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=args.k, include=["distances"])
+        latencies.append(time.perf_counter() - started)
+        found = {int(doc_id[1:]) for doc_id in result["ids"][0]}
+        recalls.append(len(found.intersection(expected.tolist())) / len(expected))
+
+    # Measured before the delete, which removes the collection's HNSW segment
+    disk_mb = directory_mb(args.db_path)
+    client.delete_collection(name)
+    return {
+        "size": len(corpus),
+        "hnsw": settings,
+        "hnsw_label": hnsw_label(settings),
+        "build_s": round(build_s, 2),
+        "insert_per_s": round(len(corpus) / build_s, 1),
+        "rss_growth_mb": round(rss_after - rss_before, 1),
+        "disk_mb": round(disk_mb, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+    }
+
+
+def environment() -> Dict[str, object]:
+    import chromadb
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": commit,
+        "chromadb": getattr(chromadb, "__version__", "unknown"),
+        "numpy": np.__version__,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(runs: List[dict], previous_path: str):
+    """Print recall and latency changes against an earlier results file"""
+    with open(previous_path) as f:
+        previous = {(run["size"], run["hnsw_label"]): run for run in json.load(f)["runs"]}
+    print(f"\n📈 Compared with {previous_path}:")
+    print(f"{'size':>9} {'hnsw':<44} {'recall Δ':>9} {'p50 Δ ms':>9} {'p99 Δ ms':>9}")
+    for run in runs:
+        old = previous.get((run["size"], run["hnsw_label"]))
+        if old is None:
+            continue
+        print(f"{run['size']:>9,} {run['hnsw_label']:<44} {run['recall_at_k'] - old['recall_at_k']:>+9.4f} "
+              f"{run['p50_ms'] - old['p50_ms']:>+9.3f} {run['p99_ms'] - old['p99_ms']:>+9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HNSW recall, latency and memory against brute force")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated corpus sizes")
+    parser.add_argument("--hnsw", action="append", default=None,
+                        help='HNSW settings to compare, e.g. "M=32,search_ef=100" (repeatable; "" = Chroma defaults)')
+    parser.add_argument("--space", choices=["l2", "cosine", "ip"], default="l2", help="Distance (hnsw:space) for every run")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension (all-MiniLM-L6-v2: 384)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10, help="Results per query (recall@k)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Vectors per collection.add call")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--db", help="Chroma directory to build in (default: a temporary directory)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier --output file to compare against")
+    args = parser.parse_args()
+
+    import chromadb
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    configs = [parse_hnsw(value) for value in (args.hnsw if args.hnsw is not None else DEFAULT_HNSW)]
+    for settings in configs:
+        settings["space"] = args.space
+
+    db = args.db_path = args.db or tempfile.mkdtemp(prefix="bench_ann_")
+    client = chromadb.PersistentClient(path=db)
+    results = {
+        "environment": environment(),
+        "settings": {"dim": args.dim, "queries": args.queries, "k": args.k, "space": args.space, "seed": args.seed},
+        "runs": []
+    }
+
+    try:
+        for size in sizes:
+            print(f"🧪 {size:,} chunks: generating corpus and exact top-{args.k}...")
+            corpus, queries = make_corpus(size, args.dim, args.queries, args.seed)
+            truth = brute_force_topk(corpus, queries, args.k, args.space)
+            for settings in configs:
+                print(f"🏗️  Building HNSW ({hnsw_label(settings)})...")
+                run = run_one(client, corpus, queries, truth, settings, args)
+                results["runs"].append(run)
+                print(f"   recall@{args.k} {run['recall_at_k']:.3f}, p50 {run['p50_ms']:.2f}ms, "
+                      f"p99 {run['p99_ms']:.2f}ms, built in {run['build_s']:.1f}s")
+            del corpus, queries, truth
+    finally:
+        if not args.db:
+            shutil.rmtree(db, ignore_errors=True)
+
+    print()
+    print(f"{'size':>9} {'hnsw':<44} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'RSS +MB':>8}")
+    for run in results["runs"]:
+        print(f"{run['size']:>9,} {run['hnsw_label']:<44} {run['recall_at_k']:>7.3f} {run['p50_ms']:>8.2f} "
+              f"{run['p99_ms']:>8.2f} {run['build_s']:>8.1f} {run['rss_growth_mb']:>8.1f}")
+
+    if args.compare:
+        compare(results["runs"], args.compare)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
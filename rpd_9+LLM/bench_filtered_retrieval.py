@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Filtered Retrieval Benchmark
+============================
+
+Compares the ways /generate can answer a request with a metadata filter
+("where": {"module": ...}) as the filter gets more or less selective:
+
+  ann          collection.query(..., where=...) - Chroma filters, then walks
+               the HNSW graph
+  exact        MetadataIndex.select + exact_search - the matching ids come
+               from the in-memory posting sets and are ranked by brute force
+  post-filter  an unfiltered query for k * --overfetch results, filtered
+               afterwards (the naive baseline)
+
+Recall is measured against exact top-k among the matching chunks. The
+service takes the exact path when a filter matches at most
+RAG_FILTER_EXACT_MAX chunks; the benchmark suggests a value for this
+machine from the point where the ANN path becomes faster.
+
+Each chunk gets a module (0-999, so a filter on n modules matches about
+n/1000 of the track), a difficulty and a certification level.
+
+Usage:
+    python3 bench_filtered_retrieval.py
+    python3 bench_filtered_retrieval.py --docs 50000 --queries 100 --output filtered.json
+"""
+
+from typing import Dict, List, Set
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+from filtered_search import MetadataIndex, exact_distances, exact_search
+
+DIFFICULTIES = ["beginner", "intermediate", "advanced"]
+SELECTIVITIES = [0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5]
+
+
+def build_corpus(n_docs: int, dim: int, seed: int):
+    """Return (ids, vectors, metadatas) for a synthetic track of clustered unit vectors"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(16, n_docs // 500), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n_docs)] + 0.6 * rng.standard_normal((n_docs, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"chunk_{i}" for i in range(n_docs)]
+    metadatas = [
+        {
+            "source": f"manual_{i % 200}.pdf",
+            "module": int(module),
+            "difficulty": DIFFICULTIES[int(level) % 3],
+            "certification_level": int(level) % 5 + 1,
+        }
+        for i, (module, level) in enumerate(zip(rng.integers(0, 1000, n_docs), rng.integers(0, 15, n_docs)))
+    ]
+    return ids, vectors, metadatas
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def summarize(latencies: List[float], recalls: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "recall": round(sum(recalls) / len(recalls), 4),
+    }
+
+
+def recall(found: List[str], expected: Set[str]) -> float:
+    return len(expected.intersection(found)) / len(expected) if expected else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark filtered vector search paths against selectivity")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=50, help="Queries per selectivity")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--overfetch", type=int, default=10, help="Post-filter baseline fetches top_k * overfetch")
+    parser.add_argument("--selectivities", default=",".join(str(s) for s in SELECTIVITIES),
+                        help="Comma-separated fractions of the track a filter should match")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    print(f"🧪 Building a {args.docs:,}-chunk track...")
+    ids, vectors, metadatas = build_corpus(args.docs, args.dim, args.seed)
+    db = tempfile.mkdtemp(prefix="bench_filtered_")
+    client = chromadb.PersistentClient(path=db)
+    collection = client.create_collection("bench_filtered", embedding_function=None)
+    batch = 5000
+    for start in range(0, args.docs, batch):
+        collection.add(
+            ids=ids[start:start + batch],
+            embeddings=vectors[start:start + batch].tolist(),
+            metadatas=metadatas[start:start + batch],
+            documents=[f"chunk {i}" for i in range(start, min(args.docs, start + batch))]
+        )
+    index = MetadataIndex(["source", "module", "difficulty", "certification_level"])
+    index.add(ids, metadatas)
+    position = {doc_id: i for i, doc_id in enumerate(ids)}
+
+    rng = np.random.default_rng(args.seed + 1)
+    queries = vectors[rng.integers(0, args.docs, args.queries)] + 0.05 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    k = args.top_k
+    rows = []
+
+    try:
+        for selectivity in (float(s) for s in args.selectivities.split(",")):
+            modules = list(range(max(1, int(round(selectivity * 1000)))))
+            where = {"module": {"$in": modules}}
+            allowed = index.select(where)
+            if not allowed:
+                continue
+            allowed_ids = sorted(allowed, key=position.get)
+            subset = vectors[[position[doc_id] for doc_id in allowed_ids]]
+            n_results = min(k, len(allowed))
+
+            timings: Dict[str, List[float]] = {"ann": [], "exact": [], "post_filter": []}
+            recalls: Dict[str, List[float]] = {"ann": [], "exact": [], "post_filter": []}
+            for query in queries:
+                distances = exact_distances(subset, query)
+                expected = {allowed_ids[i] for i in np.argsort(distances)[:n_results]}
+                embedding = query.tolist()
+
+                started = time.perf_counter()
+                result = collection.query(query_embeddings=[embedding], n_results=n_results, where=where,
+                                          include=["documents", "metadatas", "distances"])
+                timings["ann"].append(time.perf_counter() - started)
+                recalls["ann"].append(recall(result["ids"][0], expected))
+
+                started = time.perf_counter()
+                hits = exact_search(collection, index.select(where), embedding, n_results)
+                timings["exact"].append(time.perf_counter() - started)
+                recalls["exact"].append(recall([hit["id"] for hit in hits], expected))
+
+                started = time.perf_counter()
+                result = collection.query(query_embeddings=[embedding], n_results=min(args.docs, k * args.overfetch),
+                                          include=["documents", "metadatas", "distances"])
+                kept = [doc_id for doc_id in result["ids"][0] if doc_id in allowed][:n_results]
+                timings["post_filter"].append(time.perf_counter() - started)
+                recalls["post_filter"].append(recall(kept, expected))
+
+            row = {
+                "selectivity": selectivity,
+                "matching": len(allowed),
+                **{path: summarize(timings[path], recalls[path]) for path in timings}
+            }
+            rows.append(row)
+            print(f"   {selectivity:>6.1%} ({len(allowed):,} chunks): "
+                  f"ann {row['ann']['p50_ms']:.2f}ms, exact {row['exact']['p50_ms']:.2f}ms, "
+                  f"post-filter recall {row['post_filter']['recall']:.2f}")
+    finally:
+        shutil.rmtree(db, ignore_errors=True)
+
+    print()
+    print(f"{'selectivity':>11} {'chunks':>8} │ {'ann p50':>8} {'recall':>6} │ {'exact p50':>9} {'recall':>6} │ {'post p50':>8} {'recall':>6}")
+    for row in rows:
+        print(f"{row['selectivity']:>11.1%} {row['matching']:>8,} │ "
+              f"{row['ann']['p50_ms']:>8.2f} {row['ann']['recall']:>6.2f} │ "
+              f"{row['exact']['p50_ms']:>9.2f} {row['exact']['recall']:>6.2f} │ "
+              f"{row['post_filter']['p50_ms']:>8.2f} {row['post_filter']['recall']:>6.2f}")
+
+    exact_wins = [row["matching"] for row in rows if row["exact"]["p50_ms"] <= row["ann"]["p50_ms"]]
+    suggested = max(exact_wins) if exact_wins else 0
+    print(f"\n💡 Exact search was faster up to {suggested:,} matching chunks: RAG_FILTER_EXACT_MAX={suggested}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "settings": {"docs": args.docs, "dim": args.dim, "queries": args.queries, "top_k": k, "overfetch": args.overfetch},
+                "results": rows,
+                "suggested_filter_exact_max": suggested
+            }, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
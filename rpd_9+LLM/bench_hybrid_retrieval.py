@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Hybrid Retrieval Benchmark
+==========================
+
+Compares recall and latency of the plain vector path (`collection.query`)
+against BM25 + vector search fused with reciprocal rank fusion, as used by
+/generate.
+
+The synthetic corpus mimics the failure case hybrid search is meant to fix:
+many near-identical procedure chunks that differ only in an exact code
+(refrigerant, part number, drug name). Each query asks about one code, and
+the chunk containing that code is the single relevant result.
+
+Usage:
+    python3 bench_hybrid_retrieval.py
+    python3 bench_hybrid_retrieval.py --docs 5000 --queries 300 --top-k 3 --output hybrid.json
+"""
+
+from typing import Dict, List
+import argparse
+import json
+import random
+import statistics
+import time
+
+import chromadb
+from chromadb.utils import embedding_functions
+
+from bm25_index import BM25Index, reciprocal_rank_fusion
+
+TOPICS = [
+    ("charging", "Charge the system through the service valve and verify subcooling against the data plate."),
+    ("recovery", "Recover refrigerant into a certified cylinder before opening the sealed system."),
+    ("diagnostics", "Measure suction and discharge pressure and compare them with the manufacturer chart."),
+    ("installation", "Mount the condensing unit level on a pad with service clearance on all sides."),
+    ("medication", "Verify the order, the patient identifiers and the dose before administration."),
+    ("monitoring", "Record vital signs before and after the dose and report adverse reactions."),
+]
+QUERY_TEMPLATES = [
+    "What is the {topic} procedure for {code}?",
+    "How do I handle {code} during {topic}?",
+    "{topic} steps for {code}",
+]
+SYLLABLES = ["zo", "la", "trex", "vi", "nor", "pra", "mex", "dal", "quin", "sil"]
+
+
+def make_code(rng: random.Random, kind: int) -> str:
+    if kind == 0:
+        return f"R-{rng.randint(400, 499)}{rng.choice('ABC')}"
+    if kind == 1:
+        return f"PN-{rng.randint(10000, 99999)}-{rng.choice('KLMN')}"
+    return "".join(rng.choice(SYLLABLES) for _ in range(3))
+
+
+def build_corpus(n_docs: int, seed: int):
+    """Return (ids, documents, metadatas, codes) with one unique code per chunk"""
+    rng = random.Random(seed)
+    ids, documents, metadatas, codes = [], [], [], []
+    used = set()
+    while len(ids) < n_docs:
+        code = make_code(rng, len(ids) % 3)
+        if code in used:
+            continue
+        used.add(code)
+        topic, sentence = TOPICS[len(ids) % len(TOPICS)]
+        documents.append(f"{topic.title()} guidance for {code}. {sentence} Applies to {code} only.")
+        ids.append(f"doc_{len(ids)}")
+        metadatas.append({"topic": topic, "code": code})
+        codes.append((code, topic))
+    return ids, documents, metadatas, codes
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def summarize(latencies: List[float], hits: int, total: int) -> Dict[str, float]:
+    return {
+        "recall_at_k": round(hits / total, 4),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vector-only vs hybrid (BM25 + vector) retrieval")
+    parser.add_argument("--docs", type=int, default=2000, help="Chunks in the synthetic corpus")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--top-k", type=int, default=3, help="Results per query")
+    parser.add_argument("--candidates", type=int, default=4, help="Hybrid candidates per ranking = top_k * this")
+    parser.add_argument("--rrf-k", type=int, default=60, help="Reciprocal rank fusion constant")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    print(f"📚 Building corpus of {args.docs} chunks...")
+    ids, documents, metadatas, codes = build_corpus(args.docs, args.seed)
+
+    embedding_function = embedding_functions.ONNXMiniLM_L6_V2()
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(name="bench_hybrid", embedding_function=embedding_function)
+    started = time.time()
+    for start in range(0, len(ids), 256):
+        collection.add(
+            ids=ids[start:start + 256],
+            documents=documents[start:start + 256],
+            metadatas=metadatas[start:start + 256]
+        )
+    print(f"⏱️  Embedded and indexed in {time.time() - started:.1f}s")
+
+    index = BM25Index()
+    started = time.time()
+    index.add(ids, documents, metadatas)
+    print(f"⏱️  BM25 index built in {(time.time() - started) * 1000:.0f}ms")
+
+    rng = random.Random(args.seed + 1)
+    targets = rng.sample(range(len(ids)), min(args.queries, len(ids)))
+    queries = [
+        (rng.choice(QUERY_TEMPLATES).format(code=codes[i][0], topic=codes[i][1]), ids[i])
+        for i in targets
+    ]
+
+    # Warm up the ONNX session so the first query does not skew latency
+    collection.query(query_texts=["warm up"], n_results=1)
+
+    vector_latencies, vector_hits = [], 0
+    for query, expected in queries:
+        started = time.perf_counter()
+        result = collection.query(query_texts=[query], n_results=args.top_k)
+        vector_latencies.append(time.perf_counter() - started)
+        vector_hits += expected in result["ids"][0]
+
+    hybrid_latencies, hybrid_hits = [], 0
+    n_candidates = args.top_k * args.candidates
+    for query, expected in queries:
+        started = time.perf_counter()
+        embedding = embedding_function([query])[0]
+        result = collection.query(query_embeddings=[embedding], n_results=n_candidates)
+        keyword = index.search(query, n_candidates)
+        fused = reciprocal_rank_fusion([result["ids"][0], [doc_id for doc_id, _ in keyword]], k=args.rrf_k)
+        top = [doc_id for doc_id, _ in fused[:args.top_k]]
+        hybrid_latencies.append(time.perf_counter() - started)
+        hybrid_hits += expected in top
+
+    results = {
+        "docs": args.docs,
+        "queries": len(queries),
+        "top_k": args.top_k,
+        "candidates_per_ranking": n_candidates,
+        "vector": summarize(vector_latencies, vector_hits, len(queries)),
+        "hybrid": summarize(hybrid_latencies, hybrid_hits, len(queries)),
+    }
+
+    print()
+    print(f"{'path':<8} {'recall@' + str(args.top_k):>10} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}")
+    for name in ("vector", "hybrid"):
+        r = results[name]
+        print(f"{name:<8} {r['recall_at_k']:>10.3f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['mean_ms']:>9.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
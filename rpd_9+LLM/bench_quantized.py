@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Quantized Index Benchmark
+=========================
+
+Compares the compact int8 index (quantized_index.py, enabled per track with
+`quantized = true`) with Chroma's HNSW `collection.query` on the synthetic
+corpora of bench_ann.py (384-d, normalized, clustered vectors):
+
+  size      bytes on disk (Chroma directory vs the .npy files) and process
+            RSS growth after loading/mapping the index and querying it
+  recall@k  overlap with exact top-k computed by brute force in NumPy, and
+            agreement with what `collection.query` returns today
+  latency   p50 / p99 of the int8 scan, and of scan + exact re-score via
+            Chroma (the path /generate takes), for each re-score factor
+
+The re-score factor is RAG_QUANTIZED_RESCORE: the scan keeps top_k * factor
+candidates, which are then ranked by their exact float embeddings.
+
+Usage:
+    python3 bench_quantized.py --sizes 10000,100000
+    python3 bench_quantized.py --sizes 1000000 --rescore 2,4 --output quantized.json
+"""
+
+from typing import Dict, List
+import argparse
+import gc
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from bench_ann import brute_force_topk, directory_mb, environment, make_corpus, max_batch_size, percentile, rss_mb
+from filtered_search import exact_search
+from quantized_index import QuantizedIndex
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def recall(found: List[str], expected: set) -> float:
+    return len(set(found) & expected) / len(expected)
+
+
+def run_size(client, size: int, args) -> Dict[str, object]:
+    print(f"🧪 {size:,} chunks: generating corpus and exact top-{args.k}...")
+    corpus, queries = make_corpus(size, args.dim, args.queries, args.seed)
+    truth = [{f"c{i}" for i in row} for row in brute_force_topk(corpus, queries, args.k, args.space)]
+    ids = [f"c{i}" for i in range(size)]
+    run: Dict[str, object] = {"size": size, "float32_mb": round(corpus.nbytes / 2 ** 20, 1)}
+
+    # Chroma, as tracks are served today
+    name = f"bench_quantized_{size}"
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    gc.collect()
+    rss_before = rss_mb()
+    collection = client.create_collection(name=name, metadata={"hnsw:space": args.space}, embedding_function=None)
+    batch = min(args.batch_size, max_batch_size(client))
+    started = time.perf_counter()
+    for start in range(0, size, batch):
+        collection.add(ids=ids[start:start + batch], embeddings=corpus[start:start + batch].tolist())
+    chroma_build_s = time.perf_counter() - started
+    latencies, recalls, chroma_hits = [], [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=args.k, include=["distances"])
+        latencies.append(time.perf_counter() - started)
+        chroma_hits.append(set(result["ids"][0]))
+        recalls.append(recall(result["ids"][0], expected))
+    run["chroma"] = {
+        "build_s": round(chroma_build_s, 2),
+        "disk_mb": round(directory_mb(args.db_path), 1),
+        "rss_growth_mb": round(rss_mb() - rss_before, 1),
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+        **latency_summary(latencies)
+    }
+
+    # int8 index: build, then map it afresh so RSS reflects serving, not building
+    index_dir = tempfile.mkdtemp(prefix="bench_quantized_")
+    try:
+        started = time.perf_counter()
+        builder = QuantizedIndex(index_dir, name, space=args.space)
+        for start in range(0, size, batch):
+            builder.add(ids[start:start + batch], corpus[start:start + batch])
+        builder.compact()
+        quantized_build_s = time.perf_counter() - started
+        del builder
+        gc.collect()
+        rss_before = rss_mb()
+        index = QuantizedIndex(index_dir, name, space=args.space)
+        index.load()
+
+        scan_latencies, scan_recalls = [], []
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            found = index.candidates([query], args.k)[0]
+            scan_latencies.append(time.perf_counter() - started)
+            scan_recalls.append(recall(found, expected))
+
+        rescored = []
+        for factor in args.rescore:
+            latencies, recalls, agreement = [], [], []
+            for query, expected, chroma_found in zip(queries, truth, chroma_hits):
+                started = time.perf_counter()
+                candidates = index.candidates([query], args.k * factor)[0]
+                hits = exact_search(collection, candidates, query.tolist(), args.k, args.space)
+                latencies.append(time.perf_counter() - started)
+                found = [hit["id"] for hit in hits]
+                recalls.append(recall(found, expected))
+                agreement.append(recall(found, chroma_found) if chroma_found else 1.0)
+            rescored.append({
+                "factor": factor,
+                "recall_at_k": round(float(np.mean(recalls)), 4),
+                "agreement_with_chroma": round(float(np.mean(agreement)), 4),
+                **latency_summary(latencies)
+            })
+        stats = index.stats()
+        run["quantized"] = {
+            "build_s": round(quantized_build_s, 2),
+            "disk_mb": round(stats["disk_bytes"] / 2 ** 20, 1),
+            "rss_growth_mb": round(rss_mb() - rss_before, 1),
+            "scan_recall_at_k": round(float(np.mean(scan_recalls)), 4),
+            "scan": latency_summary(scan_latencies),
+            "rescored": rescored
+        }
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+        client.delete_collection(name)
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the int8 quantized index against Chroma's HNSW query")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma-separated corpus sizes")
+    parser.add_argument("--rescore", default="1,2,4,8", help="Comma-separated re-score factors (candidates = k * factor)")
+    parser.add_argument("--space", choices=["l2", "cosine", "ip"], default="l2")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension (all-MiniLM-L6-v2: 384)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10, help="Results per query (recall@k)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Vectors per collection.add call")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    args.rescore = [int(factor) for factor in args.rescore.split(",")]
+
+    import chromadb
+
+    args.db_path = tempfile.mkdtemp(prefix="bench_quantized_db_")
+    client = chromadb.PersistentClient(path=args.db_path)
+    results = {
+        "environment": environment(),
+        "settings": {"dim": args.dim, "queries": args.queries, "k": args.k, "space": args.space, "seed": args.seed},
+        "runs": []
+    }
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            results["runs"].append(run_size(client, size, args))
+    finally:
+        shutil.rmtree(args.db_path, ignore_errors=True)
+
+    print()
+    print(f"{'size':>9} {'index':<16} {'disk MB':>8} {'RSS +MB':>8} {'recall':>7} {'vs chroma':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for run in results["runs"]:
+        chroma, quantized = run["chroma"], run["quantized"]
+        print(f"{run['size']:>9,} {'chroma hnsw':<16} {chroma['disk_mb']:>8.1f} {chroma['rss_growth_mb']:>8.1f} "
+              f"{chroma['recall_at_k']:>7.3f} {'':>9} {chroma['p50_ms']:>8.2f} {chroma['p99_ms']:>8.2f}")
+        print(f"{'':>9} {'int8 scan':<16} {quantized['disk_mb']:>8.1f} {quantized['rss_growth_mb']:>8.1f} "
+              f"{quantized['scan_recall_at_k']:>7.3f} {'':>9} {quantized['scan']['p50_ms']:>8.2f} {quantized['scan']['p99_ms']:>8.2f}")
+        for rescored in quantized["rescored"]:
+            print(f"{'':>9} {'+ rescore x' + str(rescored['factor']):<16} {'':>8} {'':>8} {rescored['recall_at_k']:>7.3f} "
+                  f"{rescored['agreement_with_chroma']:>9.3f} {rescored['p50_ms']:>8.2f} {rescored['p99_ms']:>8.2f}")
+    print(f"\n(float32 vectors alone: " + ", ".join(f"{run['size']:,} → {run['float32_mb']} MB" for run in results["runs"]) + ")")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
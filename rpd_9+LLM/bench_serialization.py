@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Serialization / Compression Benchmark
+=====================================
+
+Measures what a non-streaming /generate reply costs to encode and to send
+over a slow link (Tailscale to a phone), for growing Ollama `context`
+arrays:
+
+  encoders   json.dumps, pydantic's model_dump_json, and orjson on the same
+             GenerateResponse
+  context    context_encoding "list" (JSON ints), "base64" (packed int32)
+             and "none" (omitted)
+  transfer   payload size plain, gzip and (with the brotli package) brotli,
+             plus compression time
+
+Usage:
+    python3 bench_serialization.py
+    python3 bench_serialization.py --context-sizes 0,2048,8192,32768 --output serialization.json
+"""
+
+from typing import Callable, Dict, List
+import argparse
+import gzip
+import json
+import random
+import time
+
+from rag_service import GenerateResponse, encode_context
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def make_response(context_size: int, encoding: str, seed: int) -> GenerateResponse:
+    """A typical lesson reply: ~2 KB of text, 5 sources, timings and a context of `context_size` tokens"""
+    rng = random.Random(seed)
+    words = ["refrigerant", "pressure", "superheat", "subcooling", "valve", "charge", "the", "and", "check", "system"]
+    context = [rng.randint(0, 128000) for _ in range(context_size)]
+    return GenerateResponse(
+        response=" ".join(rng.choice(words) for _ in range(330)),
+        model="gpt-oss:20b",
+        done=True,
+        context=encode_context(context, encoding) if context_size else None,
+        sources=[
+            {
+                "id": f"hvac_{rng.getrandbits(96):024x}",
+                "content": " ".join(rng.choice(words) for _ in range(30)) + "...",
+                "metadata": {"source": f"manual_{i}.pdf", "module": str(i), "content_hash": f"{rng.getrandbits(256):064x}"},
+                "track": "hvac"
+            }
+            for i in range(5)
+        ],
+        context_usage={"budget": 1200, "tokens_used": 830, "chunks_retrieved": 5, "chunks_used": 5, "duplicates_dropped": 0, "chunks_trimmed": 0},
+        timings={"embed_ms": 6.1, "vector_query_ms": 4.2, "context_build_ms": 0.4, "queue_wait_ms": 0.1, "total_ms": 4210.5}
+    )
+
+
+def time_call(func: Callable[[], bytes], repeat: int) -> float:
+    """Median milliseconds per call"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000
+
+
+def encoders(response: GenerateResponse) -> Dict[str, Callable[[], bytes]]:
+    funcs = {
+        "json": lambda: json.dumps(response.model_dump()).encode("utf-8"),
+        "pydantic": lambda: response.model_dump_json().encode("utf-8"),
+    }
+    if orjson is not None:
+        funcs["orjson"] = lambda: orjson.dumps(response.model_dump())
+    return funcs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /generate payload encoding and compression")
+    parser.add_argument("--context-sizes", default="0,2048,8192,32768", help="Comma-separated context lengths (tokens)")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    rows: List[dict] = []
+    for size in (int(s) for s in args.context_sizes.split(",")):
+        for context_encoding in (("list", "base64", "none") if size else ("none",)):
+            response = make_response(size, context_encoding, args.seed)
+            row = {"context_tokens": size, "context_encoding": context_encoding, "encode_ms": {}, "bytes": {}, "compress_ms": {}}
+            for name, func in encoders(response).items():
+                row["encode_ms"][name] = round(time_call(func, args.repeat), 3)
+            body = response.model_dump_json().encode("utf-8")
+            row["bytes"]["plain"] = len(body)
+            row["bytes"]["gzip"] = len(gzip.compress(body, compresslevel=5))
+            row["compress_ms"]["gzip"] = round(time_call(lambda: gzip.compress(body, compresslevel=5), args.repeat), 3)
+            if brotli is not None:
+                row["bytes"]["br"] = len(brotli.compress(body, quality=4))
+                row["compress_ms"]["br"] = round(time_call(lambda: brotli.compress(body, quality=4), args.repeat), 3)
+            rows.append(row)
+            print(f"🧪 context {size:>6} as {context_encoding:<6}: {row['bytes']['plain']:>8,} bytes plain, "
+                  f"{row['bytes']['gzip']:>8,} gzip")
+
+    names = list(rows[0]["encode_ms"])
+    print()
+    print(f"{'context':>8} {'encoding':<8} │ " + " ".join(f"{name + ' ms':>12}" for name in names)
+          + f" │ {'plain B':>9} {'gzip B':>9}" + (f" {'br B':>9}" if brotli else "") + f" {'gzip ms':>8}")
+    for row in rows:
+        print(f"{row['context_tokens']:>8} {row['context_encoding']:<8} │ "
+              + " ".join(f"{row['encode_ms'][name]:>12.3f}" for name in names)
+              + f" │ {row['bytes']['plain']:>9,} {row['bytes']['gzip']:>9,}"
+              + (f" {row['bytes']['br']:>9,}" if brotli else "")
+              + f" {row['compress_ms']['gzip']:>8.2f}")
+    if orjson is None:
+        print("\nℹ️  orjson not installed: pip install orjson to compare it")
+    if brotli is None:
+        print("ℹ️  brotli not installed: pip install brotli to compare it")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "results": rows}, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
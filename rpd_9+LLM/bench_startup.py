@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Startup Time Benchmark
+======================
+
+Measures how quickly the RAG service becomes usable after a (re)start:
+
+  import  - `import rag_service` in a fresh interpreter (no DB or model work)
+  bind    - process start until GET /health answers (routes return 503 until ready)
+  ready   - process start until /health reports "healthy" (Chroma opened,
+            embedding model loaded, keyword indexes built)
+
+The service's own breakdown of the ready phase (startup.timings from /health)
+is included. Exits with status 1 if the median bind or ready time is above
+its target, so it can guard against heavy imports creeping back in.
+
+Usage:
+    python3 bench_startup.py
+    python3 bench_startup.py --runs 5 --max-bind-seconds 3 --max-ready-seconds 60 --output startup.json
+"""
+
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def measure_import(module: str, app_dir: str) -> float:
+    """Seconds to import the service module in a fresh interpreter"""
+    code = (
+        "import sys, time; sys.path.insert(0, sys.argv[1]); "
+        "t = time.perf_counter(); __import__(sys.argv[2]); print(time.perf_counter() - t)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code, app_dir, module],
+        capture_output=True, text=True, cwd=app_dir
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "import failed")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def poll_health(url: str) -> Optional[dict]:
+    try:
+        return httpx.get(url, timeout=2).json()
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+def measure_startup(args) -> Dict[str, object]:
+    """Start uvicorn once and time bind and ready"""
+    command = [
+        sys.executable, "-m", "uvicorn", args.app, "--factory",
+        "--host", "127.0.0.1", "--port", str(args.port),
+        "--app-dir", args.app_dir, "--log-level", "warning"
+    ]
+    url = f"http://127.0.0.1:{args.port}/health"
+    run: Dict[str, object] = {}
+    started = time.perf_counter()
+    service = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + args.timeout
+        while time.perf_counter() < deadline:
+            health = poll_health(url)
+            if health is not None:
+                run.setdefault("bind_s", round(time.perf_counter() - started, 3))
+                if health.get("status") == "healthy":
+                    run["ready_s"] = round(time.perf_counter() - started, 3)
+                    run["timings"] = (health.get("startup") or {}).get("timings")
+                    break
+                if health.get("status") == "failed":
+                    run["error"] = (health.get("startup") or {}).get("error")
+                    break
+            if service.poll() is not None:
+                run["error"] = f"service exited with status {service.returncode}"
+                break
+            time.sleep(args.poll_interval)
+        else:
+            run["error"] = f"not ready after {args.timeout:g}s"
+    finally:
+        service.terminate()
+        service.wait(timeout=30)
+    return run
+
+
+def median_of(runs: List[dict], key: str) -> Optional[float]:
+    values = [run[key] for run in runs if key in run]
+    return round(statistics.median(values), 3) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure RAG service import, bind and ready times")
+    parser.add_argument("--runs", type=int, default=3, help="Service starts to measure")
+    parser.add_argument("--port", type=int, default=8110)
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for readiness per run")
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--max-bind-seconds", type=float, default=3.0, help="Target for the median bind time")
+    parser.add_argument("--max-ready-seconds", type=float, default=None, help="Target for the median ready time")
+    parser.add_argument("--app", default="rag_service:create_app", help="App factory to serve")
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    module = args.app.split(":")[0]
+    results: Dict[str, object] = {"app": args.app, "runs": []}
+
+    print(f"📦 Import time of {module} ({args.runs} runs)...")
+    imports = [measure_import(module, args.app_dir) for _ in range(args.runs)]
+    results["import_s"] = round(statistics.median(imports), 3)
+
+    for i in range(args.runs):
+        print(f"🚀 Start {i + 1}/{args.runs}...")
+        run = measure_startup(args)
+        results["runs"].append(run)
+        if "error" in run:
+            print(f"   ❌ {run['error']}")
+        else:
+            print(f"   bind {run['bind_s']:.2f}s, ready {run['ready_s']:.2f}s")
+
+    results["bind_s"] = median_of(results["runs"], "bind_s")
+    results["ready_s"] = median_of(results["runs"], "ready_s")
+
+    print()
+    print(f"{'phase':<8} {'median s':>9} {'target s':>9}")
+    for phase, target in (("import", None), ("bind", args.max_bind_seconds), ("ready", args.max_ready_seconds)):
+        value = results[f"{phase}_s"]
+        print(f"{phase:<8} {value if value is not None else float('nan'):>9.3f} {target if target else '-':>9}")
+
+    timings = [run["timings"] for run in results["runs"] if run.get("timings")]
+    if timings:
+        print("\n⏱️  Ready-phase breakdown (median ms):")
+        for stage in timings[0]:
+            print(f"   {stage:<22} {statistics.median(t[stage] for t in timings if stage in t):>9.1f}")
+
+    failures = []
+    if results["bind_s"] is None or results["bind_s"] > args.max_bind_seconds:
+        failures.append(f"bind {results['bind_s']}s > {args.max_bind_seconds:g}s")
+    if args.max_ready_seconds is not None and (results["ready_s"] is None or results["ready_s"] > args.max_ready_seconds):
+        failures.append(f"ready {results['ready_s']}s > {args.max_ready_seconds:g}s")
+    results["passed"] = not failures
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    if failures:
+        print(f"\n❌ Startup targets missed: {', '.join(failures)}")
+        sys.exit(1)
+    print("\n✅ Startup targets met")
+
+
+if __name__ == "__main__":
+    main()
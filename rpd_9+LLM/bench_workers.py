@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Multi-Worker Load Test
+======================
+
+Starts the RAG service with 1, 2, 4, ... worker processes (all sharing one
+Chroma server) and measures throughput and latency under concurrent load,
+to show how the service scales with CPU cores.
+
+The default workload is POST /embed with unique texts, i.e. the CPU-bound
+part of every /generate call (ONNX embedding), so results are not limited
+by Ollama. Use --endpoint generate to drive full RAG requests instead.
+
+Start a Chroma server first (or pass --start-chroma):
+    chroma run --path chroma_db --port 8001
+
+Usage:
+    python3 bench_workers.py
+    python3 bench_workers.py --workers 1,2,4,8 --concurrency 64 --duration 30 --output workers.json
+"""
+
+from typing import Dict, List
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def wait_until_up(url: str, timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def wait_until_initialized(url: str, timeout: float, consecutive: int = 1) -> bool:
+    """
+    Wait for /health to report "healthy", i.e. ChromaDB and the embedding model are loaded
+
+    Each worker loads them on its own and the port accepts connections as
+    soon as the first worker is up, so with several workers the check must
+    pass `consecutive` times in a row before load starts.
+    """
+    deadline = time.time() + timeout
+    streak = 0
+    while time.time() < deadline:
+        try:
+            response = httpx.get(url, timeout=2)
+            healthy = response.status_code == 200 and response.json().get("status") == "healthy"
+        except (httpx.HTTPError, ValueError):
+            healthy = False
+        streak = streak + 1 if healthy else 0
+        if streak >= consecutive:
+            return True
+        time.sleep(0.1 if healthy else 0.5)
+    return False
+
+
+def start_service(args, workers: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "RAG_CHROMA_HOST": args.chroma_host,
+        "RAG_CHROMA_PORT": str(args.chroma_port),
+        "RAG_OLLAMA_PIN_MODELS": env.get("RAG_OLLAMA_PIN_MODELS", "") if args.endpoint == "generate" else "",
+    })
+    command = [
+        sys.executable, "-m", "uvicorn", args.app, "--factory",
+        "--host", "127.0.0.1", "--port", str(args.port),
+        "--workers", str(workers), "--log-level", "warning"
+    ]
+    if args.app_dir:
+        command += ["--app-dir", args.app_dir]
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def make_body(args, i: int) -> Dict[str, object]:
+    if args.endpoint == "generate":
+        return {"prompt": f"Explain step {i} of refrigerant recovery", "track": args.track, "model": args.model, "cache": False}
+    return {"texts": [f"load test sentence {i} about compressors and airflow"], "use_cache": False}
+
+
+async def run_load(args) -> Dict[str, float]:
+    """Keep `concurrency` requests in flight for `duration` seconds"""
+    url = f"http://127.0.0.1:{args.port}/{args.endpoint}"
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(10 ** 9))
+    deadline = time.perf_counter() + args.duration
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=httpx.Limits(max_connections=args.concurrency)) as client:
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json=make_body(args, next(counter)))
+                    if response.status_code == 200:
+                        latencies.append(time.perf_counter() - started)
+                    else:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+
+    if not latencies:
+        return {"requests": 0, "errors": errors, "rps": 0.0}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure RAG service throughput vs. number of worker processes")
+    parser.add_argument("--workers", default=None, help="Comma-separated worker counts (default: 1,2,4,... up to the core count)")
+    parser.add_argument("--endpoint", choices=["embed", "generate"], default="embed")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests kept in flight")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load per worker count")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of unmeasured load before each run")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--chroma-host", default="localhost")
+    parser.add_argument("--chroma-port", type=int, default=8001)
+    parser.add_argument("--start-chroma", metavar="PATH", help="Start `chroma run` on this database path for the benchmark")
+    parser.add_argument("--track", default="hvac")
+    parser.add_argument("--model", default="gpt-oss:20b")
+    parser.add_argument("--app", default="rag_service:create_app", help="App factory to serve")
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        worker_counts = [int(n) for n in args.workers.split(",")]
+    else:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= cores:
+            worker_counts.append(worker_counts[-1] * 2)
+
+    chroma = None
+    if args.start_chroma:
+        chroma = subprocess.Popen(
+            ["chroma", "run", "--path", args.start_chroma, "--port", str(args.chroma_port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        if not wait_until_up(f"http://{args.chroma_host}:{args.chroma_port}/api/v2/heartbeat", 30) and \
+                not wait_until_up(f"http://{args.chroma_host}:{args.chroma_port}/api/v1/heartbeat", 5):
+            print("❌ Chroma server did not start")
+            chroma.terminate()
+            sys.exit(1)
+
+    results = {"endpoint": args.endpoint, "cores": cores, "concurrency": args.concurrency, "runs": []}
+    try:
+        for workers in worker_counts:
+            print(f"🚀 {workers} worker(s)...")
+            service = start_service(args, workers)
+            try:
+                if not wait_until_initialized(f"http://127.0.0.1:{args.port}/health", 120, consecutive=workers * 4):
+                    print(f"❌ Service with {workers} worker(s) did not start")
+                    continue
+                if args.warmup > 0:
+                    asyncio.run(run_load(argparse.Namespace(**{**vars(args), "duration": args.warmup})))
+                run = asyncio.run(run_load(args))
+                run["workers"] = workers
+                results["runs"].append(run)
+                print(f"   {run['rps']:.1f} req/s, p50 {run.get('p50_ms', 0):.1f}ms, p95 {run.get('p95_ms', 0):.1f}ms, {run['errors']} errors")
+            finally:
+                service.terminate()
+                service.wait(timeout=30)
+    finally:
+        if chroma is not None:
+            chroma.terminate()
+
+    if results["runs"]:
+        base = results["runs"][0]["rps"] or 1.0
+        print()
+        print(f"{'workers':>7} {'req/s':>9} {'speedup':>8} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+        for run in results["runs"]:
+            run["speedup"] = round(run["rps"] / base, 2)
+            print(f"{run['workers']:>7} {run['rps']:>9.1f} {run['speedup']:>7.2f}x "
+                  f"{run.get('p50_ms', 0):>9.1f} {run.get('p95_ms', 0):>9.1f} {run['errors']:>7}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+BM25 Keyword Index for the RAG Service
+In-memory inverted index used alongside Chroma's vector search
+"""
+
+from collections import Counter, defaultdict
+from typing import Collection, Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+import re
+import threading
+
+# Compound tokens keep codes like "R-410A", "24ACC636A003" or "5.0mg" intact;
+# their alphanumeric parts are indexed as well so partial matches still score.
+COMPOUND_TOKEN = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+WORD_PART = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i if in into is it its of on or
+that the their then there these this to was were what when where which who why will
+with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens plus whole compound codes, minus stopwords"""
+    tokens = []
+    for match in COMPOUND_TOKEN.findall(text.lower()):
+        parts = WORD_PART.findall(match)
+        if len(parts) > 1:
+            tokens.append(match)
+        tokens.extend(p for p in parts if p not in STOPWORDS)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several ranked id lists with reciprocal rank fusion
+
+    Each list contributes 1 / (k + rank) for every id it contains; ids are
+    returned by descending fused score.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    Okapi BM25 over one track's chunks
+
+    Stores each chunk's text and metadata so keyword-only hits can be returned
+    without another Chroma round trip. Safe to update and query from the
+    retrieval thread pool.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._documents: Dict[str, Tuple[str, dict]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, ids: Sequence[str], documents: Sequence[str], metadatas: Optional[Sequence[dict]] = None):
+        """Index chunks, replacing any existing entries with the same ids"""
+        metadatas = metadatas or [{}] * len(ids)
+        with self._lock:
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                self._remove_one(doc_id)
+                document = document or ""
+                counts = Counter(tokenize(document))
+                for term, tf in counts.items():
+                    self._postings[term][doc_id] = tf
+                length = sum(counts.values())
+                self._documents[doc_id] = (document, metadata or {})
+                self._lengths[doc_id] = length
+                self._total_length += length
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove_one(doc_id)
+
+    def _remove_one(self, doc_id: str):
+        if doc_id not in self._documents:
+            return
+        document, _ = self._documents.pop(doc_id)
+        self._total_length -= self._lengths.pop(doc_id)
+        for term in set(tokenize(document)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self._lengths.clear()
+            self._postings.clear()
+            self._total_length = 0
+
+    def get(self, doc_id: str) -> Optional[Tuple[str, dict]]:
+        """Return (document, metadata) for an indexed chunk"""
+        return self._documents.get(doc_id)
+
+    def search(self, query: str, k: int, allowed: Optional[Collection[str]] = None) -> List[Tuple[str, float]]:
+        """Return the top-k (id, score) pairs for a query, optionally only among `allowed` ids"""
+        with self._lock:
+            n = len(self._documents)
+            if n == 0:
+                return []
+            avg_length = self._total_length / n or 1.0
+            scores: Dict[str, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def stats(self) -> Dict[str, int]:
+        return {"documents": len(self._documents), "terms": len(self._postings)}
@@ -0,0 +1,100 @@
+"""
+Text Chunking for the RAG Service
+Splits documents into token-bounded, overlapping chunks for embedding
+"""
+
+from typing import List
+import hashlib
+import re
+
+# all-MiniLM-L6-v2 truncates input at 256 word pieces. Word/punctuation tokens
+# are a close lower bound on word pieces, so the default chunk size leaves
+# headroom for words that split into several pieces.
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_CHUNK_OVERLAP = 40
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count (words and punctuation marks)"""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 of a chunk's text, used for idempotent document ids"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(track: str, text: str) -> str:
+    """Stable Chroma id for a chunk: re-ingesting the same text yields the same id"""
+    return f"{track}_{content_hash(text)[:24]}"
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text on sentence ends and blank lines, dropping empty pieces"""
+    return [s.strip() for s in SENTENCE_BOUNDARY.split(text) if s and s.strip()]
+
+
+def _split_long_sentence(sentence: str, chunk_size: int) -> List[str]:
+    """Break a sentence that alone exceeds the chunk size at word boundaries"""
+    pieces, current, current_tokens = [], [], 0
+    for word in sentence.split():
+        tokens = count_tokens(word)
+        if current and current_tokens + tokens > chunk_size:
+            pieces.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(word)
+        current_tokens += tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def chunk_text(
+    text: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
+) -> List[str]:
+    """
+    Pack sentences into chunks of at most `chunk_size` tokens
+
+    Consecutive chunks share up to `chunk_overlap` tokens of trailing
+    sentences, so a fact that straddles a boundary is retrievable from either
+    side. Text that already fits in one chunk is returned unchanged.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    if chunk_size <= 0 or count_tokens(text) <= chunk_size:
+        return [text]
+
+    units = []
+    for sentence in split_sentences(text):
+        tokens = count_tokens(sentence)
+        if tokens > chunk_size:
+            units.extend((piece, count_tokens(piece)) for piece in _split_long_sentence(sentence, chunk_size))
+        else:
+            units.append((sentence, tokens))
+
+    chunks = []
+    window: List[tuple] = []
+    window_tokens = 0
+    for sentence, tokens in units:
+        if window and window_tokens + tokens > chunk_size:
+            chunks.append(" ".join(s for s, _ in window))
+            # Carry trailing sentences into the next chunk as overlap
+            carried, carried_tokens = [], 0
+            for prev, prev_tokens in reversed(window):
+                if carried_tokens + prev_tokens > chunk_overlap or carried_tokens + prev_tokens + tokens > chunk_size:
+                    break
+                carried.insert(0, (prev, prev_tokens))
+                carried_tokens += prev_tokens
+            window, window_tokens = carried, carried_tokens
+        window.append((sentence, tokens))
+        window_tokens += tokens
+
+    if window:
+        chunks.append(" ".join(s for s, _ in window))
+    return chunks
@@ -0,0 +1,104 @@
+"""
+Response Compression for the RAG Service
+ASGI middleware that gzip/brotli-compresses large, complete responses and leaves streams alone
+"""
+
+from typing import Iterable, Optional
+import gzip
+
+from content_store import choose_encoding
+
+try:
+    import brotli
+except ImportError:  # Optional: without it, responses are gzip-compressed
+    brotli = None
+
+# Token streams must reach the client as each chunk is produced; compressing
+# them would either buffer tokens or add framing overhead to every chunk
+STREAM_TYPES = ("text/event-stream", "application/x-ndjson")
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/x-ndjson", "application/xml")
+
+
+class CompressionMiddleware:
+    """
+    Compress responses of at least `minimum_size` bytes
+
+    Only responses whose body arrives in a single message are compressed,
+    so StreamingResponse output (NDJSON/SSE generation streams) passes
+    through untouched, as do responses that already carry a
+    Content-Encoding (precompressed /content artifacts), 304s and
+    non-text content types. Brotli is preferred when the client accepts it
+    and the `brotli` package is installed.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 5, brotli_quality: int = 4,
+                 skip_types: Iterable[str] = STREAM_TYPES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.skip_types = tuple(skip_types)
+        self.available = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.minimum_size <= 0:
+            await self.app(scope, receive, send)
+            return
+        accept = dict(scope.get("headers") or []).get(b"accept-encoding", b"").decode("latin-1")
+        encoding = choose_encoding(accept, self.available)
+        if encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[dict] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = {key.lower(): value for key, value in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = (
+                    b"content-encoding" in headers
+                    or message["status"] in (204, 304)
+                    or content_type.startswith(self.skip_types)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if start is not None:
+                if message.get("more_body") or len(body) < self.minimum_size:
+                    # Streamed body (or too small to be worth it): send as is
+                    await send(start)
+                    start = None
+                    passthrough = True
+                    await send(message)
+                    return
+                compressed = self.compress(body, encoding)
+                vary = [value for key, value in start.get("headers", []) if key.lower() == b"vary"]
+                headers = [
+                    (key, value) for key, value in start.get("headers", [])
+                    if key.lower() not in (b"content-length", b"vary")
+                ]
+                headers += [
+                    (b"content-encoding", encoding.encode("latin-1")),
+                    (b"content-length", str(len(compressed)).encode("latin-1")),
+                    (b"vary", b", ".join(vary + [b"Accept-Encoding"]))
+                ]
+                await send({**start, "headers": headers})
+                start = None
+                await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
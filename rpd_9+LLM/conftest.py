@@ -0,0 +1,7 @@
+"""
+pytest configuration for the RAG service tests
+Run from this directory: python3 -m pytest
+"""
+
+# test_rag_integration.py is the Swift client's source, not a Python test module
+collect_ignore = ["test_rag_integration.py"]
@@ -0,0 +1,210 @@
+"""
+Content Store for the RAG Service
+Content-addressed storage of generated artifacts (lessons, quizzes) for conditional GET
+"""
+
+from typing import Dict, List, Optional
+import gzip
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:  # Optional: without it, artifacts are served gzip-compressed or plain
+    brotli = None
+
+TOPIC_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.:-]{0,127}$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    track TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    model TEXT NOT NULL,
+    corpus_version TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (track, topic, model, corpus_version)
+);
+CREATE INDEX IF NOT EXISTS artifacts_latest ON artifacts (track, topic, model, created);
+"""
+
+
+def parse_etags(header: Optional[str]) -> List[str]:
+    """Digests named in an If-None-Match header ("*" included), ignoring W/ and encoding suffixes"""
+    if not header:
+        return []
+    digests = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        digests.append(tag.split("-", 1)[0])
+    return digests
+
+
+def choose_encoding(accept_encoding: Optional[str], available: List[str]) -> str:
+    """The best of `available` ("br", "gzip") that the client accepts, else identity"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+class ContentStore:
+    """
+    Generated artifacts addressed by the SHA-256 of their bytes
+
+    Each artifact is filed under (track, topic, model, corpus_version), where
+    the corpus version identifies the track's knowledge base when it was
+    generated, so a lesson is regenerated only after the track changes. The
+    bytes live once per digest under `directory/blobs`, next to gzip (and,
+    with the `brotli` package, brotli) copies made at write time, so serving
+    never compresses. The digest doubles as the HTTP ETag. The index is a
+    SQLite file, so several workers can share the directory.
+    """
+
+    def __init__(self, directory: str, compress_min_bytes: int = 256):
+        self.directory = directory
+        self.compress_min_bytes = compress_min_bytes
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(directory, "content.sqlite3"), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        self.reads = {"identity": 0, "gzip": 0, "br": 0}
+
+    def _blob_path(self, digest: str, encoding: str = "identity") -> str:
+        suffix = {"identity": "", "gzip": ".gz", "br": ".br"}[encoding]
+        return os.path.join(self.directory, "blobs", digest[:2], digest + suffix)
+
+    def _write(self, path: str, data: bytes):
+        """Write atomically, so a concurrent reader never sees a partial blob"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+
+    def put(self, track: str, topic: str, model: str, corpus_version: str, body: bytes,
+            content_type: str = "application/json") -> dict:
+        """Store an artifact (replacing any for the same key and version) and return its index entry"""
+        digest = hashlib.sha256(body).hexdigest()
+        if not os.path.exists(self._blob_path(digest)):
+            if len(body) >= self.compress_min_bytes:
+                self._write(self._blob_path(digest, "gzip"), gzip.compress(body, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    self._write(self._blob_path(digest, "br"), brotli.compress(body, quality=11))
+            self._write(self._blob_path(digest), body)  # Last: its presence means the variants exist too
+        entry = {
+            "track": track, "topic": topic, "model": model, "corpus_version": corpus_version,
+            "digest": digest, "content_type": content_type, "size": len(body), "created": time.time()
+        }
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO artifacts (track, topic, model, corpus_version, digest, content_type, size, created) "
+                "VALUES (:track, :topic, :model, :corpus_version, :digest, :content_type, :size, :created)",
+                entry
+            )
+        return entry
+
+    def lookup(self, track: str, topic: str, model: str, corpus_version: Optional[str] = None) -> Optional[dict]:
+        """The artifact for a corpus version, or the most recent one for any version when it is None"""
+        with self._lock:
+            if corpus_version is not None:
+                row = self._conn.execute(
+                    "SELECT * FROM artifacts WHERE track = ? AND topic = ? AND model = ? AND corpus_version = ?",
+                    (track, topic, model, corpus_version)
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT * FROM artifacts WHERE track = ? AND topic = ? AND model = ? ORDER BY created DESC LIMIT 1",
+                    (track, topic, model)
+                ).fetchone()
+        return dict(row) if row else None
+
+    def encodings(self, digest: str) -> List[str]:
+        """Precompressed variants stored for a digest"""
+        return [encoding for encoding in ("br", "gzip") if os.path.exists(self._blob_path(digest, encoding))]
+
+    def read(self, digest: str, encoding: str = "identity") -> bytes:
+        with open(self._blob_path(digest, encoding), "rb") as f:
+            data = f.read()
+        self.reads[encoding] += 1
+        return data
+
+    def topics(self, track: str) -> List[dict]:
+        """The latest artifact per (topic, model) of a track"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT topic, model, corpus_version, digest, size, MAX(created) AS created FROM artifacts "
+                "WHERE track = ? GROUP BY topic, model ORDER BY topic, model",
+                (track,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def prune(self, keep_versions: int = 2) -> int:
+        """
+        Drop all but the newest `keep_versions` corpus versions of each artifact
+
+        Blobs no longer referenced by any artifact are deleted. Returns the
+        number of index entries removed.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    "DELETE FROM artifacts WHERE rowid IN ("
+                    " SELECT rowid FROM (SELECT rowid, ROW_NUMBER() OVER ("
+                    "  PARTITION BY track, topic, model ORDER BY created DESC) AS n FROM artifacts)"
+                    " WHERE n > ?)",
+                    (keep_versions,)
+                )
+                removed = cursor.rowcount
+                live = {row[0] for row in self._conn.execute("SELECT DISTINCT digest FROM artifacts")}
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        blobs = os.path.join(self.directory, "blobs")
+        for shard in os.listdir(blobs):
+            for name in os.listdir(os.path.join(blobs, shard)):
+                if name.split(".", 1)[0] not in live:
+                    try:
+                        os.remove(os.path.join(blobs, shard, name))
+                    except OSError:
+                        pass
+        return removed
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT digest), COALESCE(SUM(size), 0) FROM artifacts").fetchone()
+        return {
+            "directory": self.directory,
+            "artifacts": row[0],
+            "blobs": row[1],
+            "bytes": row[2],
+            "brotli": brotli is not None,
+            "reads": dict(self.reads)
+        }
@@ -0,0 +1,112 @@
+"""
+Context Builder for the RAG Service
+Packs retrieved chunks into a fixed token budget for the augmented prompt
+"""
+
+from typing import Dict, List, Set
+import re
+
+from bm25_index import tokenize
+from chunking import count_tokens, split_sentences
+
+DEFAULT_CONTEXT_BUDGET = 1200
+DEFAULT_DEDUP_THRESHOLD = 0.8
+MIN_USEFUL_TOKENS = 24  # Stop packing once less than this much budget is left
+
+
+def shingles(text: str, size: int = 3) -> Set[tuple]:
+    """Word n-grams (ignoring case and punctuation) used to detect near-identical chunks"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: Set[tuple], b: Set[tuple]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def trim_to_budget(text: str, query_terms: Set[str], budget: int) -> str:
+    """
+    Keep the sentences that share the most terms with the query, within budget
+
+    Sentences are chosen by descending overlap with the query (earlier
+    sentences win ties) and emitted in their original order. Sentences with
+    no query terms are only used when no sentence matches at all.
+    """
+    sentences = split_sentences(text)
+    scored = []
+    for position, sentence in enumerate(sentences):
+        overlap = len(query_terms & set(tokenize(sentence)))
+        scored.append((overlap, -position, sentence, count_tokens(sentence)))
+    scored.sort(reverse=True)
+    if scored and scored[0][0] > 0:
+        scored = [item for item in scored if item[0] > 0]
+
+    chosen, used = [], 0
+    for overlap, neg_position, sentence, tokens in scored:
+        if used + tokens > budget:
+            continue
+        chosen.append((-neg_position, sentence))
+        used += tokens
+    chosen.sort()
+    return " ".join(sentence for _, sentence in chosen)
+
+
+def build_context(
+    hits: List[dict],
+    query: str,
+    budget: int = DEFAULT_CONTEXT_BUDGET,
+    dedup_threshold: float = DEFAULT_DEDUP_THRESHOLD
+):
+    """
+    Select and trim retrieved chunks so the references fit in `budget` tokens
+
+    Hits are expected in relevance order (vector/hybrid rank, or rerank score).
+    Near-duplicates of an already selected chunk are skipped, whole chunks are
+    packed greedily while they fit, and the first chunk that does not fit is
+    trimmed to its most query-relevant sentences.
+
+    Returns (selected_hits, documents, usage) where documents are the (possibly
+    trimmed) texts to place in the prompt and usage reports the token count.
+    """
+    query_terms = set(tokenize(query))
+    selected, documents = [], []
+    seen_shingles: List[Set[tuple]] = []
+    used = duplicates = trimmed = 0
+
+    for hit in hits:
+        remaining = budget - used
+        if remaining < MIN_USEFUL_TOKENS:
+            break
+
+        text = hit["document"]
+        fingerprint = shingles(text)
+        if any(jaccard(fingerprint, other) >= dedup_threshold for other in seen_shingles):
+            duplicates += 1
+            continue
+
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            text = trim_to_budget(text, query_terms, remaining)
+            tokens = count_tokens(text)
+            if not text:
+                continue
+            trimmed += 1
+
+        selected.append(hit)
+        documents.append(text)
+        seen_shingles.append(fingerprint)
+        used += tokens
+
+    usage: Dict[str, int] = {
+        "budget": budget,
+        "tokens_used": used,
+        "chunks_retrieved": len(hits),
+        "chunks_used": len(selected),
+        "duplicates_dropped": duplicates,
+        "chunks_trimmed": trimmed
+    }
+    return selected, documents, usage
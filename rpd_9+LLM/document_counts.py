@@ -0,0 +1,68 @@
+"""
+Document Counts for the RAG Service
+In-process per-track chunk counts, so probes and queries don't hit SQLite
+"""
+
+from typing import Callable, Dict, Optional
+import threading
+import time
+
+
+class DocumentCounts:
+    """
+    Cached `collection.count()` per track
+
+    Writers update the count right after changing a collection; `reconcile`
+    re-reads the real counts from Chroma to correct any drift (writes made by
+    another process, failed partial batches).
+    """
+
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.last_reconciled: Optional[float] = None
+        self.reconciles = 0
+        self.drift_corrections = 0
+
+    def get(self, track: str) -> int:
+        return self._counts.get(track, 0)
+
+    def set(self, track: str, count: int):
+        with self._lock:
+            self._counts[track] = max(0, int(count))
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def reconcile(self, counters: Dict[str, Callable[[], int]]) -> Dict[str, int]:
+        """
+        Refresh counts from the source of truth; returns {track: drift} for corrected tracks
+
+        `counters` maps each track to a callable returning its real count
+        (normally `collection.count`). Tracks whose count fails are left as is.
+        """
+        drift = {}
+        for track, count in counters.items():
+            try:
+                actual = int(count())
+            except Exception as e:
+                print(f"❌ Error counting {track}: {e}")
+                continue
+            with self._lock:
+                previous = self._counts.get(track)
+                self._counts[track] = actual
+            if previous is not None and previous != actual:
+                drift[track] = actual - previous
+        with self._lock:
+            self.last_reconciled = time.time()
+            self.reconciles += 1
+            self.drift_corrections += len(drift)
+        return drift
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "last_reconciled": self.last_reconciled,
+            "reconciles": self.reconciles,
+            "drift_corrections": self.drift_corrections
+        }
@@ -0,0 +1,178 @@
+"""
+Embedding Service for the RAG Service
+Memoizes query embeddings and coalesces concurrent embedding calls into batches
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import threading
+
+
+def text_key(text: str) -> str:
+    """Cache key for a text: SHA-256 of its UTF-8 bytes"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingService:
+    """
+    Shared front end for the ONNX embedding function
+
+    - A bounded LRU cache (keyed by text hash) returns repeated texts instantly.
+    - Cache misses that arrive within `batch_window_ms` of each other are
+      coalesced into a single call to the embedding function, which is much
+      cheaper per text than embedding them one at a time.
+    - Identical texts that are already being embedded share the pending result.
+    """
+
+    def __init__(
+        self,
+        embedding_function,
+        executor: Executor,
+        name: str = "ONNXMiniLM_L6_V2",
+        cache_size: int = 4096,
+        batch_window_ms: float = 5.0,
+        max_batch_size: int = 64
+    ):
+        self.embedding_function = embedding_function
+        self.executor = executor
+        self.name = name
+        self.cache_size = cache_size
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batches = 0
+        self.batched_texts = 0
+
+    # Cache
+    def _cache_get(self, key: str) -> Optional[List[float]]:
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            return vector
+
+    def _cache_put(self, key: str, vector: List[float]):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _compute(self, texts: List[str]) -> List[List[float]]:
+        """Run the embedding function and convert the result to plain float lists"""
+        return [[float(x) for x in vector] for vector in self.embedding_function(texts)]
+
+    # Async API (used from request handlers)
+    async def embed(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
+        """Embed texts, serving repeats from the cache and batching the rest"""
+        loop = asyncio.get_running_loop()
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        waiting: List[Tuple[int, str, asyncio.Future]] = []
+
+        for i, text in enumerate(texts):
+            key = text_key(text)
+            if use_cache:
+                vector = self._cache_get(key)
+                if vector is not None:
+                    self.cache_hits += 1
+                    results[i] = vector
+                    continue
+            self.cache_misses += 1
+
+            future = self._inflight.get(key)
+            if future is None:
+                future = loop.create_future()
+                self._inflight[key] = future
+                self._pending.append((key, text, future))
+                if len(self._pending) >= self.max_batch_size:
+                    self._flush()
+                elif self._flush_handle is None:
+                    self._flush_handle = loop.call_later(self.batch_window, self._flush)
+            waiting.append((i, key, future))
+
+        for i, key, future in waiting:
+            results[i] = await future
+
+        return results
+
+    def _flush(self):
+        """Send everything queued so far to the embedding function as one batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        asyncio.get_running_loop().create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[Tuple[str, str, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        try:
+            vectors = await loop.run_in_executor(self.executor, self._compute, [text for _, text, _ in batch])
+        except Exception as e:
+            for key, _, future in batch:
+                self._inflight.pop(key, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.batched_texts += len(batch)
+        for (key, _, future), vector in zip(batch, vectors):
+            self._cache_put(key, vector)
+            self._inflight.pop(key, None)
+            if not future.done():
+                future.set_result(vector)
+
+    # Sync API (used from worker threads, e.g. bulk ingestion)
+    def embed_sync(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
+        """Embed texts from a worker thread, still honoring the LRU cache"""
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: List[int] = []
+        for i, text in enumerate(texts):
+            vector = self._cache_get(text_key(text)) if use_cache else None
+            if vector is not None:
+                self.cache_hits += 1
+                results[i] = vector
+            else:
+                self.cache_misses += 1
+                missing.append(i)
+
+        if missing:
+            vectors = self._compute([texts[i] for i in missing])
+            self.batches += 1
+            self.batched_texts += len(missing)
+            for i, vector in zip(missing, vectors):
+                results[i] = vector
+                if use_cache:
+                    self._cache_put(text_key(texts[i]), vector)
+
+        return results
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "model": self.name,
+            "cache_entries": len(self._cache),
+            "cache_size": self.cache_size,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "hit_rate": round(self.cache_hits / lookups, 4) if lookups else 0.0,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_texts / self.batches, 2) if self.batches else 0.0,
+            "batch_window_ms": self.batch_window * 1000.0,
+            "max_batch_size": self.max_batch_size
+        }
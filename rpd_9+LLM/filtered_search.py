@@ -0,0 +1,269 @@
+"""
+Filtered Search for the RAG Service
+Chroma-style metadata filters, a secondary metadata index and exact search over small subsets
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+import hashlib
+import threading
+
+import numpy as np
+
+COMPARISONS = {
+    "$eq": lambda value, target: value == target,
+    "$ne": lambda value, target: value != target,
+    "$gt": lambda value, target: value > target,
+    "$gte": lambda value, target: value >= target,
+    "$lt": lambda value, target: value < target,
+    "$lte": lambda value, target: value <= target,
+    "$in": lambda value, target: value in target,
+    "$nin": lambda value, target: value not in target,
+}
+LOGICAL = ("$and", "$or")
+DOCUMENT_OPERATORS = ("$contains", "$not_contains")
+
+
+def validate_where(where: dict):
+    """Raise ValueError unless `where` is a Chroma metadata filter this module can evaluate"""
+    if not isinstance(where, dict) or not where:
+        raise ValueError("where must be a non-empty object")
+    for key, condition in where.items():
+        if key in LOGICAL:
+            if not isinstance(condition, list) or not condition:
+                raise ValueError(f"{key} expects a non-empty list of filters")
+            for clause in condition:
+                validate_where(clause)
+        elif key.startswith("$"):
+            raise ValueError(f"Unknown filter operator {key}")
+        elif isinstance(condition, dict):
+            if len(condition) != 1 or next(iter(condition)) not in COMPARISONS:
+                raise ValueError(f"Filter on {key!r} needs exactly one of {sorted(COMPARISONS)}")
+            operator, target = next(iter(condition.items()))
+            if operator in ("$in", "$nin") and not isinstance(target, list):
+                raise ValueError(f"{operator} on {key!r} expects a list")
+        elif not isinstance(condition, (str, int, float, bool)):
+            raise ValueError(f"Filter value for {key!r} must be a string, number or boolean")
+
+
+def validate_where_document(where_document: dict):
+    """Raise ValueError unless `where_document` is a Chroma document filter"""
+    if not isinstance(where_document, dict) or len(where_document) != 1:
+        raise ValueError("where_document must have exactly one operator")
+    operator, operand = next(iter(where_document.items()))
+    if operator in LOGICAL:
+        if not isinstance(operand, list) or not operand:
+            raise ValueError(f"{operator} expects a non-empty list of filters")
+        for clause in operand:
+            validate_where_document(clause)
+    elif operator in DOCUMENT_OPERATORS:
+        if not isinstance(operand, str):
+            raise ValueError(f"{operator} expects a string")
+    else:
+        raise ValueError(f"Unknown document filter operator {operator}")
+
+
+def normalize_where(where: dict) -> dict:
+    """Several conditions in one object mean AND; spell that out, as newer Chroma versions require"""
+    if len(where) <= 1:
+        return where
+    return {"$and": [{key: condition} for key, condition in where.items()]}
+
+
+def matches(metadata: Optional[dict], where: dict) -> bool:
+    """
+    Evaluate a Chroma `where` filter against one chunk's metadata
+
+    Like Chroma, a condition on a key the chunk doesn't have is false
+    (including $ne and $nin), and comparing mismatched types is false.
+    """
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, clause) for clause in condition):
+                return False
+        else:
+            if key not in metadata:
+                return False
+            operator, target = next(iter(condition.items())) if isinstance(condition, dict) else ("$eq", condition)
+            try:
+                if not COMPARISONS[operator](metadata[key], target):
+                    return False
+            except TypeError:
+                return False
+    return True
+
+
+def matches_document(document: Optional[str], where_document: dict) -> bool:
+    """Evaluate a Chroma `where_document` filter against one chunk's text"""
+    document = document or ""
+    operator, operand = next(iter(where_document.items()))
+    if operator == "$and":
+        return all(matches_document(document, clause) for clause in operand)
+    if operator == "$or":
+        return any(matches_document(document, clause) for clause in operand)
+    if operator == "$contains":
+        return operand in document
+    return operand not in document
+
+
+class MetadataIndex:
+    """
+    Secondary index over one track's chunk metadata
+
+    Stores every chunk's metadata, plus a set of chunk ids per value for the
+    keys in `keys` (source, module, difficulty, ...). `select` resolves
+    equality and $in conditions on those keys from the posting sets and only
+    checks the remaining conditions against the candidates' metadata, so a
+    selective filter costs about as much as the number of chunks it matches.
+    Filters on other keys fall back to a scan of the stored metadata.
+    """
+
+    def __init__(self, keys: Iterable[str] = ()):
+        self.keys = set(keys)
+        self._metadata: Dict[str, dict] = {}
+        self._postings: Dict[str, Dict[object, Set[str]]] = defaultdict(lambda: defaultdict(set))
+        self._lock = threading.RLock()
+        self._fingerprint: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._metadata)
+
+    def add(self, ids: Sequence[str], metadatas: Optional[Sequence[dict]] = None):
+        """Index chunks, replacing any existing entries with the same ids"""
+        metadatas = metadatas or [{}] * len(ids)
+        with self._lock:
+            self._fingerprint = None
+            for doc_id, metadata in zip(ids, metadatas):
+                self._remove_one(doc_id)
+                metadata = metadata or {}
+                self._metadata[doc_id] = metadata
+                for key in self.keys.intersection(metadata):
+                    self._postings[key][metadata[key]].add(doc_id)
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            self._fingerprint = None
+            for doc_id in ids:
+                self._remove_one(doc_id)
+
+    def _remove_one(self, doc_id: str):
+        metadata = self._metadata.pop(doc_id, None)
+        if metadata is None:
+            return
+        for key in self.keys.intersection(metadata):
+            postings = self._postings[key]
+            postings[metadata[key]].discard(doc_id)
+            if not postings[metadata[key]]:
+                del postings[metadata[key]]
+
+    def clear(self):
+        with self._lock:
+            self._fingerprint = None
+            self._metadata.clear()
+            self._postings.clear()
+
+    def _candidates(self, where: dict) -> Optional[Set[str]]:
+        """A superset of the matching ids from the posting sets, or None if the filter doesn't use them"""
+        narrowed = []
+        for key, condition in where.items():
+            if key == "$and":
+                sets = [s for s in (self._candidates(clause) for clause in condition) if s is not None]
+                if sets:
+                    narrowed.append(set.intersection(*sets))
+            elif key == "$or":
+                sets = [self._candidates(clause) for clause in condition]
+                if all(s is not None for s in sets):
+                    narrowed.append(set().union(*sets))
+            elif key in self.keys:
+                operator, target = next(iter(condition.items())) if isinstance(condition, dict) else ("$eq", condition)
+                postings = self._postings.get(key, {})
+                if operator == "$eq":
+                    narrowed.append(set(postings.get(target, ())))
+                elif operator == "$in":
+                    narrowed.append(set().union(*(postings.get(value, ()) for value in target)))
+        if not narrowed:
+            return None
+        return set.intersection(*narrowed)
+
+    def select(self, where: dict) -> Set[str]:
+        """Ids of the chunks whose metadata matches `where`"""
+        with self._lock:
+            candidates = self._candidates(where)
+            pool = self._metadata.keys() if candidates is None else candidates
+            return {doc_id for doc_id in pool if matches(self._metadata.get(doc_id), where)}
+
+    def all_ids(self) -> Set[str]:
+        with self._lock:
+            return set(self._metadata)
+
+    def fingerprint(self) -> str:
+        """
+        Digest of the set of indexed chunk ids, cached until the index changes
+
+        Chunk ids are derived from the chunk text, so this identifies the
+        track's content: any added, changed or removed chunk changes it.
+        """
+        with self._lock:
+            if self._fingerprint is None:
+                digest = hashlib.sha256()
+                for doc_id in sorted(self._metadata):
+                    digest.update(doc_id.encode("utf-8") + b"\n")
+                self._fingerprint = digest.hexdigest()[:16]
+            return self._fingerprint
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "documents": len(self._metadata),
+                "indexed_keys": {key: len(self._postings.get(key, {})) for key in sorted(self.keys)}
+            }
+
+
+def exact_distances(vectors: np.ndarray, query: np.ndarray, space: str = "l2") -> np.ndarray:
+    """Distances from `query` to each row of `vectors`, as Chroma reports them for the HNSW space"""
+    if space == "l2":
+        diff = vectors - query
+        return np.einsum("ij,ij->i", diff, diff)
+    if space == "ip":
+        return 1.0 - vectors @ query
+    norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1.0)
+    return 1.0 - (vectors @ query) / np.where(norms == 0, 1.0, norms)
+
+
+def exact_search(collection, ids: Iterable[str], query_embedding: List[float], n_results: int, space: str = "l2") -> List[dict]:
+    """
+    Exact nearest neighbours among `ids`
+
+    Fetches the chunks' stored embeddings and ranks them with NumPy instead
+    of walking the HNSW graph; for a small subset this is faster than an
+    ANN query with a filter, and recall is exact.
+    """
+    ids = list(ids)
+    if not ids or n_results <= 0:
+        return []
+    page = collection.get(ids=ids, include=["embeddings"])
+    if len(page["ids"]) == 0:
+        return []
+    vectors = np.asarray(page["embeddings"], dtype=np.float32)
+    distances = exact_distances(vectors, np.asarray(query_embedding, dtype=np.float32), space)
+    n_results = min(n_results, len(distances))
+    top = np.argpartition(distances, n_results - 1)[:n_results]
+    top = top[np.argsort(distances[top])]
+    # Only the winners' text and metadata are fetched
+    winners = [page["ids"][i] for i in top]
+    details = collection.get(ids=winners, include=["documents", "metadatas"])
+    by_id = {doc_id: (doc, meta) for doc_id, doc, meta in zip(details["ids"], details["documents"], details["metadatas"])}
+    return [
+        {
+            "id": doc_id,
+            "document": by_id[doc_id][0],
+            "metadata": by_id[doc_id][1],
+            "distance": float(distances[i])
+        }
+        for doc_id, i in zip(winners, top)
+        if doc_id in by_id
+    ]
@@ -0,0 +1,265 @@
+"""
+Generation Scheduler for the RAG Service
+Admission control for Ollama: per-model slots, a bounded priority queue and deadlines
+"""
+
+from typing import Dict, Iterable, List, Optional
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+PRIORITIES = {"interactive": 0, "background": 1}
+
+
+class SchedulerRejected(Exception):
+    """The request was not admitted; `retry_after` is a hint in seconds"""
+
+    def __init__(self, reason: str, message: str, retry_after: int):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Lease:
+    """A held generation slot; release() is idempotent"""
+
+    def __init__(self, scheduler: "GenerationScheduler", model: str):
+        self._scheduler = scheduler
+        self.model = model
+        self.acquired = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._scheduler._release(self.model, time.monotonic() - self.acquired)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class _ModelQueue:
+    def __init__(self, slots: int, service_seconds: float):
+        self.slots = slots
+        self.active = 0
+        self.waiters: List[tuple] = []  # heap of (priority, seq, deadline, future)
+        self.service_seconds = service_seconds  # EWMA of slot hold time
+
+
+class GenerationScheduler:
+    """
+    Bounded, priority-aware admission in front of Ollama
+
+    Each model gets `slots` concurrent generations (match OLLAMA_NUM_PARALLEL
+    so Ollama batches them itself). Requests beyond that wait in a queue
+    shared by all models, holding at most `max_queue` requests; background
+    requests may only use `background_share` of it so prefetch jobs can
+    never crowd out interactive users. Interactive requests are always
+    dispatched first.
+
+    A request whose deadline passes while queued is dropped instead of
+    being sent to Ollama late. Rejections raise SchedulerRejected with a
+    Retry-After estimate based on recent generation times.
+
+    When `models` is given, only those models (and the ones in
+    `slot_overrides`) get their own slots and queue; requests for any other
+    model share the "other" queue, so client-supplied model names can't grow
+    the scheduler's state or its metric labels.
+    """
+
+    def __init__(
+        self,
+        default_slots: int = 2,
+        slot_overrides: Optional[Dict[str, int]] = None,
+        max_queue: int = 32,
+        background_share: float = 0.5,
+        initial_service_seconds: float = 10.0,
+        models: Optional[Iterable[str]] = None,
+        registry=None
+    ):
+        self.default_slots = max(1, default_slots)
+        self.slot_overrides = slot_overrides or {}
+        self.max_queue = max_queue
+        self.background_share = background_share
+        self.initial_service_seconds = initial_service_seconds
+        self.models = None if models is None else set(models) | set(self.slot_overrides)
+        self._models: Dict[str, _ModelQueue] = {}
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.dropped = 0
+
+        self._queue_depth = self._active_gauge = self._rejections = self._wait_seconds = None
+        if registry is not None:
+            self._queue_depth = registry.gauge(
+                "rag_scheduler_queue_depth", "Generations waiting for a slot", ("model", "priority"))
+            self._active_gauge = registry.gauge(
+                "rag_scheduler_active", "Generations holding a slot", ("model",))
+            self._rejections = registry.counter(
+                "rag_scheduler_rejected_total", "Generations rejected (queue_full) or dropped (deadline)",
+                ("model", "priority", "reason"))
+            self._wait_seconds = registry.histogram(
+                "rag_scheduler_wait_seconds", "Time spent queued before getting a slot", ("model", "priority"))
+
+    def _queue_name(self, model: str) -> str:
+        """The queue a model's requests wait in: its own, or "other" for a model not in `models`"""
+        if self.models is None or model in self.models:
+            return model
+        return "other"
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self._models.get(model)
+        if queue is None:
+            slots = self.slot_overrides.get(model, self.default_slots)
+            queue = self._models[model] = _ModelQueue(slots, self.initial_service_seconds)
+        return queue
+
+    def queued(self, priority: Optional[str] = None) -> int:
+        rank = PRIORITIES.get(priority) if priority else None
+        return sum(
+            1 for queue in self._models.values() for waiter in queue.waiters
+            if not waiter[3].done() and (rank is None or waiter[0] == rank)
+        )
+
+    def retry_after(self, model: str) -> int:
+        """Seconds until a slot is likely free: queued work spread over the model's slots"""
+        queue = self._queue(self._queue_name(model))
+        waiting = sum(1 for waiter in queue.waiters if not waiter[3].done())
+        estimate = queue.service_seconds * (waiting + 1) / queue.slots
+        return max(1, min(300, math.ceil(estimate)))
+
+    def _update_gauges(self, model: str):
+        if self._queue_depth is None:
+            return
+        queue = self._models[model]
+        for priority, rank in PRIORITIES.items():
+            depth = sum(1 for waiter in queue.waiters if waiter[0] == rank and not waiter[3].done())
+            self._queue_depth.set(depth, model=model, priority=priority)
+        self._active_gauge.set(queue.active, model=model)
+
+    def _reject(self, model: str, priority: str, reason: str, message: str):
+        if reason == "deadline":
+            self.dropped += 1
+        else:
+            self.rejected += 1
+        if self._rejections is not None:
+            self._rejections.inc(model=model, priority=priority, reason=reason)
+        raise SchedulerRejected(reason, message, self.retry_after(model))
+
+    def _free(self, queue: _ModelQueue) -> bool:
+        """A slot is free and nobody is queued ahead"""
+        return queue.active < queue.slots and not any(not waiter[3].done() for waiter in queue.waiters)
+
+    def _queue_full(self, rank: int) -> bool:
+        limit = self.max_queue if rank == 0 else int(self.max_queue * self.background_share)
+        return self.queued() >= limit
+
+    def check_admission(self, model: str, priority: str = "interactive"):
+        """
+        Raise SchedulerRejected now if acquire() would reject the request for a full queue
+
+        Lets callers turn a request away before doing work whose result
+        would be thrown away (retrieval, reranking). acquire() still makes
+        the final decision, as the queue can change in between.
+        """
+        rank = PRIORITIES.get(priority, PRIORITIES["interactive"])
+        model = self._queue_name(model)
+        queue = self._queue(model)
+        if not self._free(queue) and self._queue_full(rank):
+            self._reject(model, priority, "queue_full", f"Generation queue is full ({self.queued()} waiting)")
+
+    async def acquire(self, model: str, priority: str = "interactive", timeout: Optional[float] = None) -> Lease:
+        """
+        Wait for a generation slot
+
+        `timeout` is the longest the caller is willing to wait in the queue.
+        Raises SchedulerRejected when the queue is full or the wait would
+        exceed (or has exceeded) the timeout.
+        """
+        rank = PRIORITIES.get(priority, PRIORITIES["interactive"])
+        requested, model = model, self._queue_name(model)
+        queue = self._queue(model)
+        started = time.monotonic()
+
+        if self._free(queue):
+            queue.active += 1
+            self.admitted += 1
+            self._update_gauges(model)
+            return Lease(self, model)
+
+        if self._queue_full(rank):
+            self._reject(model, priority, "queue_full", f"Generation queue is full ({self.queued()} waiting)")
+
+        deadline = started + timeout if timeout else None
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue.waiters, (rank, next(self._seq), deadline, future))
+        self._update_gauges(model)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the timeout fired; keep it
+                pass
+            else:
+                future.cancel()
+                self._prune(queue)
+                self._update_gauges(model)
+                self._reject(model, priority, "deadline", f"Timed out after {timeout:g}s waiting for a {requested} slot")
+        except asyncio.CancelledError:
+            # Client went away; give the slot back if it was already handed over
+            if future.done() and not future.cancelled():
+                self._release(model, 0.0, record=False)
+            else:
+                future.cancel()
+                self._prune(queue)
+                self._update_gauges(model)
+            raise
+
+        self.admitted += 1
+        if self._wait_seconds is not None:
+            self._wait_seconds.observe(time.monotonic() - started, model=model, priority=priority)
+        return Lease(self, model)
+
+    def _prune(self, queue: _ModelQueue):
+        queue.waiters = [waiter for waiter in queue.waiters if not waiter[3].done()]
+        heapq.heapify(queue.waiters)
+
+    def _release(self, model: str, held_seconds: float, record: bool = True):
+        queue = self._models[model]
+        if record and held_seconds > 0:
+            queue.service_seconds = 0.8 * queue.service_seconds + 0.2 * held_seconds
+        queue.active -= 1
+        now = time.monotonic()
+        while queue.waiters and queue.active < queue.slots:
+            rank, _, deadline, future = heapq.heappop(queue.waiters)
+            if future.done():
+                continue
+            if deadline is not None and deadline <= now:
+                # Too late to be useful: the waiter's own timeout will report it
+                continue
+            queue.active += 1
+            future.set_result(None)
+        self._update_gauges(model)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "max_queue": self.max_queue,
+            "queued": self.queued(),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "models": {
+                model: {
+                    "slots": queue.slots,
+                    "active": queue.active,
+                    "queued": sum(1 for waiter in queue.waiters if not waiter[3].done()),
+                    "avg_generation_seconds": round(queue.service_seconds, 2)
+                }
+                for model, queue in self._models.items()
+            }
+        }
@@ -0,0 +1,29 @@
+"""
+Gunicorn configuration for running the RAG Service with several workers
+
+    chroma run --path chroma_db --port 8001
+    RAG_CHROMA_HOST=localhost gunicorn -c gunicorn.conf.py "rag_service:create_app()"
+
+Each worker is a separate process with its own ONNX embedder, keyword
+indexes and caches; all of them share the Chroma server. Writes made through
+one worker reach the others via RAG_STATE_DIR (see rag_service.py).
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("RAG_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("RAG_WORKERS", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Generations on CPU can take minutes; don't let gunicorn kill a busy worker
+timeout = int(os.environ.get("RAG_WORKER_TIMEOUT", "600"))
+graceful_timeout = 30
+keepalive = 5
+
+# Load the app in each worker (not in the master), so ONNX sessions and
+# Chroma connections are never shared across a fork
+preload_app = False
+
+if not os.environ.get("RAG_CHROMA_HOST") and workers > 1:
+    raise SystemExit("RAG_CHROMA_HOST must point at a Chroma server when running more than one worker")
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Knowledge Base Ingestion for the RAG Service
+============================================
+
+Walks a directory of text, markdown and PDF files, chunks them in a process
+pool and streams the chunks to the RAG service's /reindex/{track} endpoint.
+
+Usage:
+    python3 ingest.py ./knowledge/hvac --track hvac
+    python3 ingest.py ./manuals --track nursing --workers 8 --batch-chunks 512
+
+Progress is recorded in a manifest (file mtime, size and SHA-256), so an
+interrupted run can simply be restarted and unchanged files are skipped.
+Chunks of edited files replace the file's old chunks, and files deleted from
+the directory are tombstoned in the knowledge base. Memory is bounded by
+the parses in flight (up to 2 x workers files' chunks) plus one upload batch.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import requests
+
+from chunking import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE, chunk_text
+
+SUPPORTED_EXTENSIONS = {".txt", ".md", ".markdown", ".pdf"}
+DEFAULT_RAG_URL = os.environ.get("RAG_URL", "http://localhost:8000")
+
+
+# Manifest
+def load_manifest(path: Path) -> dict:
+    """Load the ingestion manifest, or start an empty one"""
+    if path.exists():
+        with open(path, "r") as f:
+            return json.load(f)
+    return {"version": 1, "tracks": {}}
+
+
+def save_manifest(manifest: dict, path: Path):
+    """Write the manifest atomically so an interrupted run never corrupts it"""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# File discovery and parsing
+def iter_files(root: Path) -> Iterator[Path]:
+    """Yield supported files under root, lazily and in a stable order"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            path = Path(dirpath) / filename
+            if path.suffix.lower() in SUPPORTED_EXTENSIONS:
+                yield path
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_text(path: Path) -> str:
+    """Extract text from a supported file"""
+    if path.suffix.lower() == ".pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise RuntimeError("PDF support requires pypdf (pip install pypdf)")
+        reader = PdfReader(str(path))
+        return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def parse_file(path: str, known_hash: Optional[str], chunk_size: int, chunk_overlap: int) -> dict:
+    """
+    Hash, parse and chunk one file (runs in a worker process)
+
+    If the content hash matches `known_hash` the file only had its mtime
+    touched, so parsing is skipped.
+    """
+    file_path = Path(path)
+    stat = file_path.stat()
+    sha256 = file_sha256(file_path)
+    result = {"path": path, "mtime": stat.st_mtime, "size": stat.st_size, "sha256": sha256}
+    if sha256 == known_hash:
+        result["unchanged"] = True
+        return result
+    result["chunks"] = chunk_text(read_text(file_path), chunk_size, chunk_overlap)
+    return result
+
+
+# Upload
+class Uploader:
+    """Buffers chunked files and posts them to /reindex/{track} in batches"""
+
+    def __init__(self, rag_url: str, track: str, batch_chunks: int, manifest: dict, manifest_path: Path):
+        self.url = rag_url.rstrip("/") + f"/reindex/{track}"
+        self.track = track
+        self.batch_chunks = batch_chunks
+        self.manifest = manifest
+        self.manifest_path = manifest_path
+        self.session = requests.Session()
+        self.pending_sources: List[dict] = []
+        self.pending_files: List[tuple] = []  # (key, manifest record)
+        self.pending_chunks = 0
+        self.chunks_sent = 0
+        self.files_done = 0
+
+    @property
+    def files(self) -> Dict[str, dict]:
+        return self.manifest["tracks"].setdefault(self.track, {})
+
+    def post(self, payload: dict) -> dict:
+        response = self.session.post(self.url, json=payload, timeout=600)
+        if response.status_code != 200:
+            raise RuntimeError(f"/reindex/{self.track} failed ({response.status_code}): {response.text[:200]}")
+        return response.json()
+
+    def add_file(self, key: str, record: dict, chunks: List[str]):
+        # A file is always sent in one request: /reindex replaces a source's chunks as a unit
+        self.pending_sources.append({
+            "source": key,
+            "chunks": chunks,
+            "source_hash": record["sha256"],
+            "metadata": {
+                "title": Path(key).stem.replace("_", " "),
+                "file_type": Path(key).suffix.lower().lstrip(".")
+            }
+        })
+        record["chunks"] = len(chunks)
+        self.pending_files.append((key, record))
+        self.pending_chunks += len(chunks)
+        if self.pending_chunks >= self.batch_chunks:
+            self.flush()
+
+    def flush(self):
+        """Upload every buffered file, then record the completed files in the manifest"""
+        if self.pending_sources:
+            self.post({"sources": self.pending_sources})
+            self.chunks_sent += self.pending_chunks
+
+        for key, record in self.pending_files:
+            self.files[key] = record
+            self.files_done += 1
+
+        self.pending_sources, self.pending_files, self.pending_chunks = [], [], 0
+        save_manifest(self.manifest, self.manifest_path)
+
+    def remove_files(self, keys: List[str]) -> int:
+        """Tombstone files that disappeared from the directory"""
+        if not keys:
+            return 0
+        result = self.post({"removed": keys})
+        for key in keys:
+            self.files.pop(key, None)
+        save_manifest(self.manifest, self.manifest_path)
+        return result["chunks_deleted"]
+
+
+def ingest_directory(
+    root: Path,
+    track: str,
+    rag_url: str,
+    manifest_path: Path,
+    workers: int,
+    batch_chunks: int,
+    chunk_size: int,
+    chunk_overlap: int,
+    force: bool = False
+):
+    manifest = load_manifest(manifest_path)
+    uploader = Uploader(rag_url, track, batch_chunks, manifest, manifest_path)
+    known = uploader.files
+    skipped = unchanged = failed = 0
+    seen = set()
+    started = time.time()
+
+    # Parses submitted but not yet handed to the uploader; a finished one holds its file's chunks
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+
+        def drain():
+            """Wait for at least one parse to finish and hand its chunks to the uploader"""
+            nonlocal unchanged, failed
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"❌ {key}: {e}")
+                    continue
+                record = {k: result[k] for k in ("mtime", "size", "sha256")}
+                if result.get("unchanged"):
+                    # Content is identical; only refresh the stat info
+                    known[key].update(record)
+                    unchanged += 1
+                    continue
+                uploader.add_file(key, record, result["chunks"])
+                print(f"📄 {key}: {len(result['chunks'])} chunks")
+
+        for path in iter_files(root):
+            key = str(path.relative_to(root))
+            seen.add(key)
+            stat = path.stat()
+            previous = known.get(key)
+            if not force and previous and previous.get("mtime") == stat.st_mtime and previous.get("size") == stat.st_size:
+                skipped += 1
+                continue
+
+            known_hash = None if force or not previous else previous.get("sha256")
+            future = pool.submit(parse_file, str(path), known_hash, chunk_size, chunk_overlap)
+            in_flight[future] = key
+            while len(in_flight) >= max_in_flight:
+                drain()
+
+        while in_flight:
+            drain()
+
+    uploader.flush()
+    removed = sorted(key for key in known if key not in seen)
+    chunks_deleted = uploader.remove_files(removed)
+    elapsed = time.time() - started
+
+    print()
+    print("=" * 60)
+    print(f"✅ Ingested {uploader.files_done} files ({uploader.chunks_sent} chunks) into '{track}' in {elapsed:.1f}s")
+    print(f"⏭️  Skipped {skipped} unchanged files, {unchanged} touched but identical")
+    if removed:
+        print(f"🪦 Tombstoned {len(removed)} deleted files ({chunks_deleted} chunks)")
+    if failed:
+        print(f"⚠️  {failed} files failed to parse")
+    print("=" * 60)
+
+
+def track_chunking(rag_url: str, track: str) -> Dict[str, int]:
+    """The track's configured chunk settings from GET /tracks, or the defaults if unavailable"""
+    try:
+        response = requests.get(rag_url.rstrip("/") + "/tracks", timeout=10)
+        response.raise_for_status()
+        settings = response.json()["tracks"][track]
+        return {"chunk_size": settings["chunk_size"], "chunk_overlap": settings["chunk_overlap"]}
+    except (requests.RequestException, KeyError, ValueError) as e:
+        print(f"⚠️  Could not read chunk settings for '{track}' from the service ({e}), using defaults")
+        return {"chunk_size": DEFAULT_CHUNK_SIZE, "chunk_overlap": DEFAULT_CHUNK_OVERLAP}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a directory of documents into the RAG knowledge base")
+    parser.add_argument("directory", type=Path, help="Directory of .txt, .md and .pdf files")
+    parser.add_argument("--track", required=True, help="Track to ingest into (e.g. hvac, nursing)")
+    parser.add_argument("--url", default=DEFAULT_RAG_URL, help=f"RAG service URL (default: {DEFAULT_RAG_URL})")
+    parser.add_argument("--manifest", type=Path, default=None,
+                        help="Manifest file (default: <directory>/.ingest_manifest.json)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Parser processes")
+    parser.add_argument("--batch-chunks", type=int, default=256, help="Chunks per /reindex call")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Max tokens per chunk (default: the track's setting)")
+    parser.add_argument("--chunk-overlap", type=int, default=None, help="Tokens shared by consecutive chunks (default: the track's setting)")
+    parser.add_argument("--force", action="store_true", help="Re-ingest every file, ignoring the manifest")
+    args = parser.parse_args()
+
+    if not args.directory.is_dir():
+        print(f"❌ Not a directory: {args.directory}")
+        sys.exit(1)
+    if args.chunk_size is None or args.chunk_overlap is None:
+        configured = track_chunking(args.url, args.track)
+        args.chunk_size = args.chunk_size or configured["chunk_size"]
+        args.chunk_overlap = configured["chunk_overlap"] if args.chunk_overlap is None else args.chunk_overlap
+    if args.chunk_overlap >= args.chunk_size:
+        print("❌ --chunk-overlap must be smaller than --chunk-size")
+        sys.exit(1)
+
+    manifest_path = args.manifest or args.directory / ".ingest_manifest.json"
+    print(f"📚 Ingesting {args.directory} into track '{args.track}' via {args.url}")
+    print(f"🧾 Manifest: {manifest_path}")
+
+    ingest_directory(
+        root=args.directory,
+        track=args.track,
+        rag_url=args.url,
+        manifest_path=manifest_path,
+        workers=max(1, args.workers),
+        batch_chunks=max(1, args.batch_chunks),
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        force=args.force
+    )
+
+
+if __name__ == "__main__":
+    main()
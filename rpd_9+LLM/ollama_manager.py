@@ -0,0 +1,151 @@
+"""
+Ollama Client Manager for the RAG Service
+One pooled async client, model warm-up, keep_alive pinning and load tracking
+"""
+
+from typing import Dict, Iterable, List, Optional, Union
+import asyncio
+import time
+
+
+def ollama_chunk_to_dict(chunk) -> dict:
+    """Normalize an Ollama response chunk (dict in older clients, pydantic model in newer ones)"""
+    if isinstance(chunk, dict):
+        return chunk
+    return chunk.model_dump(mode="json", exclude_none=True)
+
+
+def parse_keep_alive(value: str) -> Union[int, str]:
+    """"-1" / "3600" become seconds for Ollama; durations such as "30m" pass through"""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class OllamaManager:
+    """
+    Shared Ollama client for every generation
+
+    All calls go through one `ollama.AsyncClient`, whose httpx connection pool
+    is sized with `max_connections`, so requests reuse open connections to
+    Ollama instead of reconnecting. Models listed in `pinned_models` are loaded
+    at startup (`warm_up`) and sent with `keep_alive` on every request, so
+    Ollama never unloads them between users; `keep_pinned` periodically
+    re-warms them in case Ollama restarted.
+
+    Every response's `load_duration` is recorded per model. A load longer than
+    `cold_load_seconds` counts as a cold start.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        pinned_models: Iterable[str] = (),
+        keep_alive: Union[int, str, None] = -1,
+        max_connections: int = 16,
+        timeout: Optional[float] = 600,
+        cold_load_seconds: float = 1.0
+    ):
+        self.host = host
+        self.pinned_models: List[str] = list(dict.fromkeys(m for m in pinned_models if m))
+        self.keep_alive = keep_alive
+        self.cold_load_seconds = cold_load_seconds
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client = None
+        self.warm: Dict[str, dict] = {}  # model -> {"ok", "load_ms" | "error", "at"}
+        self.warm_up_done = not self.pinned_models
+        self._loads: Dict[str, dict] = {}
+
+    @property
+    def client(self):
+        """The pooled ollama.AsyncClient, created on first use (ollama and httpx are slow to import)"""
+        if self._client is None:
+            import httpx
+            import ollama
+
+            self._client = ollama.AsyncClient(
+                host=self.host,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            )
+        return self._client
+
+    def _keep_alive_for(self, model: str):
+        return self.keep_alive if model in self.pinned_models else None
+
+    def record_load(self, model: str, response: dict):
+        """Track load_duration (nanoseconds) from a final response chunk"""
+        load_ns = response.get("load_duration")
+        if load_ns is None:
+            return
+        seconds = load_ns / 1e9
+        stats = self._loads.setdefault(model, {"responses": 0, "cold_starts": 0, "last_load_ms": 0.0, "max_load_ms": 0.0})
+        stats["responses"] += 1
+        stats["last_load_ms"] = round(seconds * 1000, 2)
+        stats["max_load_ms"] = max(stats["max_load_ms"], stats["last_load_ms"])
+        if seconds >= self.cold_load_seconds:
+            stats["cold_starts"] += 1
+            print(f"🥶 Cold start for {model}: model load took {seconds:.1f}s")
+
+    async def generate(self, model: str, prompt: str, stream: bool = False, **kwargs):
+        """
+        ollama.AsyncClient.generate with keep_alive for pinned models
+
+        Returns a dict, or an async iterator of dict chunks when streaming.
+        """
+        keep_alive = self._keep_alive_for(model)
+        if keep_alive is not None:
+            kwargs.setdefault("keep_alive", keep_alive)
+        response = await self.client.generate(model=model, prompt=prompt, stream=stream, **kwargs)
+        if not stream:
+            response = ollama_chunk_to_dict(response)
+            self.record_load(model, response)
+            return response
+        return self._relay(model, response)
+
+    async def _relay(self, model: str, chunks):
+        async for chunk in chunks:
+            chunk = ollama_chunk_to_dict(chunk)
+            if chunk.get("done"):
+                self.record_load(model, chunk)
+            yield chunk
+
+    async def warm_up(self, models: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        """
+        Load models into Ollama ahead of traffic
+
+        An empty prompt makes Ollama load the model (and apply keep_alive)
+        without generating anything; it is nearly free if already loaded.
+        """
+        models = list(models) if models is not None else self.pinned_models
+        for model in models:
+            started = time.perf_counter()
+            try:
+                response = await self.generate(model=model, prompt="")
+                load_ms = round((response.get("load_duration") or 0) / 1e6, 2)
+                self.warm[model] = {"ok": True, "load_ms": load_ms, "at": time.time()}
+                if load_ms >= self.cold_load_seconds * 1000:
+                    print(f"🔥 Warmed {model} in {time.perf_counter() - started:.1f}s")
+            except Exception as e:
+                self.warm[model] = {"ok": False, "error": str(e), "at": time.time()}
+                print(f"❌ Could not warm {model}: {e}")
+        self.warm_up_done = True
+        return {model: self.warm[model] for model in models}
+
+    async def keep_pinned(self, interval_seconds: float):
+        """Background task: re-warm pinned models so an Ollama restart doesn't leave them cold"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await self.warm_up()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "host": self.host,
+            "pinned_models": self.pinned_models,
+            "keep_alive": self.keep_alive,
+            "warm_up_done": self.warm_up_done,
+            "warm": self.warm,
+            "loads": self._loads
+        }
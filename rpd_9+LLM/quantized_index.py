@@ -0,0 +1,330 @@
+"""
+Quantized Vector Index for the RAG Service
+int8 copies of a track's embeddings in memory-mapped NumPy files, for a compact scan-and-rescore search
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import numpy as np
+
+QUERY_GROUP = 8  # Queries scanned together; the scan holds rows x queries float32 distances
+SCAN_BLOCK = 1024  # Rows converted to float32 at a time; small blocks stay in CPU cache (5x faster than 32k)
+
+
+def quantize(vectors) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization
+
+    Returns the codes and, per row, (scale, squared norm of the original
+    vector): row ≈ codes * scale, and the norm keeps L2/cosine distances
+    close to their float values.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2:
+        vectors = vectors.reshape(len(vectors), -1)
+    peak = np.abs(vectors).max(axis=1) if vectors.size else np.zeros(len(vectors), dtype=np.float32)
+    scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    norms = np.einsum("ij,ij->i", vectors, vectors).astype(np.float32)
+    return codes, np.stack([scales, norms], axis=1)
+
+
+def approximate_distances(codes: np.ndarray, params: np.ndarray, queries: np.ndarray, space: str = "l2") -> np.ndarray:
+    """Distances (rows x queries) from quantized rows to float queries, as Chroma reports them for the space"""
+    dots = (codes.astype(np.float32) @ queries.T) * params[:, :1]
+    if space == "l2":
+        return params[:, 1:2] - 2 * dots + np.einsum("ij,ij->i", queries, queries)[None, :]
+    if space == "ip":
+        return 1.0 - dots
+    norms = np.sqrt(params[:, 1:2]) * np.linalg.norm(queries, axis=1)[None, :]
+    return 1.0 - dots / np.where(norms == 0, 1.0, norms)
+
+
+class QuantizedIndex:
+    """
+    int8-quantized embeddings of one track, for scan-then-rescore search
+
+    The bulk of the index is a "generation" of three .npy files in
+    `directory`, sorted by chunk id and memory-mapped read-only, so it costs
+    page cache rather than process memory and is shared by every worker:
+
+      <name>.<generation>.codes.npy   int8, one row per chunk (1/4 of float32)
+      <name>.<generation>.params.npy  float32 (scale, squared norm) per chunk
+      <name>.<generation>.ids.npy     the chunk ids, sorted, as bytes
+
+    <name>.json names the current generation. Chunks added since it was
+    written are kept in memory and removed ones are masked out; `compact`
+    folds both into a new generation once they pass `compact_fraction` of
+    the index. `candidates` scans every live row and returns the ids of the
+    best `n` per query; callers re-rank those with exact float distances.
+    """
+
+    def __init__(self, directory: str, name: str, space: str = "l2", signature: str = "",
+                 compact_fraction: float = 0.1):
+        self.directory = directory
+        self.name = name
+        self.space = space
+        self.signature = signature  # Embedding model etc.: a mismatch means the files can't be reused
+        self.compact_fraction = compact_fraction
+        self.generation: Optional[str] = None
+        self.dim: Optional[int] = None
+        self._codes = np.empty((0, 0), dtype=np.int8)
+        self._params = np.empty((0, 2), dtype=np.float32)
+        self._ids = np.empty(0, dtype="S1")
+        self._live = np.empty(0, dtype=bool)
+        self._delta_ids: List[str] = []
+        self._delta_codes = np.empty((0, 0), dtype=np.int8)
+        self._delta_params = np.empty((0, 2), dtype=np.float32)
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._live.sum()) + len(self._delta_ids)
+
+    def _path(self, generation: str, part: str) -> str:
+        return os.path.join(self.directory, f"{self.name}.{generation}.{part}.npy")
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, f"{self.name}.json")
+
+    def _current(self) -> Optional[str]:
+        """The generation <name>.json points at, if it was built with this signature and space"""
+        try:
+            with open(self._meta_path()) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("signature") != self.signature or meta.get("space") != self.space:
+            return None
+        return meta.get("generation")
+
+    def load(self, generation: Optional[str] = None) -> bool:
+        """Map a generation (default: the current one) from disk; False if there is none or it was built differently"""
+        generation = generation or self._current()
+        if generation is None:
+            return False
+        try:
+            codes = np.load(self._path(generation, "codes"), mmap_mode="r")
+            params = np.load(self._path(generation, "params"), mmap_mode="r")
+            ids = np.load(self._path(generation, "ids"), mmap_mode="r")
+        except (OSError, ValueError):
+            return False
+        with self._lock:
+            self.generation = generation
+            self.dim = codes.shape[1] or None
+            self._codes, self._params, self._ids = codes, params, ids
+            self._live = np.ones(len(ids), dtype=bool)
+            self._delta_ids = []
+            self._delta_codes = np.empty((0, self.dim or 0), dtype=np.int8)
+            self._delta_params = np.empty((0, 2), dtype=np.float32)
+        return True
+
+    def _positions(self, ids: Iterable[str]) -> np.ndarray:
+        """Positions of the ids present in the mapped generation (a binary search, as it is sorted)"""
+        width = self._ids.dtype.itemsize
+        wanted = [encoded for encoded in (doc_id.encode("utf-8") for doc_id in ids) if len(encoded) <= width]
+        if not len(self._ids) or not wanted:
+            return np.empty(0, dtype=np.int64)
+        wanted = np.array(wanted, dtype=self._ids.dtype)
+        positions = np.searchsorted(self._ids, wanted)
+        found = positions < len(self._ids)
+        positions, wanted = positions[found], wanted[found]
+        return positions[self._ids[positions] == wanted]
+
+    def ids(self) -> Set[str]:
+        """Every live chunk id"""
+        with self._lock:
+            live = {doc_id.decode("utf-8") for doc_id in self._ids[self._live]}
+            live.update(self._delta_ids)
+            return live
+
+    def add(self, ids: Sequence[str], embeddings):
+        """
+        Index chunks; an id already indexed keeps its vector
+
+        Chunk ids are hashes of the chunk text, so an existing id always has
+        the same embedding under the same model.
+        """
+        if not len(ids):
+            return
+        codes, params = quantize(embeddings)
+        with self._lock:
+            if self.dim is None:
+                self.dim = codes.shape[1]
+                self._codes = np.empty((0, self.dim), dtype=np.int8)
+                self._delta_codes = np.empty((0, self.dim), dtype=np.int8)
+            elif codes.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {codes.shape[1]} does not match the index ({self.dim})")
+            positions = self._positions(ids)
+            self._live[positions] = True
+            present = {doc_id.decode("utf-8") for doc_id in self._ids[positions]}
+            present.update(self._delta_ids)
+            fresh = list({doc_id: i for i, doc_id in enumerate(ids) if doc_id not in present}.values())
+            if fresh:
+                self._delta_ids = self._delta_ids + [ids[i] for i in fresh]
+                self._delta_codes = np.concatenate([self._delta_codes, codes[fresh]])
+                self._delta_params = np.concatenate([self._delta_params, params[fresh]])
+            self._maybe_compact()
+
+    def remove(self, ids: Iterable[str]):
+        ids = list(ids)
+        with self._lock:
+            self._live[self._positions(ids)] = False
+            gone = set(ids)
+            keep = [i for i, doc_id in enumerate(self._delta_ids) if doc_id not in gone]
+            if len(keep) != len(self._delta_ids):
+                self._delta_ids = [self._delta_ids[i] for i in keep]
+                self._delta_codes = self._delta_codes[keep]
+                self._delta_params = self._delta_params[keep]
+            self._maybe_compact()
+
+    def sync(self, current_ids: Set[str], fetch: Callable[[List[str]], Tuple[List[str], object]], page_size: int = 5000) -> Dict[str, int]:
+        """
+        Bring the index in line with the track's chunk ids
+
+        Chunks that are gone are masked out; missing ones are fetched with
+        `fetch(ids) -> (ids, embeddings)` (a Chroma get) a page at a time.
+        After a restart only the chunks written since the last compaction
+        are read, instead of every embedding in the track.
+        """
+        indexed = self.ids()
+        stale = indexed - current_ids
+        missing = sorted(current_ids - indexed)
+        if stale:
+            self.remove(stale)
+        for start in range(0, len(missing), page_size):
+            fetched_ids, embeddings = fetch(missing[start:start + page_size])
+            self.add(list(fetched_ids), embeddings)
+        with self._lock:
+            if self.generation is None or self._delta_ids or not self._live.all():
+                self.compact()
+        return {"removed": len(stale), "added": len(missing)}
+
+    def _maybe_compact(self):
+        pending = len(self._delta_ids) + int((~self._live).sum())
+        if pending and pending >= self.compact_fraction * max(len(self._ids), 1000):
+            self.compact()
+
+    def compact(self):
+        """Write live and in-memory chunks as a new generation, map it and delete the old one"""
+        with self._lock:
+            delta_ids = np.array([doc_id.encode("utf-8") for doc_id in self._delta_ids], dtype="S")
+            ids = np.concatenate([self._ids[self._live], delta_ids])
+            order = np.argsort(ids, kind="stable")
+            ids = ids[order]
+            codes = np.concatenate([self._codes[self._live], self._delta_codes])[order]
+            params = np.concatenate([self._params[self._live], self._delta_params])[order]
+
+            generation = uuid.uuid4().hex[:12]
+            for part, array in (("codes", codes), ("params", params), ("ids", ids)):
+                temp = self._path(generation, part) + ".tmp"
+                with open(temp, "wb") as f:
+                    np.save(f, array)
+                os.replace(temp, self._path(generation, part))
+            temp = self._meta_path() + f".{os.getpid()}.tmp"
+            with open(temp, "w") as f:
+                json.dump({"generation": generation, "signature": self.signature, "space": self.space,
+                           "dim": self.dim, "count": len(ids)}, f)
+            os.replace(temp, self._meta_path())
+
+            previous = self.generation
+            self.load(generation)
+            self._remove_generations(previous)
+
+    def _remove_generations(self, previous: Optional[str], grace_seconds: float = 60):
+        """
+        Delete the generation this index replaced, and any others left behind
+
+        Other workers may still map an old generation; its pages stay
+        readable after the unlink until they reload. Files of generations
+        the metadata doesn't name are only removed after `grace_seconds`, so a
+        generation another worker is still writing survives.
+        """
+        current = self._current()
+        pattern = re.compile(re.escape(self.name) + r"\.([0-9a-f]{12})\.(codes|params|ids)\.npy")
+        for filename in os.listdir(self.directory):
+            match = pattern.fullmatch(filename)
+            if match is None:
+                continue
+            generation = match.group(1)
+            if generation in (self.generation, current):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                if generation == previous or time.time() - os.path.getmtime(path) > grace_seconds:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def candidates(self, query_embeddings, n: int, allowed: Optional[Set[str]] = None) -> List[List[str]]:
+        """The ids of the `n` nearest chunks per query by quantized distance (optionally among `allowed`)"""
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        if len(queries) > QUERY_GROUP:
+            # Bound the distance matrix (rows x queries) for large batches
+            return [
+                hits
+                for start in range(0, len(queries), QUERY_GROUP)
+                for hits in self.candidates(queries[start:start + QUERY_GROUP], n, allowed)
+            ]
+        with self._lock:
+            codes, params, ids, live = self._codes, self._params, self._ids, self._live
+            delta_ids, delta_codes, delta_params = self._delta_ids, self._delta_codes, self._delta_params
+            if allowed is not None:
+                mask = np.zeros(len(ids), dtype=bool)
+                mask[self._positions(allowed)] = True
+                live = live & mask
+        if n <= 0 or not len(queries):
+            return [[] for _ in range(len(queries))]
+
+        # One distance per row and query; rows are scanned a cache-sized block at a time
+        distances = np.full((len(ids) + len(delta_ids), len(queries)), np.inf, dtype=np.float32)
+        for start in range(0, len(ids), SCAN_BLOCK):
+            end = min(start + SCAN_BLOCK, len(ids))
+            if live[start:end].any():
+                distances[start:end] = approximate_distances(codes[start:end], params[start:end], queries, self.space)
+        distances[:len(ids)][~live] = np.inf
+        if delta_ids:
+            distances[len(ids):] = approximate_distances(delta_codes, delta_params, queries, self.space)
+            if allowed is not None:
+                distances[len(ids):][[doc_id not in allowed for doc_id in delta_ids]] = np.inf
+
+        results = []
+        take = min(n, len(distances))
+        for column in distances.T:
+            if not take:
+                results.append([])
+                continue
+            top = np.argpartition(column, take - 1)[:take]
+            top = top[np.argsort(column[top])]
+            results.append([
+                ids[row].decode("utf-8") if row < len(ids) else delta_ids[row - len(ids)]
+                for row in top if np.isfinite(column[row])
+            ])
+        return results
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            disk = 0
+            if self.generation:
+                for part in ("codes", "params", "ids"):
+                    try:
+                        disk += os.path.getsize(self._path(self.generation, part))
+                    except OSError:
+                        pass
+            return {
+                "generation": self.generation,
+                "chunks": int(self._live.sum()) + len(self._delta_ids),
+                "pending": len(self._delta_ids),
+                "masked": int((~self._live).sum()),
+                "dim": self.dim,
+                "disk_bytes": disk,
+                "mapped_bytes": self._codes.nbytes + self._params.nbytes + self._ids.nbytes,
+                "memory_bytes": self._delta_codes.nbytes + self._delta_params.nbytes + self._live.nbytes
+            }
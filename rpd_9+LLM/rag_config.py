@@ -0,0 +1,237 @@
+"""
+Configuration for the RAG Service
+Track (collection) registry loaded from a TOML file and environment variables
+"""
+
+from typing import Callable, Dict, Iterator, List, Optional, Union
+import os
+import re
+import threading
+
+from pydantic import BaseModel, field_validator
+
+from chunking import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_TOP_K = 3
+DEFAULT_TRACKS = ["hvac", "nursing", "spiritual", "mental_health"]
+
+# Chroma collection names: 3-63 characters, alphanumeric at both ends. "+" is
+# reserved for multi-track cache scopes ("hvac+nursing").
+TRACK_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{1,61}[A-Za-z0-9]$")
+
+# HNSW settings Chroma reads from collection metadata ("hnsw:<key>")
+HNSW_KEYS = {"space", "M", "construction_ef", "search_ef", "num_threads", "batch_size", "sync_threshold", "resize_factor"}
+HNSW_SPACES = {"l2", "ip", "cosine"}
+
+
+class TrackConfig(BaseModel):
+    """Settings for one track's collection"""
+    name: str
+    description: Optional[str] = None
+    embedding_model: str = DEFAULT_EMBEDDING_MODEL
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
+    top_k: int = DEFAULT_TOP_K
+    hnsw: Dict[str, Union[int, float, str]] = {}
+    preload: bool = False  # Open at startup instead of on first use
+    quantized: bool = False  # Also search an int8 memory-mapped copy of the embeddings (quantized_index.py)
+
+    @field_validator("name")
+    @classmethod
+    def check_name(cls, name: str) -> str:
+        if not TRACK_NAME.match(name):
+            raise ValueError(f"invalid track name {name!r} (3-63 letters, digits, '_', '-' or '.')")
+        return name
+
+    @field_validator("hnsw")
+    @classmethod
+    def check_hnsw(cls, hnsw: Dict[str, Union[int, float, str]]) -> Dict[str, Union[int, float, str]]:
+        unknown = set(hnsw) - HNSW_KEYS
+        if unknown:
+            raise ValueError(f"unknown HNSW settings {sorted(unknown)} (valid: {sorted(HNSW_KEYS)})")
+        if "space" in hnsw and hnsw["space"] not in HNSW_SPACES:
+            raise ValueError(f"HNSW space must be one of {sorted(HNSW_SPACES)}")
+        return hnsw
+
+    def collection_metadata(self) -> Dict[str, object]:
+        """Metadata for a new Chroma collection (HNSW settings only apply when it is created)"""
+        metadata = {"description": self.description or f"Knowledge base for {self.name} track"}
+        metadata.update({f"hnsw:{key}": value for key, value in self.hnsw.items()})
+        return metadata
+
+
+class ServiceConfig(BaseModel):
+    """Everything read from rag_config.toml plus environment overrides"""
+    db_path: Optional[str] = None
+    tracks: Dict[str, TrackConfig]
+    source: Optional[str] = None  # The TOML file, if one was read
+
+    def default_top_k(self, tracks: List[str]) -> int:
+        """top_k for a request that didn't set one: the largest default of the tracks it searches"""
+        return max((self.tracks[track].top_k for track in tracks), default=DEFAULT_TOP_K)
+
+
+def _read_toml(path: str) -> dict:
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise RuntimeError(f"Reading {path} needs Python 3.11+ or `pip install tomli`")
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def load_config(path: Optional[str] = None, environ: Optional[Dict[str, str]] = None) -> ServiceConfig:
+    """
+    Build the service configuration
+
+    The TOML file (RAG_CONFIG, or `path`) may set `db_path`, a `[defaults]`
+    table and one `[tracks.<name>]` table per track; every track setting
+    falls back to `[defaults]`, then to the built-in defaults. Environment:
+
+      RAG_CONFIG   path to the TOML file (it is optional if unset)
+      RAG_DB_PATH  overrides db_path
+      RAG_TRACKS   comma-separated tracks to serve; tracks missing from the
+                   file use the defaults
+
+    Without a file or RAG_TRACKS the four original tracks are served.
+    """
+    environ = os.environ if environ is None else environ
+    path = environ.get("RAG_CONFIG") or path
+    data: dict = {}
+    source = None
+    if path and os.path.exists(path):
+        data = _read_toml(path)
+        source = os.path.abspath(path)
+    elif environ.get("RAG_CONFIG"):
+        raise FileNotFoundError(f"RAG_CONFIG points at a missing file: {path}")
+
+    defaults = data.get("defaults", {})
+    tables: Dict[str, dict] = data.get("tracks", {})
+    if environ.get("RAG_TRACKS"):
+        names = [name.strip() for name in environ["RAG_TRACKS"].split(",") if name.strip()]
+    else:
+        names = list(tables) or DEFAULT_TRACKS
+
+    tracks = {}
+    for name in names:
+        settings = {**defaults, **tables.get(name, {})}
+        settings["hnsw"] = {**defaults.get("hnsw", {}), **tables.get(name, {}).get("hnsw", {})}
+        tracks[name] = TrackConfig(name=name, **settings)
+        if tracks[name].chunk_overlap >= tracks[name].chunk_size:
+            raise ValueError(f"Track {name}: chunk_overlap must be smaller than chunk_size")
+
+    return ServiceConfig(
+        db_path=environ.get("RAG_DB_PATH") or data.get("db_path"),
+        tracks=tracks,
+        source=source
+    )
+
+
+class CollectionRegistry:
+    """
+    The configured tracks and their lazily opened collections
+
+    A track's collection is opened (or created) by `opener` the first time
+    it is used, so a service hosting dozens of tracks only pays for the ones
+    that get traffic. Opening is blocking; call `open` from a worker thread.
+    Concurrent first uses of a track wait for a single open.
+    """
+
+    def __init__(self, config: ServiceConfig, opener: Callable[[TrackConfig], object]):
+        self.config = config
+        self._opener = opener
+        self._collections: Dict[str, object] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.opens = 0
+
+    def __contains__(self, track: object) -> bool:
+        return track in self.config.tracks
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.config.tracks))
+
+    def __len__(self) -> int:
+        return len(self.config.tracks)
+
+    def keys(self) -> List[str]:
+        return list(self.config.tracks)
+
+    def settings(self, track: str) -> TrackConfig:
+        return self.config.tracks[track]
+
+    def is_open(self, track: str) -> bool:
+        return track in self._collections
+
+    def opened(self) -> Dict[str, object]:
+        """Collections opened so far, by track"""
+        with self._lock:
+            return dict(self._collections)
+
+    def _track_lock(self, track: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(track, threading.Lock())
+
+    def open(self, track: str):
+        """The track's collection, opening it on first use"""
+        collection = self._collections.get(track)
+        if collection is not None:
+            return collection
+        if track not in self.config.tracks:
+            raise KeyError(f"Unknown track: {track}")
+        with self._track_lock(track):
+            collection = self._collections.get(track)
+            if collection is None:
+                collection = self._opener(self.config.tracks[track])
+                with self._lock:
+                    self._collections[track] = collection
+                    self.opens += 1
+        return collection
+
+    def reopen(self, track: str):
+        """Open the track again (after another process changed or recreated it)"""
+        with self._track_lock(track):
+            with self._lock:
+                self._collections.pop(track, None)
+        return self.open(track)
+
+    def close(self, track: str):
+        """Forget the track's collection handle; the next use opens it again"""
+        with self._lock:
+            self._collections.pop(track, None)
+
+    def update(self, config: ServiceConfig) -> Dict[str, List[str]]:
+        """
+        Switch to a new configuration; returns the added, removed and changed tracks
+
+        Removed tracks are closed, and so are tracks whose embedding model or
+        HNSW settings changed, so they are reopened with the new settings on
+        their next use (HNSW settings still only apply to new collections).
+        Other settings (top_k, chunking) apply immediately.
+        """
+        old = self.config.tracks
+        new = config.tracks
+        diff = {
+            "added": [track for track in new if track not in old],
+            "removed": [track for track in old if track not in new],
+            "changed": [track for track in new if track in old and new[track] != old[track]]
+        }
+        self.config = config
+        for track in diff["removed"]:
+            self.close(track)
+        for track in diff["changed"]:
+            if (new[track].embedding_model, new[track].hnsw) != (old[track].embedding_model, old[track].hnsw):
+                self.close(track)
+        return diff
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "config": self.config.source,
+            "tracks": len(self.config.tracks),
+            "open": sorted(self._collections),
+            "opens": self.opens
+        }
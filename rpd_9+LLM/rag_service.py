@@ -3,67 +3,584 @@ RAG Service for Workforce Development App
 Provides retrieval-augmented generation using ChromaDB and Ollama
 """
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-import chromadb
-from chromadb.utils import embedding_functions
-import ollama
-import uvicorn
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Set, Union
+from array import array
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+import asyncio
+import base64
+import math
+import uuid
+import threading
+import time
+import json
 import os
+import sys
 
-app = FastAPI(title="Workforce Dev RAG Service", version="1.0.0")
+from batch_jobs import BatchJobStore
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from content_store import TOPIC_NAME, ContentStore, choose_encoding, parse_etags
+from context_builder import DEFAULT_CONTEXT_BUDGET, build_context
+from compression import CompressionMiddleware
+from chunking import chunk_id, chunk_text, content_hash
+from document_counts import DocumentCounts
+from embedding_service import EmbeddingService
+from filtered_search import MetadataIndex, exact_search, matches_document, normalize_where, validate_where, validate_where_document
+from generation_scheduler import PRIORITIES, GenerationScheduler, SchedulerRejected
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, RequestTimings
+from ollama_manager import OllamaManager, parse_keep_alive
+from quantized_index import QuantizedIndex
+from rag_config import DEFAULT_EMBEDDING_MODEL, CollectionRegistry, TrackConfig, load_config
+from reranker import CrossEncoderReranker
+from response_cache import ResponseCache
+from session_store import SessionStore
+from single_flight import SingleFlight
+from track_revisions import TrackRevisions
 
-# Initialize ChromaDB (vector database)
-# Using absolute path to ensure connection to the correct database
-# Priority: Use specified RAG database path, fallback to local
-RAG_DB_PATH = "/Users/chris/Desktop/rag_service/chroma_db"
+try:
+    import orjson
+except ImportError:  # Optional: responses fall back to the standard json module
+    orjson = None
+
+router = APIRouter()
+
+# Service configuration
+# The tracks served and their settings (embedding model, chunking, default
+# top_k, HNSW parameters) come from rag_config.toml next to this file, or the
+# file named by RAG_CONFIG; RAG_TRACKS and RAG_DB_PATH override it. See
+# rag_config.example.toml. Without any of these the four original tracks are
+# served with the built-in defaults.
+CONFIG_PATH = os.environ.get("RAG_CONFIG") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_config.toml")
+CONFIG_RELOAD_SECONDS = float(os.environ.get("RAG_CONFIG_RELOAD_SECONDS", "5"))
+rag_config = load_config(CONFIG_PATH)
+
+# ChromaDB (vector database)
+# A configured db_path is always used (and created if missing). Otherwise use
+# the primary RAG database if it exists, falling back to a local one.
+RAG_DB_PATH = rag_config.db_path or "/Users/chris/Desktop/rag_service/chroma_db"
 LOCAL_DB_PATH = os.path.join(os.path.dirname(__file__), "chroma_db")
+db_path = RAG_DB_PATH if rag_config.db_path or os.path.exists(RAG_DB_PATH) else LOCAL_DB_PATH
 
-# Check if the specified RAG database exists, otherwise use local
-if os.path.exists(RAG_DB_PATH):
-    db_path = RAG_DB_PATH
-    print(f"📊 Using RAG database at: {db_path}")
-else:
-    db_path = LOCAL_DB_PATH
-    print(f"📊 Using local database at: {db_path}")
-    print(f"⚠️  RAG database not found at {RAG_DB_PATH}, using local fallback")
-
-chroma_client = chromadb.PersistentClient(path=db_path)
-
-# Use ChromaDB's built-in ONNX embedding function (same model as sentence-transformers but more stable)
-# This uses the same 'all-MiniLM-L6-v2' model but via ONNX runtime
-# This ensures compatibility with existing collections that use 384-dimensional embeddings
-embedding_function = embedding_functions.ONNXMiniLM_L6_V2()
-
-# Create or get collection for each track
-COLLECTIONS = {
-    "hvac": None,
-    "nursing": None,
-    "spiritual": None,
-    "mental_health": None
-}
+# Multi-worker deployments must not open one SQLite directory from several
+# processes. Run a single Chroma server over the database instead
+# (`chroma run --path chroma_db --port 8001`) and point every worker at it
+# with RAG_CHROMA_HOST / RAG_CHROMA_PORT.
+CHROMA_HOST = os.environ.get("RAG_CHROMA_HOST")
+CHROMA_PORT = int(os.environ.get("RAG_CHROMA_PORT", "8001"))
 
-def init_collections():
-    """Initialize vector database collections for each track"""
-    for track_name in COLLECTIONS.keys():
-        try:
-            # Try to get existing collection first
+# Importing this module does no heavy work: chromadb and the ONNX embedding
+# model are loaded by init_services(), which the app's lifespan runs in the
+# background once the server is listening. Track collections and their keyword
+# indexes are opened on first use.
+chroma_client = None
+embedding_function = None
+
+def open_chroma_client():
+    """Connect to ChromaDB (imported here because chromadb alone takes about a second to import)"""
+    import chromadb
+    
+    if CHROMA_HOST:
+        print(f"📊 Using ChromaDB server at {CHROMA_HOST}:{CHROMA_PORT}")
+        return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+    if db_path == RAG_DB_PATH:
+        print(f"📊 Using RAG database at: {db_path}")
+    else:
+        print(f"📊 Using local database at: {db_path}")
+        print(f"⚠️  RAG database not found at {RAG_DB_PATH}, using local fallback")
+    return chromadb.PersistentClient(path=db_path)
+
+def load_embedding_function(model: str = DEFAULT_EMBEDDING_MODEL):
+    """
+    Use ChromaDB's built-in ONNX embedding function (same model as sentence-transformers but more stable)
+    
+    The default 'all-MiniLM-L6-v2' model runs via ONNX runtime, which keeps
+    compatibility with existing collections that use 384-dimensional
+    embeddings. Tracks configured with another model load it through
+    sentence-transformers, which must then be installed.
+    """
+    from chromadb.utils import embedding_functions
+    if model == DEFAULT_EMBEDDING_MODEL:
+        return embedding_functions.ONNXMiniLM_L6_V2()
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model)
+
+# Startup state: "starting" until init_services() finishes, then "ready" (or
+# "failed"). Routes that need Chroma or the embedding model answer 503 with
+# Retry-After until then; /health and /metrics always answer.
+STARTUP = {"status": "starting", "error": None, "timings": None}
+STARTUP_RETRY_AFTER = "5"
+
+def require_services():
+    """Route dependency: refuse requests until the vector database and embedding model are loaded"""
+    if STARTUP["status"] != "ready":
+        detail = "Service is starting up" if STARTUP["status"] == "starting" else f"Service failed to start: {STARTUP['error']}"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": STARTUP_RETRY_AFTER})
+
+# Track collections
+# COLLECTIONS holds the configured tracks. A track's collection is opened (or
+# created with its HNSW settings) the first time it is used, together with its
+# document count and keyword index; tracks with preload = true are opened at
+# startup instead. Blocking: call COLLECTIONS.open(track) on the retrieval pool.
+def open_track(config: TrackConfig):
+    """Open or create a track's collection, then cache its count and build its keyword index"""
+    track = config.name
+    embedder = embedding_service_for(config.embedding_model)
+    try:
+        # Try to get existing collection first
+        collection = chroma_client.get_collection(name=track, embedding_function=embedder.embedding_function)
+        stored = collection.metadata or {}
+        differing = {
+            key: value for key, value in config.collection_metadata().items()
+            if key.startswith("hnsw:") and stored.get(key) != value
+        }
+        if differing:
+            print(f"⚠️  {track}: configured HNSW settings {differing} only apply when the collection is recreated")
+        document_counts.set(track, collection.count())
+        print(f"✅ Connected to existing collection: {track} ({document_counts.get(track)} documents)")
+    except Exception:
+        # Collection doesn't exist, create it with the track's embedding function and HNSW settings
+        collection = chroma_client.create_collection(
+            name=track,
+            embedding_function=embedder.embedding_function,
+            metadata=config.collection_metadata()
+        )
+        document_counts.set(track, 0)
+        print(f"✅ Created new collection: {track}")
+    build_track_indexes(track, collection)
+    return collection
+
+COLLECTIONS = CollectionRegistry(rag_config, open_track)
+
+# Document counts are cached in process: collection.count() hits SQLite, and
+# /health is polled constantly. Writes update the cache; a background task
+# reconciles it with Chroma every RAG_COUNT_RECONCILE_SECONDS.
+document_counts = DocumentCounts()
+COUNT_RECONCILE_SECONDS = float(os.environ.get("RAG_COUNT_RECONCILE_SECONDS", "300"))
+
+def preload_tracks():
+    """Open the tracks configured with preload = true"""
+    for track in COLLECTIONS:
+        if COLLECTIONS.settings(track).preload:
             try:
-                COLLECTIONS[track_name] = chroma_client.get_collection(name=track_name)
-                print(f"✅ Connected to existing collection: {track_name} ({COLLECTIONS[track_name].count()} documents)")
-            except:
-                # Collection doesn't exist, create it with the embedding function
-                COLLECTIONS[track_name] = chroma_client.create_collection(
-                    name=track_name,
-                    embedding_function=embedding_function,
-                    metadata={"description": f"Knowledge base for {track_name} track"}
-                )
-                print(f"✅ Created new collection: {track_name}")
-        except Exception as e:
-            print(f"❌ Error initializing {track_name} collection: {e}")
+                COLLECTIONS.open(track)
+            except Exception as e:
+                print(f"❌ Error opening {track} collection: {e}")
+
+# Keyword (BM25) indexes
+# Exact terms such as refrigerant codes, drug names and part numbers are often
+# missed by MiniLM embeddings, so every track also has an in-memory BM25 index.
+# It is built from the Chroma collection when the track is opened and kept in
+# sync on every add/reindex/delete; /generate fuses both rankings with
+# reciprocal rank fusion.
+HYBRID_SEARCH = os.environ.get("RAG_HYBRID_SEARCH", "1") == "1"
+HYBRID_CANDIDATES = int(os.environ.get("RAG_HYBRID_CANDIDATES", "4"))  # Candidates per ranking = top_k * this
+RRF_K = int(os.environ.get("RAG_RRF_K", "60"))
+KEYWORD_INDEXES: Dict[str, BM25Index] = {}
+
+# Metadata filters
+# /generate can restrict retrieval with Chroma `where` / `where_document`
+# filters. Every track also keeps a MetadataIndex with posting sets for the
+# keys in RAG_FILTER_INDEX_KEYS, which resolves a filter to its matching chunk
+# ids in memory. When at most RAG_FILTER_EXACT_MAX chunks match, they are
+# ranked exactly with NumPy instead of running a filtered HNSW query (see
+# bench_filtered_retrieval.py for where the crossover lies).
+FILTER_INDEX_KEYS = [k.strip() for k in os.environ.get(
+    "RAG_FILTER_INDEX_KEYS", "source,module,difficulty,certification_level"
+).split(",") if k.strip()]
+FILTER_EXACT_MAX = int(os.environ.get("RAG_FILTER_EXACT_MAX", "300"))
+FILTER_INDEXES: Dict[str, MetadataIndex] = {}
+
+def build_track_indexes(track: str, collection, page_size: int = 5000):
+    """(Re)build a track's BM25 and metadata indexes from its Chroma collection and swap them in"""
+    keyword_index = BM25Index()
+    filter_index = MetadataIndex(FILTER_INDEX_KEYS)
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        keyword_index.add(page["ids"], page["documents"], page["metadatas"])
+        filter_index.add(page["ids"], page["metadatas"])
+        offset += len(page["ids"])
+    KEYWORD_INDEXES[track] = keyword_index
+    FILTER_INDEXES[track] = filter_index
+    print(f"🔤 Keyword index for {track}: {len(keyword_index)} chunks")
+    if COLLECTIONS.settings(track).quantized:
+        build_quantized_index(track, collection, filter_index.all_ids())
+    else:
+        QUANTIZED_INDEXES.pop(track, None)
+
+def index_chunks(track: str, ids: List[str], texts: List[str], metadatas: List[dict], embeddings=None):
+    """Add written chunks to the track's in-memory indexes (and quantized index, fetching embeddings if not given)"""
+    KEYWORD_INDEXES[track].add(ids, texts, metadatas)
+    FILTER_INDEXES[track].add(ids, metadatas)
+    quantized = QUANTIZED_INDEXES.get(track)
+    if quantized is not None:
+        if embeddings is None:
+            page = COLLECTIONS.open(track).get(ids=ids, include=["embeddings"])
+            ids, embeddings = page["ids"], page["embeddings"]
+        quantized.add(ids, embeddings)
+
+def unindex_chunks(track: str, ids: List[str]):
+    """Drop deleted chunks from the track's in-memory indexes"""
+    KEYWORD_INDEXES[track].remove(ids)
+    FILTER_INDEXES[track].remove(ids)
+    if track in QUANTIZED_INDEXES:
+        QUANTIZED_INDEXES[track].remove(ids)
+
+def sync_document_count(track: str):
+    """Refresh a track's cached count after a write (the keyword index mirrors the collection's ids)"""
+    document_counts.set(track, len(KEYWORD_INDEXES[track]))
+
+def collection_counters() -> Dict[str, object]:
+    """collection.count for every open collection, for DocumentCounts.reconcile"""
+    return {track: collection.count for track, collection in COLLECTIONS.opened().items()}
+
+# Cross-worker sync
+# Keyword indexes, document counts and the response cache live in each worker
+# process. Every write bumps the track's revision in RAG_STATE_DIR; each worker
+# checks the revisions every RAG_SYNC_SECONDS and refreshes tracks that another
+# worker changed.
+STATE_DIR = os.environ.get("RAG_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".rag_state"))
+SYNC_SECONDS = float(os.environ.get("RAG_SYNC_SECONDS", "2"))
+track_revisions: Optional[TrackRevisions] = None
+
+# Quantized index
+# Tracks configured with `quantized = true` also keep int8 copies of their
+# embeddings in memory-mapped files under RAG_QUANTIZED_DIR, a quarter of the
+# size of Chroma's float32 vectors. Vector search scans them and re-ranks the
+# best top_k * RAG_QUANTIZED_RESCORE candidates with their exact embeddings
+# from Chroma (see bench_quantized.py for recall, memory and latency).
+QUANTIZED_DIR = os.environ.get("RAG_QUANTIZED_DIR", os.path.join(STATE_DIR, "quantized"))
+QUANTIZED_RESCORE = int(os.environ.get("RAG_QUANTIZED_RESCORE", "4"))
+QUANTIZED_INDEXES: Dict[str, QuantizedIndex] = {}
+
+def build_quantized_index(track: str, collection, ids: Set[str]):
+    """Map the track's quantized index from disk and bring it up to date with the collection"""
+    index = QuantizedIndex(
+        QUANTIZED_DIR,
+        track,
+        space=(collection.metadata or {}).get("hnsw:space", "l2"),
+        signature=COLLECTIONS.settings(track).embedding_model
+    )
+    index.load()
+
+    def fetch(wanted: List[str]):
+        page = collection.get(ids=wanted, include=["embeddings"])
+        return page["ids"], page["embeddings"]
+
+    changes = index.sync(ids, fetch)
+    QUANTIZED_INDEXES[track] = index
+    print(f"🗜️  Quantized index for {track}: {len(index)} chunks ({changes['added']} read from Chroma)")
+
+def resync_track(track: str):
+    """Reload a track's collection handle, keyword index and count after another worker wrote to it"""
+    # A track this worker hasn't opened yet will load the current data on first use
+    if COLLECTIONS.is_open(track):
+        COLLECTIONS.reopen(track)
+
+# Ollama client
+# The async client keeps long generations from blocking the event loop, so
+# /health and other requests stay responsive while a 20B model is working.
+# Every call shares one pooled connection to Ollama. The models in
+# RAG_OLLAMA_PIN_MODELS are loaded at startup and sent with
+# keep_alive=RAG_OLLAMA_KEEP_ALIVE (-1 = never unload), so the first request
+# after a quiet period doesn't pay the model load time.
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_PIN_MODELS = [m.strip() for m in os.environ.get("RAG_OLLAMA_PIN_MODELS", "gpt-oss:20b").split(",") if m.strip()]
+OLLAMA_REPIN_SECONDS = float(os.environ.get("RAG_OLLAMA_REPIN_SECONDS", "300"))
+ollama_manager = OllamaManager(
+    OLLAMA_HOST,
+    pinned_models=OLLAMA_PIN_MODELS,
+    keep_alive=parse_keep_alive(os.environ.get("RAG_OLLAMA_KEEP_ALIVE", "-1")),
+    max_connections=int(os.environ.get("RAG_OLLAMA_MAX_CONNECTIONS", "16")),
+    timeout=float(os.environ.get("RAG_OLLAMA_TIMEOUT", "600")),
+    cold_load_seconds=float(os.environ.get("RAG_OLLAMA_COLD_LOAD_SECONDS", "1"))
+)
+
+# ChromaDB queries and ONNX embedding are synchronous and CPU-bound, so they
+# run on a dedicated thread pool instead of the event loop.
+RETRIEVAL_WORKERS = int(os.environ.get("RAG_RETRIEVAL_WORKERS", "4"))
+retrieval_executor = ThreadPoolExecutor(
+    max_workers=RETRIEVAL_WORKERS,
+    thread_name_prefix="rag-retrieval"
+)
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking ChromaDB/ONNX call on the retrieval thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(retrieval_executor, partial(func, *args, **kwargs))
+
+# Shared embedding layer
+# All prompt embeddings go through this service: repeated texts come from an
+# LRU cache, and concurrent misses within RAG_EMBED_BATCH_WINDOW_MS are run
+# through the ONNX model as a single batch.
+def make_embedding_service(embedding_function, name: str) -> EmbeddingService:
+    return EmbeddingService(
+        embedding_function,
+        retrieval_executor,
+        name=name,
+        cache_size=int(os.environ.get("RAG_EMBED_CACHE_SIZE", "4096")),
+        batch_window_ms=float(os.environ.get("RAG_EMBED_BATCH_WINDOW_MS", "5")),
+        max_batch_size=int(os.environ.get("RAG_EMBED_MAX_BATCH", "64"))
+    )
+
+embedding_service = make_embedding_service(None, "ONNXMiniLM_L6_V2")  # Model set by init_services()
+
+# Tracks configured with another embedding model get their own service, loaded
+# when the first such track is opened
+embedding_services: Dict[str, EmbeddingService] = {DEFAULT_EMBEDDING_MODEL: embedding_service}
+embedding_services_lock = threading.Lock()
+
+def embedding_service_for(model: str) -> EmbeddingService:
+    """The embedding service for a model, loading the model on first use (blocking)"""
+    with embedding_services_lock:
+        if model not in embedding_services:
+            embedding_services[model] = make_embedding_service(load_embedding_function(model), model)
+            print(f"📐 Loaded embedding model {model}")
+        return embedding_services[model]
+
+async def query_embeddings(
+    prompts: List[str],
+    tracks: List[str],
+    default_embeddings: Optional[List[List[float]]]
+) -> Dict[str, List[List[float]]]:
+    """The prompts embedded with each track's embedding model, reusing the default model's embeddings"""
+    by_model = {DEFAULT_EMBEDDING_MODEL: default_embeddings} if default_embeddings is not None else {}
+    for track in tracks:
+        model = COLLECTIONS.settings(track).embedding_model
+        if model not in by_model:
+            service = embedding_services.get(model) or await run_blocking(embedding_service_for, model)
+            by_model[model] = await service.embed(prompts)
+    return {track: by_model[COLLECTIONS.settings(track).embedding_model] for track in tracks}
+
+# Per-model concurrency limits
+# RAG_MODEL_CONCURRENCY sets the default number of simultaneous generations per
+# model; RAG_MODEL_CONCURRENCY_OVERRIDES adjusts individual models, e.g.
+# "gpt-oss:20b=1,llama3.2:3b=4". Requests beyond the limit are queued by the
+# generation scheduler (see below).
+def parse_model_limits(value: str) -> Dict[str, int]:
+    """Parse a "model=limit,model=limit" string into a dict"""
+    limits = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        model, limit = item.rsplit("=", 1)
+        limits[model.strip()] = max(1, int(limit))
+    return limits
+
+MODEL_CONCURRENCY = max(1, int(os.environ.get("RAG_MODEL_CONCURRENCY", "2")))
+MODEL_CONCURRENCY_OVERRIDES = parse_model_limits(os.environ.get("RAG_MODEL_CONCURRENCY_OVERRIDES", ""))
+
+# Response cache
+# Repeated prompts (track content, quizzes) are answered from memory. Exact
+# matches are checked first; with RAG_SEMANTIC_CACHE enabled, prompts whose
+# embedding is at least RAG_SEMANTIC_CACHE_THRESHOLD similar also match.
+# Set RAG_RESPONSE_CACHE_SIZE=0 to disable caching.
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("RAG_RESPONSE_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.environ.get("RAG_RESPONSE_CACHE_TTL", "3600")),
+    semantic=os.environ.get("RAG_SEMANTIC_CACHE", "1") == "1",
+    semantic_threshold=float(os.environ.get("RAG_SEMANTIC_CACHE_THRESHOLD", "0.97"))
+)
+
+# Multi-turn sessions
+# Requests with a session_id continue from the Ollama context of the
+# session's previous turn, so the conversation isn't prefilled again, and
+# only references the session hasn't seen yet are added to the prompt.
+# Sessions live in this worker's memory: with several workers, route a
+# session to one worker (a turn on another worker simply starts over).
+# Set RAG_SESSION_MAX=0 to disable sessions.
+sessions = SessionStore(
+    max_sessions=int(os.environ.get("RAG_SESSION_MAX", "1000")),
+    ttl_seconds=float(os.environ.get("RAG_SESSION_TTL", "1800")),
+    max_context_tokens=int(os.environ.get("RAG_SESSION_MAX_CONTEXT_TOKENS", "32768"))
+)
+SESSION_ID_MAX_LENGTH = 128
 
-init_collections()
+# Batch generation
+# /generate/batch jobs (offline content prefill) are stored in SQLite under
+# RAG_STATE_DIR, so results survive restarts and any worker can serve them.
+# Each job's prompts are embedded and retrieved RAG_BATCH_RETRIEVAL_SIZE at a
+# time, and at most RAG_BATCH_CONCURRENCY of its generations run at once, as
+# background-priority work behind interactive requests. A job whose worker
+# stops updating it for RAG_BATCH_STALE_SECONDS is resumed by another (or the
+# restarted) worker.
+BATCH_DB_PATH = os.environ.get("RAG_BATCH_DB", os.path.join(STATE_DIR, "batch_jobs.sqlite3"))
+BATCH_CONCURRENCY = max(1, int(os.environ.get("RAG_BATCH_CONCURRENCY", "2")))
+BATCH_MAX_ITEMS = int(os.environ.get("RAG_BATCH_MAX_ITEMS", "1000"))
+BATCH_RETRIEVAL_SIZE = max(1, int(os.environ.get("RAG_BATCH_RETRIEVAL_SIZE", "64")))
+BATCH_STALE_SECONDS = float(os.environ.get("RAG_BATCH_STALE_SECONDS", "120"))
+BATCH_RETENTION_SECONDS = float(os.environ.get("RAG_BATCH_RETENTION_DAYS", "7")) * 86400
+batch_store: Optional[BatchJobStore] = None  # Opened by init_services()
+batch_tasks: Dict[str, asyncio.Task] = {}  # Jobs running in this worker
+
+# Precomputed content
+# Generated lessons and quizzes can be stored per (track, topic, model) and
+# read back with GET /content/{track}/{topic}. Each artifact is tied to the
+# track's corpus version (a digest of its chunk ids), carries its content
+# hash as ETag and is stored precompressed, so clients revalidate with
+# If-None-Match in one round trip and only download after the track changed.
+CONTENT_DIR = os.environ.get("RAG_CONTENT_DIR", os.path.join(STATE_DIR, "content"))
+CONTENT_KEEP_VERSIONS = int(os.environ.get("RAG_CONTENT_KEEP_VERSIONS", "2"))
+content_store: Optional[ContentStore] = None  # Opened by init_services()
+
+# Response encoding
+# JSON is written with orjson when it is installed. Complete responses of at
+# least RAG_COMPRESS_MIN_BYTES are gzip/brotli-compressed for clients that
+# accept it (0 disables); token streams are never compressed. Clients that
+# don't resend Ollama's `context` can ask for it as base64 or not at all.
+JSON_RESPONSE = ORJSONResponse if orjson is not None else JSONResponse
+COMPRESS_MIN_BYTES = int(os.environ.get("RAG_COMPRESS_MIN_BYTES", "1024"))
+CONTEXT_ENCODINGS = ("list", "base64", "none")
+
+def publish_track_change(track: str):
+    """After a write: drop this worker's cached answers for the track and tell the other workers"""
+    response_cache.invalidate_track(track)
+    track_revisions.bump(track)
+
+# Request coalescing
+# While a generation is running, identical requests (same model, scope, top_k,
+# retrieval signature and prompt) attach to it instead of starting another
+# one, whether or not the response cache is enabled; once it has finished the
+# response cache serves them.
+single_flight = SingleFlight()
+
+# Optional rerank stage
+# Requests with rerank=true over-fetch `candidates` chunks and reorder them
+# with a local ONNX cross-encoder before keeping top_k. Point
+# RAG_RERANKER_MODEL_DIR at a directory containing model.onnx and
+# tokenizer.json (e.g. an export of cross-encoder/ms-marco-MiniLM-L-6-v2).
+reranker = CrossEncoderReranker(
+    os.environ.get("RAG_RERANKER_MODEL_DIR"),
+    cache_size=int(os.environ.get("RAG_RERANK_CACHE_SIZE", "8192")),
+    max_length=int(os.environ.get("RAG_RERANK_MAX_LENGTH", "256"))
+)
+
+# Context budgets
+# Retrieved chunks are deduplicated, trimmed and packed into a per-model token
+# budget, so prompt size (and prefill time) stays predictable no matter how
+# long the retrieved documents are. Example:
+# RAG_CONTEXT_BUDGETS="gpt-oss:20b=1500,llama3.2:3b=800"
+CONTEXT_BUDGET = int(os.environ.get("RAG_CONTEXT_BUDGET", str(DEFAULT_CONTEXT_BUDGET)))
+CONTEXT_BUDGETS = parse_model_limits(os.environ.get("RAG_CONTEXT_BUDGETS", ""))
+
+def context_budget(request: "GenerateRequest") -> int:
+    """Token budget for the reference section of the prompt"""
+    if request.context_tokens:
+        return request.context_tokens
+    return CONTEXT_BUDGETS.get(request.model, CONTEXT_BUDGET)
+
+# Metrics
+# Every /generate call is timed per stage (embed, vector_query, rerank,
+# context_build, Ollama load/prefill/eval, serialization). Stage histograms are
+# labelled by track and model and exposed in Prometheus text format on /metrics.
+# Only the models the service is configured for get their own label: the
+# pinned ones, those with a concurrency or context budget override, and
+# RAG_MODELS (default gpt-oss:20b). Any other model a client names is counted
+# as "other", so request bodies can't grow the label set.
+KNOWN_MODELS = frozenset(
+    [m.strip() for m in os.environ.get("RAG_MODELS", "gpt-oss:20b").split(",") if m.strip()]
+    + OLLAMA_PIN_MODELS + list(MODEL_CONCURRENCY_OVERRIDES) + list(CONTEXT_BUDGETS)
+)
+metrics_registry = MetricsRegistry()
+STAGE_SECONDS = metrics_registry.histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each /generate stage",
+    ("stage", "track", "model")
+)
+REQUEST_SECONDS = metrics_registry.histogram(
+    "rag_generate_duration_seconds",
+    "End-to-end /generate latency",
+    ("track", "model", "outcome")
+)
+GENERATE_REQUESTS = metrics_registry.counter(
+    "rag_generate_requests_total",
+    "/generate requests by outcome (generated, cache_exact, cache_semantic, coalesced, rejected, cancelled, error)",
+    ("track", "model", "outcome")
+)
+FILTERED_SEARCHES = metrics_registry.counter(
+    "rag_filtered_searches_total",
+    "Filtered track searches by path (exact over the matching chunks, quantized scan, or filtered ANN)",
+    ("path",)
+)
+OLLAMA_STAGES = {"load_duration": "ollama_load", "prompt_eval_duration": "ollama_prefill", "eval_duration": "ollama_eval"}
+
+def record_ollama_timings(timings: RequestTimings, response: dict):
+    """Copy Ollama's own load/prefill/eval durations (nanoseconds) into the request timings"""
+    for field, stage in OLLAMA_STAGES.items():
+        if response.get(field):
+            timings.record(stage, response[field] / 1e9)
+
+def metric_track(track: Optional[str]) -> str:
+    """Track label for metrics; unknown track names fall back to no retrieval, so keep them out of the label set"""
+    if not track or any(name not in COLLECTIONS for name in track.split("+")):
+        return "none"
+    return track
+
+def model_label(model: str) -> str:
+    """Model label for metrics; models the service isn't configured for share "other", so clients can't grow the label set"""
+    return model if model in KNOWN_MODELS else "other"
+
+def observe_stage(track: Optional[str], model: str, stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage, track=metric_track(track), model=model_label(model))
+
+def observe_request(timings: RequestTimings, track: Optional[str], model: str, outcome: str):
+    """Publish a finished request's stage timings to the metrics registry"""
+    track = metric_track(track)
+    model = model_label(model)
+    for stage, seconds in timings.stages.items():
+        STAGE_SECONDS.observe(seconds, stage=stage, track=track, model=model)
+    REQUEST_SECONDS.observe(timings.elapsed(), track=track, model=model, outcome=outcome)
+    GENERATE_REQUESTS.inc(track=track, model=model, outcome=outcome)
+
+# Generation scheduler
+# Admission control in front of Ollama. At most RAG_QUEUE_SIZE generations wait
+# for a model slot (background requests may fill only RAG_QUEUE_BACKGROUND_SHARE
+# of the queue); beyond that /generate answers 429 with Retry-After. Queued
+# requests that wait longer than their deadline (RAG_QUEUE_TIMEOUT_INTERACTIVE /
+# RAG_QUEUE_TIMEOUT_BACKGROUND seconds, or the request's deadline_ms) are
+# dropped the same way instead of reaching Ollama late. Models outside
+# KNOWN_MODELS share one "other" queue and its slots.
+generation_scheduler = GenerationScheduler(
+    default_slots=MODEL_CONCURRENCY,
+    slot_overrides=MODEL_CONCURRENCY_OVERRIDES,
+    max_queue=int(os.environ.get("RAG_QUEUE_SIZE", "32")),
+    background_share=float(os.environ.get("RAG_QUEUE_BACKGROUND_SHARE", "0.5")),
+    models=KNOWN_MODELS,
+    registry=metrics_registry
+)
+QUEUE_TIMEOUTS = {
+    "interactive": float(os.environ.get("RAG_QUEUE_TIMEOUT_INTERACTIVE", "60")),
+    "background": float(os.environ.get("RAG_QUEUE_TIMEOUT_BACKGROUND", "600"))
+}
+
+def reject_generation(request: "GenerateRequest", timings: RequestTimings, e: SchedulerRejected):
+    """Turn a scheduler rejection into 429 + Retry-After"""
+    print(f"🚦 Rejected {request.priority} request for {request.model}: {e}")
+    observe_request(timings, retrieval_scope(request), request.model, "rejected")
+    raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def check_generation_admission(request: "GenerateRequest", timings: RequestTimings):
+    """Refuse the request up front when the generation queue is already full"""
+    try:
+        generation_scheduler.check_admission(request.model, request.priority)
+    except SchedulerRejected as e:
+        reject_generation(request, timings, e)
+
+async def acquire_generation_slot(request: "GenerateRequest", timings: RequestTimings):
+    """Wait for a generation slot, turning a rejection into 429 + Retry-After"""
+    timeout = request.deadline_ms / 1000 if request.deadline_ms else QUEUE_TIMEOUTS[request.priority]
+    try:
+        with timings.stage("queue_wait"):
+            return await generation_scheduler.acquire(request.model, request.priority, timeout)
+    except SchedulerRejected as e:
+        reject_generation(request, timings, e)
 
 # Request/Response Models
 class GenerateRequest(BaseModel):
@@ -71,23 +588,712 @@ class GenerateRequest(BaseModel):
     prompt: str
     stream: bool = False
     track: Optional[str] = None  # For track-specific RAG
-    top_k: int = 3  # Number of relevant documents to retrieve
+    tracks: Optional[Union[List[str], str]] = None  # Search several tracks at once, or "all"
+    track_quota: Optional[int] = Field(None, ge=1)  # Max results per track when searching several (default: top_k / tracks, rounded up)
+    top_k: Optional[int] = Field(None, ge=1)  # Number of relevant documents to retrieve (default: the track's top_k)
+    hybrid: Optional[bool] = None  # Fuse BM25 keyword and vector results (default: RAG_HYBRID_SEARCH)
+    rerank: bool = False  # Rerank `candidates` retrieved chunks with the cross-encoder, keep top_k
+    candidates: int = Field(20, ge=1)  # Chunks to over-fetch when reranking
+    context_tokens: Optional[int] = Field(None, ge=1)  # Token budget for references (default: per-model budget)
+    cache: bool = True  # Set to false to bypass the response cache
+    priority: str = "interactive"  # "interactive" (chat) or "background" (content prefetch)
+    deadline_ms: Optional[int] = None  # Longest time to wait for a generation slot
+    where: Optional[dict] = None  # Metadata filter, e.g. {"difficulty": "beginner"} or {"module": {"$in": ["3", "4"]}}
+    where_document: Optional[dict] = None  # Text filter, e.g. {"$contains": "R-410A"}
+    session_id: Optional[str] = None  # Continue a multi-turn session (reuses Ollama's context)
+    context_encoding: str = "list"  # Reply `context` as a list of ints, "base64" (packed little-endian int32) or "none"
 
 class GenerateResponse(BaseModel):
     response: str
     model: str
     done: bool
-    context: Optional[List[int]] = None
+    context: Optional[Union[List[int], str]] = None  # A string when context_encoding is "base64"
     sources: Optional[List[dict]] = None  # Retrieved document sources
+    cache_hit: Optional[str] = None  # "exact" or "semantic" when served from cache
+    rerank: Optional[dict] = None  # Rerank details (applied, candidates, ms) when requested
+    context_usage: Optional[dict] = None  # Reference tokens used vs. budget, chunks used/dropped
+    timings: Optional[dict] = None  # Per-stage latency in milliseconds
+    coalesced: Optional[bool] = None  # True when this reply was shared with an identical in-flight request
+    session: Optional[dict] = None  # Session turn, context tokens reused, references reused/added
+
+class BatchItem(BaseModel):
+    prompt: str
+    key: Optional[str] = None  # Caller's id for the item (e.g. "module-3-quiz-2"), returned with its result
+
+class BatchGenerateRequest(BaseModel):
+    items: List[BatchItem]
+    model: str = "gpt-oss:20b"
+    track: Optional[str] = None
+    tracks: Optional[Union[List[str], str]] = None
+    track_quota: Optional[int] = Field(None, ge=1)
+    top_k: Optional[int] = Field(None, ge=1)
+    hybrid: Optional[bool] = None
+    rerank: bool = False
+    candidates: int = Field(20, ge=1)
+    context_tokens: Optional[int] = Field(None, ge=1)
+    where: Optional[dict] = None
+    where_document: Optional[dict] = None
+    cache: bool = True  # Also put results in the response cache, so /generate serves the same prompts instantly
+    concurrency: Optional[int] = None  # Generations in flight for this job (default and maximum: RAG_BATCH_CONCURRENCY)
+    publish: bool = False  # Also store each keyed item as /content/{track}/{key} (needs a single `track`)
+
+class ContentRequest(BaseModel):
+    prompt: str
+    model: str = "gpt-oss:20b"
+    top_k: Optional[int] = Field(None, ge=1)
+    hybrid: Optional[bool] = None
+    rerank: bool = False
+    context_tokens: Optional[int] = Field(None, ge=1)
+    where: Optional[dict] = None
+    where_document: Optional[dict] = None
+    regenerate: bool = False  # Generate again even if the current corpus version already has this artifact
 
 class DocumentRequest(BaseModel):
     track: str
     content: str
     metadata: dict = {}
 
+class BulkDocument(BaseModel):
+    content: str
+    metadata: dict = {}
+
+class BulkDocumentRequest(BaseModel):
+    track: str
+    documents: List[BulkDocument]
+    chunk: bool = True  # Split documents into overlapping, token-bounded chunks
+    chunk_size: Optional[int] = None  # Max tokens per chunk (default: the track's chunk_size)
+    chunk_overlap: Optional[int] = None  # Tokens shared by consecutive chunks (default: the track's chunk_overlap)
+
+class ReindexSource(BaseModel):
+    source: str  # Stable identifier for the source (file path, URL, manual name)
+    content: Optional[str] = None  # Full text, chunked by the service
+    chunks: Optional[List[str]] = None  # Or text that is already chunked (e.g. by ingest.py)
+    source_hash: Optional[str] = None  # Defaults to a hash of content/chunks
+    metadata: dict = {}
+
+class ReindexRequest(BaseModel):
+    sources: List[ReindexSource] = []  # New or possibly changed sources
+    removed: List[str] = []  # Sources to tombstone
+    prune: bool = False  # Also tombstone every stored source not listed in `sources`
+    chunk_size: Optional[int] = None  # Default: the track's chunk_size
+    chunk_overlap: Optional[int] = None  # Default: the track's chunk_overlap
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+    use_cache: bool = True
+
+# RAG Pipeline Helpers
+def vector_search(
+    collection,
+    query_embeddings: List[List[float]],
+    n_results: int,
+    where: Optional[dict] = None,
+    where_document: Optional[dict] = None
+) -> List[List[dict]]:
+    """Nearest-neighbour query for one or more embeddings in a single call; a list of hits per embedding"""
+    filters = {}
+    if where:
+        filters["where"] = where
+    if where_document:
+        filters["where_document"] = where_document
+    results = collection.query(
+        query_embeddings=query_embeddings,
+        n_results=n_results,
+        include=["documents", "metadatas", "distances"],
+        **filters
+    )
+    if not results['ids']:
+        return [[] for _ in query_embeddings]
+    return [
+        [
+            {"id": doc_id, "document": doc, "metadata": meta, "distance": distance}
+            for doc_id, doc, meta, distance in zip(ids, documents, metadatas, distances)
+        ]
+        for ids, documents, metadatas, distances in zip(
+            results['ids'],
+            results['documents'],
+            results['metadatas'],
+            results['distances']
+        )
+    ]
+
+def filter_ids(track: str, where: Optional[dict], where_document: Optional[dict]) -> Set[str]:
+    """Ids of the track's chunks that pass the filters, resolved from the in-memory indexes"""
+    ids = FILTER_INDEXES[track].select(where) if where else FILTER_INDEXES[track].all_ids()
+    if where_document:
+        keyword_index = KEYWORD_INDEXES[track]
+        ids = {doc_id for doc_id in ids if matches_document((keyword_index.get(doc_id) or ("",))[0], where_document)}
+    return ids
+
+def quantized_search(
+    collection,
+    index: QuantizedIndex,
+    query_embeddings: List[List[float]],
+    n_results: int,
+    allowed: Optional[Set[str]] = None
+) -> List[List[dict]]:
+    """Scan the int8 index for each embedding, then rank its best candidates by exact distance"""
+    candidates = index.candidates(query_embeddings, n_results * QUANTIZED_RESCORE, allowed)
+    return [
+        exact_search(collection, ids, embedding, n_results, index.space)
+        for ids, embedding in zip(candidates, query_embeddings)
+    ]
+
+def filtered_vector_search(
+    track: str,
+    collection,
+    query_embeddings: List[List[float]],
+    n_results: int,
+    where: Optional[dict],
+    where_document: Optional[dict],
+    allowed: Optional[Set[str]]
+) -> List[List[dict]]:
+    """Vector search limited to the `allowed` ids when the request has filters"""
+    quantized = QUANTIZED_INDEXES.get(track)
+    if allowed is None:
+        if quantized is not None:
+            return quantized_search(collection, quantized, query_embeddings, n_results)
+        return vector_search(collection, query_embeddings, n_results)
+    n_results = min(n_results, len(allowed))
+    if len(allowed) <= FILTER_EXACT_MAX:
+        FILTERED_SEARCHES.inc(len(query_embeddings), path="exact")
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        return [exact_search(collection, allowed, embedding, n_results, space) for embedding in query_embeddings]
+    if quantized is not None:
+        FILTERED_SEARCHES.inc(len(query_embeddings), path="quantized")
+        return quantized_search(collection, quantized, query_embeddings, n_results, allowed)
+    FILTERED_SEARCHES.inc(len(query_embeddings), path="ann")
+    return vector_search(collection, query_embeddings, n_results, where, where_document)
+
+def hybrid_search(
+    track: str,
+    collection,
+    prompts: List[str],
+    query_embeddings: List[List[float]],
+    top_k: int,
+    count: int,
+    where: Optional[dict] = None,
+    where_document: Optional[dict] = None,
+    allowed: Optional[Set[str]] = None
+) -> List[List[dict]]:
+    """Fuse vector and BM25 rankings with reciprocal rank fusion, for each prompt"""
+    n_candidates = min(top_k * HYBRID_CANDIDATES, count if allowed is None else len(allowed))
+    vector_hits = filtered_vector_search(track, collection, query_embeddings, n_candidates, where, where_document, allowed)
+    return [
+        fuse_rankings(track, hits, KEYWORD_INDEXES[track].search(prompt, n_candidates, allowed), top_k)
+        for prompt, hits in zip(prompts, vector_hits)
+    ]
+
+def fuse_rankings(track: str, vector_hits: List[dict], keyword_hits: List[tuple], top_k: int) -> List[dict]:
+    """Reciprocal rank fusion of one prompt's vector hits and BM25 (id, score) hits"""
+    by_id = {hit["id"]: hit for hit in vector_hits}
+    fused = reciprocal_rank_fusion(
+        [[hit["id"] for hit in vector_hits], [doc_id for doc_id, _ in keyword_hits]],
+        k=RRF_K
+    )
+    
+    hits = []
+    for doc_id, score in fused[:top_k]:
+        hit = by_id.get(doc_id)
+        if hit is None:
+            # Keyword-only hit: the BM25 index keeps the text, so no extra Chroma round trip
+            stored = KEYWORD_INDEXES[track].get(doc_id)
+            if stored is None:
+                continue
+            hit = {"id": doc_id, "document": stored[0], "metadata": stored[1], "distance": None}
+        hits.append({**hit, "score": score})
+    return hits
+
+def resolve_tracks(request: GenerateRequest) -> List[str]:
+    """The tracks a request should search: `tracks` (a list or "all") or the single `track`"""
+    if request.tracks is not None:
+        if request.tracks == "all":
+            return list(COLLECTIONS.keys())
+        requested = [request.tracks] if isinstance(request.tracks, str) else request.tracks
+        unknown = [track for track in requested if track not in COLLECTIONS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown tracks: {unknown}. Valid tracks: {list(COLLECTIONS.keys())}"
+            )
+        return list(dict.fromkeys(requested))
+    if request.track and request.track in COLLECTIONS:
+        return [request.track]
+    return []
+
+def hybrid_enabled(request: GenerateRequest) -> bool:
+    """Whether the request fuses BM25 with vector results (its `hybrid`, else RAG_HYBRID_SEARCH)"""
+    return HYBRID_SEARCH if request.hybrid is None else request.hybrid
+
+def fetch_depth(request: GenerateRequest) -> int:
+    """Chunks to retrieve: top_k, or `candidates` when reranking down to top_k"""
+    return max(request.candidates, request.top_k) if request.rerank else request.top_k
+
+def federated_quota(request: GenerateRequest, tracks: List[str]) -> int:
+    """Most hits one track may contribute when several are searched (default: an even share)"""
+    return max(1, request.track_quota or math.ceil(fetch_depth(request) / len(tracks)))
+
+def retrieval_signature(request: GenerateRequest) -> str:
+    """
+    The request's settings that change its retrieved references, as a canonical string
+    
+    Part of the response cache key, the semantic cache scope and the
+    single-flight key, so an answer is only shared between requests that
+    would have been given the same references.
+    """
+    signature = {"context_tokens": context_budget(request), "hybrid": hybrid_enabled(request)}
+    if request.where or request.where_document:
+        signature["where"] = request.where
+        signature["where_document"] = request.where_document
+    if request.rerank:
+        signature["rerank_candidates"] = request.candidates
+    tracks = resolve_tracks(request)
+    if len(tracks) > 1:
+        signature["track_quota"] = federated_quota(request, tracks)
+    return json.dumps(signature, sort_keys=True)
+
+def retrieval_scope(request: GenerateRequest) -> Optional[str]:
+    """Cache scope for a request: the track, or "a+b" for several tracks"""
+    tracks = resolve_tracks(request)
+    if len(tracks) > 1:
+        return "+".join(sorted(tracks))
+    return tracks[0] if tracks else request.track
+
+def search_track(
+    track: str,
+    prompts: List[str],
+    query_embeddings: List[List[float]],
+    top_k: int,
+    hybrid: bool,
+    where: Optional[dict] = None,
+    where_document: Optional[dict] = None
+) -> List[List[dict]]:
+    """
+    Retrieve the top hits from one track for each prompt, tagged with the track name
+    
+    All prompts go to Chroma in a single query, so a batch costs one round
+    trip per track rather than one per prompt.
+    """
+    collection = COLLECTIONS.open(track)
+    count = document_counts.get(track)
+    if count == 0:
+        print(f"⚠️  No documents in {track} collection")
+        return [[] for _ in prompts]
+    # Resolve filters up front so they limit the candidates instead of discarding results after top_k
+    allowed = filter_ids(track, where, where_document) if where or where_document else None
+    if allowed is not None and not allowed:
+        return [[] for _ in prompts]
+    if hybrid:
+        per_prompt = hybrid_search(track, collection, prompts, query_embeddings, top_k, count, where, where_document, allowed)
+    else:
+        # Query vector database with the precomputed prompt embeddings
+        per_prompt = filtered_vector_search(track, collection, query_embeddings, min(top_k, count), where, where_document, allowed)
+    return [[{**hit, "track": track} for hit in hits] for hits in per_prompt]
+
+def merge_federated(per_track: List[List[dict]], top_k: int, quota: int) -> List[dict]:
+    """
+    Merge hits from several tracks by distance, at most `quota` per track
+    
+    Keyword-only hybrid hits have no distance; they rank just behind the
+    weakest vector hit of their own track. If quotas leave fewer than top_k
+    results, the remaining slots are filled by distance regardless of track.
+    """
+    candidates = []
+    for hits in per_track:
+        distances = [hit["distance"] for hit in hits if hit.get("distance") is not None]
+        fallback = max(distances) if distances else float("inf")
+        for rank, hit in enumerate(hits):
+            distance = hit["distance"] if hit.get("distance") is not None else fallback
+            candidates.append((distance, rank, hit))
+    candidates.sort(key=lambda item: (item[0], item[1]))
+    
+    merged, overflow = [], []
+    taken: Dict[str, int] = {}
+    for _, _, hit in candidates:
+        if taken.get(hit["track"], 0) < quota:
+            merged.append(hit)
+            taken[hit["track"]] = taken.get(hit["track"], 0) + 1
+        else:
+            overflow.append(hit)
+        if len(merged) == top_k:
+            return merged
+    return merged + overflow[:top_k - len(merged)]
+
+def hit_to_source(hit: dict) -> dict:
+    """Client-facing source entry for a retrieved chunk"""
+    source = {
+        "id": hit["id"],
+        "content": hit["document"][:200] + "...",  # Preview only
+        "metadata": hit["metadata"],
+        "track": hit["track"]
+    }
+    if "rerank_score" in hit:
+        source["rerank_score"] = round(hit["rerank_score"], 4)
+    return source
+
+async def retrieve_context(request: GenerateRequest, query_embedding: List[float], timings: Optional[RequestTimings] = None):
+    """
+    Query the request's track(s) for the prompt
+    
+    Returns (documents, sources, info). Documents are the packed reference
+    texts for the prompt; info holds "context_usage" and, when the request
+    asked for it, "rerank".
+    """
+    default_embeddings = [query_embedding] if query_embedding is not None else None
+    return (await retrieve_contexts(request, [request.prompt], default_embeddings, timings))[0]
+
+async def retrieve_contexts(
+    request: GenerateRequest,
+    prompts: List[str],
+    default_embeddings: Optional[List[List[float]]],
+    timings: Optional[RequestTimings] = None
+) -> List[tuple]:
+    """
+    retrieve_context for several prompts sharing the request's settings
+    
+    The prompts are embedded together and each track is queried once for
+    all of them; reranking and context packing then run per prompt.
+    """
+    timings = timings or RequestTimings()
+    tracks = resolve_tracks(request)
+    if not tracks:
+        return [([], [], {}) for _ in prompts]
+    
+    use_hybrid = hybrid_enabled(request)
+    fetch_k = fetch_depth(request)
+    
+    # A track's first query opens its collection and builds its keyword index
+    closed = [track for track in tracks if not COLLECTIONS.is_open(track)]
+    if closed:
+        with timings.stage("open_tracks"):
+            await asyncio.gather(*[run_blocking(COLLECTIONS.open, track) for track in closed])
+    with timings.stage("embed"):
+        embeddings = await query_embeddings(prompts, tracks, default_embeddings)
+    
+    # Each collection is queried on its own retrieval thread, so searching
+    # several tracks takes about as long as searching the slowest one
+    with timings.stage("vector_query"):
+        per_track = await asyncio.gather(*[
+            run_blocking(
+                search_track, track, prompts, embeddings[track], fetch_k, use_hybrid,
+                request.where, request.where_document
+            )
+            for track in tracks
+        ])
+    
+    results = []
+    for i, prompt in enumerate(prompts):
+        if len(tracks) == 1:
+            hits = per_track[0][i]
+        else:
+            hits = merge_federated([track_hits[i] for track_hits in per_track], fetch_k, federated_quota(request, tracks))
+        
+        info = {}
+        if request.rerank:
+            with timings.stage("rerank"):
+                hits, info["rerank"] = await run_blocking(reranker.rerank, prompt, hits, request.top_k)
+        
+        # Fit the references into the model's token budget
+        with timings.stage("context_build"):
+            hits, relevant_docs, info["context_usage"] = build_context(hits, prompt, context_budget(request))
+        sources = [hit_to_source(hit) for hit in hits]
+        if hits and len(prompts) == 1:
+            usage = info["context_usage"]
+            print(f"📚 Retrieved {len(relevant_docs)} documents from {', '.join(tracks)}{' (hybrid)' if use_hybrid else ''}"
+                  f"{' (reranked)' if info.get('rerank', {}).get('applied') else ''}"
+                  f" - {usage['tokens_used']}/{usage['budget']} context tokens")
+        results.append((relevant_docs, sources, info))
+    
+    if len(prompts) > 1:
+        print(f"📚 Retrieved references for {len(prompts)} prompts from {', '.join(tracks)}"
+              f"{' (hybrid)' if use_hybrid else ''}")
+    return results
+
+def build_augmented_prompt(prompt: str, relevant_docs: List[str]) -> str:
+    """Wrap the user's prompt with the retrieved reference documents"""
+    if not relevant_docs:
+        return prompt
+    
+    context_text = "\n\n".join([
+        f"Reference {i+1}: {doc}"
+        for i, doc in enumerate(relevant_docs)
+    ])
+    return f"""Using the following reference information from verified sources:
+
+{context_text}
+
+Now, please answer this request:
+
+{prompt}
+
+Provide a comprehensive answer based on the references above and your knowledge. If the references don't fully answer the question, supplement with your general knowledge but indicate which parts came from references."""
+
+def dump_json(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value).encode("utf-8")
+
+def encode_stream_chunk(chunk: dict, sse: bool = False) -> bytes:
+    """Serialize one stream chunk as an NDJSON line or an SSE event"""
+    line = dump_json(chunk)
+    return b"data: " + line + b"\n\n" if sse else line + b"\n"
+
+def encode_context(context: Optional[List[int]], encoding: str = "list") -> Optional[Union[List[int], str]]:
+    """Ollama's context as the client asked for it: the list itself, base64 of packed int32, or nothing"""
+    if context is None or encoding == "list":
+        return context
+    if encoding == "none":
+        return None
+    packed = array("i", context)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode("ascii")
+
+def shape_chunk(chunk: dict, context_encoding: str) -> dict:
+    """A stream chunk with its context re-encoded for one client (chunks can be shared, so copy)"""
+    if context_encoding == "list" or "context" not in chunk:
+        return chunk
+    shaped = {key: value for key, value in chunk.items() if key != "context"}
+    if context_encoding != "none":
+        shaped["context"] = encode_context(chunk["context"], context_encoding)
+    return shaped
+
+def sources_chunk(model: str, sources: List[dict], retrieval_info: Optional[dict] = None) -> dict:
+    """The leading stream chunk: Ollama's chunk shape with an empty response plus sources"""
+    chunk = {
+        "model": model,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "response": "",
+        "done": False,
+        "sources": sources
+    }
+    chunk.update(retrieval_info or {})
+    return chunk
+
+def cache_response(request: GenerateRequest, cache_key: Optional[str], query_embedding, response_text: str, context, sources: List[dict]):
+    """Store a completed generation in the response cache"""
+    if cache_key is None:
+        return
+    response_cache.put(
+        cache_key,
+        request.model,
+        retrieval_scope(request),
+        request.top_k,
+        query_embedding,
+        {"response": response_text, "context": context, "sources": sources},
+        retrieval=retrieval_signature(request)
+    )
+
+async def relay_generation(
+    request: GenerateRequest,
+    augmented_prompt: str,
+    sources: List[dict],
+    cache_key: Optional[str] = None,
+    query_embedding: Optional[List[float]] = None,
+    retrieval_info: Optional[dict] = None,
+    timings: Optional[RequestTimings] = None,
+    session: Optional[dict] = None
+):
+    """
+    Relay Ollama's /api/generate stream as chunk dicts
+    
+    The first chunk carries the retrieved sources (with an empty response) so
+    clients can render citations before the first token arrives. Every
+    following chunk is passed through unchanged, so the stream has the same
+    shape as talking to Ollama directly. The final chunk also carries
+    `timings`.
+    
+    For a session turn, `session` holds the previous turn's context (passed
+    to Ollama) and the references the session has now seen; the final
+    chunk's context is stored for the next turn.
+    """
+    timings = timings or RequestTimings()
+    yield sources_chunk(request.model, sources, retrieval_info)
+    
+    parts = []
+    outcome = "generated"
+    options = {"context": session["context"]} if session and session["context"] else {}
+    try:
+        async for chunk in await ollama_manager.generate(
+            model=request.model,
+            prompt=augmented_prompt,
+            stream=True,
+            **options
+        ):
+            parts.append(chunk.get("response", ""))
+            if chunk.get("done"):
+                cache_response(request, cache_key, query_embedding, "".join(parts), chunk.get("context"), sources)
+                if session is not None:
+                    sessions.save(request.session_id, request.model, chunk.get("context"), session["references"], session["turn"])
+                record_ollama_timings(timings, chunk)
+                chunk["timings"] = timings.as_dict()
+            yield chunk
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        # Headers are already sent, so report the failure the way Ollama does: as a final error chunk
+        outcome = "error"
+        print(f"❌ Streaming error: {str(e)}")
+        yield {"error": str(e)}
+    finally:
+        observe_request(timings, retrieval_scope(request), request.model, outcome)
+
+def cached_chunks(model: str, cached: dict, hit: str) -> List[dict]:
+    """A cached response as stream chunks: sources, the full text, then the done chunk"""
+    created_at = datetime.now(timezone.utc).isoformat()
+    done_chunk = {"model": model, "created_at": created_at, "response": "", "done": True}
+    if cached.get("context") is not None:
+        done_chunk["context"] = cached["context"]
+    return [
+        sources_chunk(model, cached["sources"], {"cache_hit": hit}),
+        {"model": model, "created_at": created_at, "response": cached["response"], "done": False},
+        done_chunk
+    ]
+
+async def stream_cached(request: GenerateRequest, cached: dict, hit: str, sse: bool = False):
+    """Replay a cached response as a stream"""
+    for chunk in cached_chunks(request.model, cached, hit):
+        yield encode_stream_chunk(shape_chunk(chunk, request.context_encoding), sse)
+
+def cached_generate_response(request: GenerateRequest, cached: dict, hit: str, sse: bool, media_type: str, timings: RequestTimings):
+    """Build the /generate reply for a cache hit, streaming or not"""
+    observe_request(timings, retrieval_scope(request), request.model, f"cache_{hit}")
+    if request.stream:
+        return StreamingResponse(stream_cached(request, cached, hit, sse=sse), media_type=media_type)
+    return GenerateResponse(
+        response=cached["response"],
+        model=request.model,
+        done=True,
+        context=encode_context(cached.get("context"), request.context_encoding),
+        sources=cached["sources"] if cached["sources"] else None,
+        cache_hit=hit,
+        timings=timings.as_dict()
+    )
+
+def continue_session(session_id: str, model: str, relevant_docs: List[str], sources: List[dict]):
+    """
+    Look up a session and drop the references its context already holds
+
+    Returns (session, documents): the documents still to be added to the
+    prompt, and the session state for relay_generation, including the
+    client-facing "info".
+    """
+    previous = sessions.get(session_id, model)
+    seen = previous["references"] if previous else set()
+    new = [(doc, source["id"]) for doc, source in zip(relevant_docs, sources) if source["id"] not in seen]
+    session = {
+        "context": previous["context"] if previous else None,
+        "references": seen.union(doc_id for _, doc_id in new),
+        "turn": (previous["turns"] if previous else 0) + 1
+    }
+    session["info"] = {
+        "id": session_id,
+        "turn": session["turn"],
+        "context_tokens_reused": len(previous["context"]) if previous else 0,
+        "references_reused": len(relevant_docs) - len(new),
+        "references_added": len(new)
+    }
+    if previous:
+        print(f"🧵 Session turn {session['turn']}: reusing {len(previous['context'])} context tokens, "
+              f"{len(new)} new reference(s)")
+    return session, [doc for doc, _ in new]
+
+async def generation_chunks(
+    request: GenerateRequest,
+    tracks: List[str],
+    scope: Optional[str],
+    use_cache: bool,
+    cache_key: Optional[str],
+    timings: RequestTimings
+):
+    """
+    Everything /generate does after the exact cache check, as a chunk stream
+    
+    This is the producer of a single-flight: it runs once per distinct
+    in-flight request, and every identical request replays its chunks.
+    Errors raised before the first chunk (such as a 429 from the scheduler)
+    reach every waiting client as their HTTP status.
+    """
+    # 1. Embed the prompt once; the embedding drives both the semantic cache and
+    #    retrieval (tracks with their own embedding model embed it again)
+    query_embedding = None
+    default_model = any(COLLECTIONS.settings(track).embedding_model == DEFAULT_EMBEDDING_MODEL for track in tracks)
+    if default_model or (use_cache and response_cache.semantic):
+        with timings.stage("embed"):
+            query_embedding = (await embedding_service.embed([request.prompt]))[0]
+    
+    if use_cache:
+        cached, similarity = response_cache.get_semantic(
+            request.model, scope, request.top_k, query_embedding, retrieval=retrieval_signature(request)
+        )
+        if cached is not None:
+            print(f"♻️  Semantic cache hit (similarity {similarity:.3f})")
+            observe_request(timings, scope, request.model, "cache_semantic")
+            chunks = cached_chunks(request.model, cached, "semantic")
+            chunks[-1]["timings"] = timings.as_dict()
+            for chunk in chunks:
+                yield chunk
+            return
+    
+    # 2. Retrieve relevant context from the vector database(s) (off the event loop),
+    #    unless the generation queue is full: then the 429 comes before any retrieval work
+    check_generation_admission(request, timings)
+    relevant_docs, sources, retrieval_info = await retrieve_context(request, query_embedding, timings)
+    
+    # 3. Augment prompt with retrieved context (in a session, only references it hasn't seen)
+    session = None
+    if request.session_id:
+        session, relevant_docs = continue_session(request.session_id, request.model, relevant_docs, sources)
+        retrieval_info["session"] = session["info"]
+    augmented_prompt = build_augmented_prompt(request.prompt, relevant_docs)
+    
+    # 4. Generate response with Ollama
+    async with await acquire_generation_slot(request, timings):
+        print(f"🤖 Generating with model: {request.model}")
+        async for chunk in relay_generation(
+            request, augmented_prompt, sources,
+            cache_key=cache_key, query_embedding=query_embedding,
+            retrieval_info=retrieval_info, timings=timings, session=session
+        ):
+            yield chunk
+
+async def stream_flight(flight, subscription, sse: bool = False, context_encoding: str = "list"):
+    """Encode a flight's chunks for the client"""
+    try:
+        async for chunk in flight.stream(subscription):
+            yield encode_stream_chunk(shape_chunk(chunk, context_encoding), sse)
+    except Exception as e:
+        yield encode_stream_chunk({"error": str(e)}, sse)
+
+def collect_chunks(chunks: List[dict]) -> dict:
+    """Fold a chunk stream back into the fields of a non-streaming reply"""
+    head, last = chunks[0], chunks[-1]
+    return {
+        "response": "".join(chunk.get("response", "") for chunk in chunks[1:]),
+        "context": last.get("context"),
+        "sources": head.get("sources") or None,
+        "cache_hit": head.get("cache_hit"),
+        "rerank": head.get("rerank"),
+        "context_usage": head.get("context_usage"),
+        "session": head.get("session"),
+        "timings": last.get("timings")
+    }
+
+def check_filters(request: Union[GenerateRequest, "BatchGenerateRequest"]):
+    """Validate a request's retrieval filters (400 if invalid) and normalize `where`"""
+    try:
+        if request.where:
+            validate_where(request.where)
+            request.where = normalize_where(request.where)
+        if request.where_document:
+            validate_where_document(request.where_document)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {e}")
+
 # RAG Endpoints
-@app.post("/generate", response_model=GenerateResponse)
-async def generate_with_rag(request: GenerateRequest):
+@router.post("/generate", response_model=GenerateResponse, dependencies=[Depends(require_services)])
+async def generate_with_rag(request: GenerateRequest, http_request: Request):
     """
     Generate content with RAG enhancement
     
@@ -96,81 +1302,510 @@ async def generate_with_rag(request: GenerateRequest):
     2. Query vector database for relevant documents
     3. Augment prompt with retrieved context
     4. Generate response with Ollama
+    
+    With stream=true the response is newline-delimited JSON in Ollama's
+    /api/generate chunk format (or Server-Sent Events when the client sends
+    Accept: text/event-stream), starting with a chunk that carries `sources`.
+    
+    Stage latencies are returned in `timings` and recorded on /metrics.
+    
+    Generations are admitted by the scheduler: when the queue is full, or no
+    slot frees up before the request's deadline, the reply is 429 with a
+    Retry-After header.
+    
+    `where` / `where_document` restrict retrieval to matching chunks
+    (Chroma filter syntax) before the top_k are chosen.
+    
+    Identical requests (same model, track(s), top_k, normalized prompt and
+    retrieval settings: filters, hybrid, rerank, context budget, track quota)
+    that arrive while one is already running join it instead of starting
+    their own generation; streaming clients receive the same chunks. This
+    is independent of the response cache, so it also applies with
+    cache=false or RAG_RESPONSE_CACHE_SIZE=0.
+    
+    With a `session_id`, the service keeps Ollama's context between turns
+    and passes it back, so follow-up questions only send the new question
+    (plus any references retrieved for the first time in the session).
+    Session turns bypass the response cache and are never coalesced.
     """
+    timings = RequestTimings()
+    if request.priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority: {request.priority}. Valid priorities: {list(PRIORITIES)}")
+    check_filters(request)
+    if request.context_encoding not in CONTEXT_ENCODINGS:
+        raise HTTPException(status_code=400, detail=f"Unknown context_encoding: {request.context_encoding}. Valid: {list(CONTEXT_ENCODINGS)}")
+    if request.session_id is not None:
+        if not request.session_id or len(request.session_id) > SESSION_ID_MAX_LENGTH:
+            raise HTTPException(status_code=400, detail=f"session_id must be 1-{SESSION_ID_MAX_LENGTH} characters")
+        if not sessions.enabled:
+            request.session_id = None
     try:
-        # 1. Retrieve relevant context from vector database
-        relevant_docs = []
-        sources = []
+        sse = "text/event-stream" in http_request.headers.get("accept", "")
+        media_type = "text/event-stream" if sse else "application/x-ndjson"
+        # A session turn's answer depends on the conversation so far, so it is neither cached nor shared
+        use_cache = request.cache and response_cache.enabled and not request.session_id
+        cache_key = None
+        tracks = resolve_tracks(request)
+        scope = retrieval_scope(request)
+        if request.top_k is None:
+            request.top_k = COLLECTIONS.config.default_top_k(tracks)
+        request_key = None
+        if not request.session_id:
+            request_key = ResponseCache.make_key(request.model, scope, request.top_k, request.prompt, retrieval_signature(request))
+        
+        # 0. Serve repeated prompts from the response cache (exact match needs no embedding)
+        if use_cache:
+            cache_key = request_key
+            cached = response_cache.get_exact(cache_key)
+            if cached is not None:
+                return cached_generate_response(request, cached, "exact", sse, media_type, timings)
+        
+        # 1-4. Retrieve and generate, or join an identical generation already in flight.
+        # The key covers the whole retrieval signature, so only requests that
+        # would be given the same references share a generation.
+        flight, subscription, leader = single_flight.join(
+            request_key,
+            lambda: generation_chunks(request, tracks, scope, use_cache, cache_key, timings)
+        )
+        try:
+            await flight.first()
+        except BaseException:
+            subscription.leave()
+            raise
+        if not leader:
+            print(f"🔗 Joined in-flight generation ({flight.subscribers} clients sharing it)")
+            observe_request(timings, scope, request.model, "coalesced")
+        
+        if request.stream:
+            # The background task covers clients that disconnect before the stream starts
+            return StreamingResponse(
+                stream_flight(flight, subscription, sse=sse, context_encoding=request.context_encoding),
+                media_type=media_type,
+                background=BackgroundTask(subscription.leave)
+            )
+        
+        chunks = [chunk async for chunk in flight.stream(subscription)]
+        if "error" in chunks[-1]:
+            raise HTTPException(status_code=500, detail=chunks[-1]["error"])
         
-        if request.track and request.track in COLLECTIONS:
-            collection = COLLECTIONS[request.track]
+        started = time.perf_counter()
+        reply = collect_chunks(chunks)
+        reply["context"] = encode_context(reply["context"], request.context_encoding)
+        result = GenerateResponse(
+            model=request.model,
+            done=True,
+            coalesced=True if not leader else None,
+            **reply
+        )
+        body = dump_json(result.model_dump()) if orjson is not None else result.model_dump_json()
+        observe_stage(scope, request.model, "serialization", time.perf_counter() - started)
+        return Response(body, media_type="application/json")
             
-            if collection.count() > 0:
-                # Query vector database (ChromaDB handles embedding automatically with embedding_function)
-                results = collection.query(
-                    query_texts=[request.prompt],
-                    n_results=min(request.top_k, collection.count())
-                )
-                
-                if results['documents'] and results['documents'][0]:
-                    relevant_docs = results['documents'][0]
-                    sources = [
-                        {
-                            "content": doc[:200] + "...",  # Preview only
-                            "metadata": meta
-                        }
-                        for doc, meta in zip(
-                            results['documents'][0],
-                            results['metadatas'][0]
-                        )
-                    ]
-                    print(f"📚 Retrieved {len(relevant_docs)} documents for track '{request.track}'")
-            else:
-                print(f"⚠️  No documents in {request.track} collection")
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Generation error: {str(e)}")
+        observe_request(timings, retrieval_scope(request), request.model, "error")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Batch generation
+def batch_template(batch: BatchGenerateRequest, prompt: str = "") -> GenerateRequest:
+    """The /generate request a batch item stands for (its retrieval settings, background priority)"""
+    return GenerateRequest(prompt=prompt, priority="background", **batch.model_dump(exclude={"items", "concurrency", "publish"}))
+
+async def acquire_batch_slot(request: GenerateRequest, timings: RequestTimings):
+    """Wait for a background generation slot; batch work retries after Retry-After instead of failing"""
+    while True:
+        try:
+            with timings.stage("queue_wait"):
+                return await generation_scheduler.acquire(request.model, "background", QUEUE_TIMEOUTS["background"])
+        except SchedulerRejected as e:
+            await asyncio.sleep(e.retry_after)
+
+async def generate_batch_item(
+    job_id: str,
+    request: GenerateRequest,
+    position: int,
+    retrieved: tuple,
+    query_embedding: Optional[List[float]],
+    slots: asyncio.Semaphore,
+    publish_as: Optional[str] = None
+):
+    """Generate one batch item and record its result (or error) in the job store"""
+    timings = RequestTimings()
+    relevant_docs, sources, info = retrieved
+    try:
+        if await run_blocking(batch_store.status, job_id) != "running":
+            return  # Cancelled while queued
+        async with await acquire_batch_slot(request, timings):
+            response = await ollama_manager.generate(
+                model=request.model,
+                prompt=build_augmented_prompt(request.prompt, relevant_docs),
+                stream=False
+            )
+        record_ollama_timings(timings, response)
+        if request.cache and response_cache.enabled:
+            cache_key = ResponseCache.make_key(
+                request.model, retrieval_scope(request), request.top_k, request.prompt, retrieval_signature(request)
+            )
+            cache_response(request, cache_key, query_embedding, response["response"], response.get("context"), sources)
+        result = {"response": response["response"], "sources": sources or None, **info, "timings": timings.as_dict()}
+        if publish_as:
+            entry = await run_blocking(
+                publish_content, request.track, publish_as, request.model, request.prompt, response["response"], sources
+            )
+            result["content_etag"] = f'"{entry["digest"]}"'
+        await run_blocking(batch_store.finish_item, job_id, position, result)
+        observe_request(timings, retrieval_scope(request), request.model, "batch")
+    except asyncio.CancelledError:
+        raise  # Worker shutting down: the item stays pending and runs when the job is resumed
+    except Exception as e:
+        print(f"❌ Batch {job_id} item {position}: {e}")
+        await run_blocking(batch_store.finish_item, job_id, position, error=str(e))
+        observe_request(timings, retrieval_scope(request), request.model, "error")
+    finally:
+        slots.release()
+
+async def run_batch_job(job_id: str):
+    """
+    Work through a batch job's pending items
+    
+    Items are embedded and retrieved in groups (one embedding batch and one
+    Chroma query per track for the whole group), then generated with at most
+    the job's concurrency in flight. The next group is retrieved only once
+    the previous one's generations have all started.
+    """
+    generations = []
+    try:
+        job = await run_blocking(batch_store.job, job_id)
+        batch = BatchGenerateRequest(items=[], **job["request"])
+        template = batch_template(batch)
+        pending = await run_blocking(batch_store.pending_items, job_id)
+        if not await run_blocking(batch_store.set_status, job_id, "running"):
+            return
+        concurrency = min(batch.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+        print(f"📦 Batch {job_id}: {len(pending)} prompts for {batch.model}, {concurrency} at a time")
+        slots = asyncio.Semaphore(concurrency)
+        tracks = resolve_tracks(template)
+        default_model = any(COLLECTIONS.settings(track).embedding_model == DEFAULT_EMBEDDING_MODEL for track in tracks)
+        
+        for start in range(0, len(pending), BATCH_RETRIEVAL_SIZE):
+            if await run_blocking(batch_store.status, job_id) != "running":
+                break
+            group = pending[start:start + BATCH_RETRIEVAL_SIZE]
+            prompts = [item["prompt"] for item in group]
+            embeddings = None
+            if default_model or (batch.cache and response_cache.semantic):
+                embeddings = await embedding_service.embed(prompts)
+            retrieved = await retrieve_contexts(template, prompts, embeddings)
+            for i, item in enumerate(group):
+                await slots.acquire()
+                generations.append(asyncio.create_task(generate_batch_item(
+                    job_id, batch_template(batch, item["prompt"]), item["position"], retrieved[i],
+                    embeddings[i] if embeddings else None, slots,
+                    publish_as=item["key"] if batch.publish else None
+                )))
         
-        # 2. Augment prompt with retrieved context
-        augmented_prompt = request.prompt
-        if relevant_docs:
-            context_text = "\n\n".join([
-                f"Reference {i+1}: {doc}"
-                for i, doc in enumerate(relevant_docs)
-            ])
-            augmented_prompt = f"""Using the following reference information from verified sources:
+        await asyncio.gather(*generations)
+        if await run_blocking(batch_store.set_status, job_id, "completed"):
+            job = await run_blocking(batch_store.job, job_id)
+            print(f"📦 Batch {job_id} completed: {job['completed']} done, {job['failed']} failed")
+    except asyncio.CancelledError:
+        for task in generations:
+            task.cancel()
+        raise
+    except Exception as e:
+        print(f"❌ Batch {job_id} failed: {e}")
+        await run_blocking(batch_store.set_status, job_id, "failed", str(e))
+    finally:
+        batch_tasks.pop(job_id, None)
 
-{context_text}
+def start_batch_job(job_id: str):
+    if job_id not in batch_tasks:
+        batch_tasks[job_id] = asyncio.create_task(run_batch_job(job_id))
 
-Now, please answer this request:
+def batch_summary(job: dict) -> dict:
+    """Client-facing job status"""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "total": job["total"],
+        "completed": job["completed"],
+        "failed": job["failed"],
+        "pending": job["pending"],
+        "error": job["error"],
+        "created": datetime.fromtimestamp(job["created"], timezone.utc).isoformat(),
+        "updated": datetime.fromtimestamp(job["updated"], timezone.utc).isoformat(),
+        "model": job["request"].get("model"),
+        "track": job["request"].get("tracks") or job["request"].get("track")
+    }
 
-{request.prompt}
+async def get_batch_job(job_id: str) -> dict:
+    job = await run_blocking(batch_store.job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Batch job '{job_id}' not found")
+    return job
 
-Provide a comprehensive answer based on the references above and your knowledge. If the references don't fully answer the question, supplement with your general knowledge but indicate which parts came from references."""
+@router.post("/generate/batch", status_code=202, dependencies=[Depends(require_services)])
+async def submit_batch(batch: BatchGenerateRequest):
+    """
+    Queue prompts for offline generation (e.g. a cohort's modules and quizzes)
+    
+    Every item is run through the same retrieval settings as /generate, in
+    bulk, and generated at background priority with bounded concurrency.
+    Results are stored on disk: poll GET /generate/batch/{job_id}/results or
+    follow GET /generate/batch/{job_id}/stream. With cache=true they also
+    land in the response cache, so the app's later /generate calls for the
+    same prompts are served without generating.
+    """
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="A batch needs at least one item")
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can have at most {BATCH_MAX_ITEMS} items")
+    check_filters(batch)
+    if batch.publish:
+        if not batch.track or batch.tracks is not None or batch.track not in COLLECTIONS:
+            raise HTTPException(status_code=400, detail="publish needs a single configured `track`")
+        invalid = [item.key for item in batch.items if item.key is None or not TOPIC_NAME.match(item.key)]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"publish needs every item to have a topic-style key; invalid: {invalid[:5]}")
+    tracks = resolve_tracks(batch_template(batch))
+    if batch.top_k is None:
+        batch.top_k = COLLECTIONS.config.default_top_k(tracks)
+    
+    job_id = uuid.uuid4().hex
+    await run_blocking(
+        batch_store.create,
+        job_id,
+        batch.model_dump(exclude={"items"}),
+        [(item.key, item.prompt) for item in batch.items]
+    )
+    start_batch_job(job_id)
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "total": len(batch.items),
+        "status_url": f"/generate/batch/{job_id}",
+        "results_url": f"/generate/batch/{job_id}/results",
+        "stream_url": f"/generate/batch/{job_id}/stream"
+    }
 
-        # 3. Generate response with Ollama
-        print(f"🤖 Generating with model: {request.model}")
-        response = ollama.generate(
-            model=request.model,
-            prompt=augmented_prompt,
-            stream=request.stream
+@router.get("/generate/batch", dependencies=[Depends(require_services)])
+async def list_batches(limit: int = 50):
+    """Recent batch jobs, newest first"""
+    return {"jobs": [batch_summary(job) for job in await run_blocking(batch_store.jobs, limit)]}
+
+@router.get("/generate/batch/{job_id}", dependencies=[Depends(require_services)])
+async def batch_status(job_id: str):
+    """A batch job's progress"""
+    return batch_summary(await get_batch_job(job_id))
+
+@router.get("/generate/batch/{job_id}/results", dependencies=[Depends(require_services)])
+async def batch_results(job_id: str, after: int = 0, limit: int = 100):
+    """
+    Finished items in completion order
+    
+    Each result has a `seq` number; pass the last one seen as `after` to get
+    only newer results. `done` is true once the job has finished and every
+    result has been returned.
+    """
+    job = await get_batch_job(job_id)
+    results = await run_blocking(batch_store.results, job_id, after, min(max(1, limit), 1000))
+    next_after = results[-1]["seq"] if results else after
+    return {
+        **batch_summary(job),
+        "results": results,
+        "next_after": next_after,
+        "done": job["status"] not in ("queued", "running") and next_after >= job["completed"] + job["failed"]
+    }
+
+async def stream_batch(job_id: str, after: int):
+    """NDJSON: each result as it finishes, then the final job status"""
+    while True:
+        job = await run_blocking(batch_store.job, job_id)
+        results = await run_blocking(batch_store.results, job_id, after, 100)
+        for result in results:
+            yield encode_stream_chunk(result)
+        if results:
+            after = results[-1]["seq"]
+            continue
+        if job["status"] not in ("queued", "running"):
+            yield encode_stream_chunk({**batch_summary(job), "done": True})
+            return
+        await asyncio.sleep(0.5)
+
+@router.get("/generate/batch/{job_id}/stream", dependencies=[Depends(require_services)])
+async def batch_stream(job_id: str, after: int = 0):
+    """Follow a batch job: results are streamed as newline-delimited JSON as they finish"""
+    await get_batch_job(job_id)
+    return StreamingResponse(stream_batch(job_id, after), media_type="application/x-ndjson")
+
+@router.delete("/generate/batch/{job_id}", dependencies=[Depends(require_services)])
+async def cancel_batch(job_id: str):
+    """Cancel a batch job; generations already running finish and are kept"""
+    await get_batch_job(job_id)
+    if not await run_blocking(batch_store.set_status, job_id, "cancelled"):
+        raise HTTPException(status_code=409, detail=f"Batch job '{job_id}' has already finished")
+    return {"status": "success", "message": f"Batch job '{job_id}' cancelled"}
+
+# Precomputed content
+def corpus_version(track: str) -> str:
+    """The track's corpus version: a digest of its chunk ids, which are hashes of the chunk text (blocking)"""
+    COLLECTIONS.open(track)
+    return FILTER_INDEXES[track].fingerprint()
+
+def publish_content(track: str, topic: str, model: str, prompt: str, response_text: str, sources: List[dict],
+                    version: Optional[str] = None) -> dict:
+    """Store a generated artifact under the track's corpus version (blocking)"""
+    version = version or corpus_version(track)
+    body = json.dumps({
+        "track": track,
+        "topic": topic,
+        "model": model,
+        "corpus_version": version,
+        "prompt": prompt,
+        "response": response_text,
+        "sources": sources or None,
+        "generated_at": datetime.now(timezone.utc).isoformat()
+    }).encode("utf-8")
+    return content_store.put(track, topic, model, version, body)
+
+def check_content_path(track: str, topic: Optional[str] = None):
+    if track not in COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"Track '{track}' not found")
+    if topic is not None and not TOPIC_NAME.match(topic):
+        raise HTTPException(status_code=400, detail="Topic must be 1-128 letters, digits, '_', '-', '.' or ':'")
+
+def content_headers(entry: dict, stale: bool) -> Dict[str, str]:
+    return {
+        "ETag": f'"{entry["digest"]}"',
+        "Cache-Control": "no-cache",  # Clients keep the artifact but revalidate it (304 when unchanged)
+        "Vary": "Accept-Encoding",
+        "X-Corpus-Version": entry["corpus_version"],
+        "X-Content-Stale": "true" if stale else "false"
+    }
+
+@router.get("/content/{track}", dependencies=[Depends(require_services)])
+async def list_content(track: str):
+    """Stored artifacts of a track (latest per topic and model), and whether they match its current corpus"""
+    check_content_path(track)
+    version = await run_blocking(corpus_version, track)
+    topics = await run_blocking(content_store.topics, track)
+    return {
+        "track": track,
+        "corpus_version": version,
+        "topics": [{**entry, "etag": f'"{entry["digest"]}"', "current": entry["corpus_version"] == version} for entry in topics]
+    }
+
+@router.get("/content/{track}/{topic}", dependencies=[Depends(require_services)])
+async def get_content(track: str, topic: str, http_request: Request, model: str = "gpt-oss:20b", allow_stale: bool = False):
+    """
+    Read a stored artifact for the track's current corpus version
+    
+    Supports conditional GET: a request whose If-None-Match names the
+    current ETag gets 304 with no body. The body is sent brotli- or
+    gzip-compressed when the client accepts it. With allow_stale=true, the
+    newest artifact from an older corpus version is served (marked by
+    X-Content-Stale) instead of 404.
+    """
+    check_content_path(track, topic)
+    version = await run_blocking(corpus_version, track)
+    entry = await run_blocking(content_store.lookup, track, topic, model, version)
+    stale = False
+    if entry is None and allow_stale:
+        entry = await run_blocking(content_store.lookup, track, topic, model)
+        stale = entry is not None
+    if entry is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No '{topic}' content for {track} with {model} at corpus version {version}; PUT it to generate"
         )
-        
-        if request.stream:
-            # Streaming not implemented in this version
-            # You would use StreamingResponse here
-            raise HTTPException(status_code=501, detail="Streaming not yet implemented")
-        else:
-            return GenerateResponse(
-                response=response['response'],
+    
+    headers = content_headers(entry, stale)
+    matches = parse_etags(http_request.headers.get("if-none-match"))
+    if entry["digest"] in matches or "*" in matches:
+        return Response(status_code=304, headers=headers)
+    
+    encoding = choose_encoding(http_request.headers.get("accept-encoding"), await run_blocking(content_store.encodings, entry["digest"]))
+    body = await run_blocking(content_store.read, entry["digest"], encoding)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+        headers["ETag"] = f'"{entry["digest"]}-{encoding}"'
+    return Response(body, media_type=entry["content_type"], headers=headers)
+
+@router.put("/content/{track}/{topic}", dependencies=[Depends(require_services)])
+async def put_content(track: str, topic: str, content_request: ContentRequest):
+    """
+    Generate an artifact for the track's current corpus version and store it
+    
+    If the current version already has it (and regenerate is false), nothing
+    is generated. Returns the artifact's ETag either way.
+    """
+    check_content_path(track, topic)
+    check_filters(content_request)
+    version = await run_blocking(corpus_version, track)
+    if not content_request.regenerate:
+        entry = await run_blocking(content_store.lookup, track, topic, content_request.model, version)
+        if entry is not None:
+            return {"track": track, "topic": topic, "model": entry["model"], "corpus_version": version,
+                    "etag": f'"{entry["digest"]}"', "size": entry["size"], "generated": False}
+    
+    request = GenerateRequest(
+        track=track,
+        **content_request.model_dump(exclude={"regenerate"})
+    )
+    if request.top_k is None:
+        request.top_k = COLLECTIONS.settings(track).top_k
+    timings = RequestTimings()
+    try:
+        relevant_docs, sources, _ = await retrieve_context(request, None, timings)
+        async with await acquire_generation_slot(request, timings):
+            print(f"🤖 Generating {track}/{topic} with model: {request.model}")
+            response = await ollama_manager.generate(
                 model=request.model,
-                done=True,
-                context=response.get('context'),
-                sources=sources if sources else None
+                prompt=build_augmented_prompt(request.prompt, relevant_docs),
+                stream=False
             )
-            
+        record_ollama_timings(timings, response)
+        entry = await run_blocking(
+            publish_content, track, topic, request.model, request.prompt, response["response"], sources, version
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Generation error: {str(e)}")
+        print(f"❌ Content generation error: {str(e)}")
+        observe_request(timings, track, request.model, "error")
+        raise HTTPException(status_code=500, detail=str(e))
+    observe_request(timings, track, request.model, "content")
+    return JSON_RESPONSE(status_code=201, content={
+        "track": track, "topic": topic, "model": request.model, "corpus_version": version,
+        "etag": f'"{entry["digest"]}"', "size": entry["size"], "generated": True, "timings": timings.as_dict()
+    })
+
+@router.post("/embed", dependencies=[Depends(require_services)])
+async def embed_texts(embed_request: EmbedRequest):
+    """
+    Embed a batch of texts with the service's embedding model
+    
+    Uses the same cached, batched embedding layer as /generate, so other
+    services can share one ONNX model instead of loading their own.
+    """
+    if not embed_request.texts:
+        raise HTTPException(status_code=400, detail="texts must not be empty")
+    
+    try:
+        embeddings = await embedding_service.embed(embed_request.texts, use_cache=embed_request.use_cache)
+        return {
+            "embeddings": embeddings,
+            "model": embedding_service.name,
+            "dimension": len(embeddings[0]) if embeddings else 0,
+            "count": len(embeddings)
+        }
+    except Exception as e:
+        print(f"❌ Embedding error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/add_document")
+@router.post("/add_document", dependencies=[Depends(require_services)])
 async def add_document(doc_request: DocumentRequest):
     """
     Add a document to the knowledge base for a specific track
@@ -187,17 +1822,23 @@ async def add_document(doc_request: DocumentRequest):
                 detail=f"Unknown track: {doc_request.track}. Valid tracks: {list(COLLECTIONS.keys())}"
             )
         
-        collection = COLLECTIONS[doc_request.track]
+        collection = await run_blocking(COLLECTIONS.open, doc_request.track)
         
-        # Generate unique ID
-        doc_id = f"{doc_request.track}_{collection.count() + 1}"
+        # Content-hash ID: stable across retries, so re-adding the same text is a no-op
+        doc_id = chunk_id(doc_request.track, doc_request.content)
+        metadata = {**doc_request.metadata, "content_hash": content_hash(doc_request.content)}
         
         # Add to vector database (ChromaDB handles embedding automatically with embedding_function)
-        collection.add(
+        await run_blocking(
+            collection.upsert,
             documents=[doc_request.content],
-            metadatas=[doc_request.metadata],
+            metadatas=[metadata],
             ids=[doc_id]
         )
+        await run_blocking(index_chunks, doc_request.track, [doc_id], [doc_request.content], [metadata])
+        sync_document_count(doc_request.track)
+        
+        publish_track_change(doc_request.track)
         
         print(f"✅ Added document to {doc_request.track}: {doc_request.metadata.get('title', 'Untitled')}")
         
@@ -207,72 +1848,524 @@ async def add_document(doc_request: DocumentRequest):
             "document_id": doc_id
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error adding document: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/health")
-async def health_check():
-    """Check if RAG service is running and healthy"""
-    collections_status = {}
-    for track, collection in COLLECTIONS.items():
+# Bulk ingestion
+# Chunks are embedded and written to Chroma INGEST_BATCH_SIZE at a time, so a
+# whole manual costs a few large ONNX batches instead of one call per page.
+INGEST_BATCH_SIZE = int(os.environ.get("RAG_INGEST_BATCH_SIZE", "256"))
+
+def apply_track_chunking(track: str, request: Union["BulkDocumentRequest", "ReindexRequest"]):
+    """Fill in the chunk settings a request left unset from the track's configuration"""
+    settings = COLLECTIONS.settings(track)
+    if request.chunk_size is None:
+        request.chunk_size = settings.chunk_size
+    if request.chunk_overlap is None:
+        request.chunk_overlap = settings.chunk_overlap
+
+def upsert_chunks(track: str, collection, ids: List[str], texts: List[str], metadatas: List[dict]) -> int:
+    """Embed and upsert chunks INGEST_BATCH_SIZE at a time; returns the number of batches"""
+    embedder = embedding_service_for(COLLECTIONS.settings(track).embedding_model)
+    batches = 0
+    for start in range(0, len(ids), INGEST_BATCH_SIZE):
+        end = start + INGEST_BATCH_SIZE
+        embeddings = embedder.embed_sync(texts[start:end], use_cache=False)
+        collection.upsert(
+            ids=ids[start:end],
+            embeddings=embeddings,
+            documents=texts[start:end],
+            metadatas=metadatas[start:end]
+        )
+        index_chunks(track, ids[start:end], texts[start:end], metadatas[start:end], embeddings)
+        sync_document_count(track)
+        batches += 1
+    return batches
+
+def ingest_documents(collection, bulk_request: BulkDocumentRequest) -> dict:
+    """
+    Chunk, embed and upsert a batch of documents (runs on the retrieval pool)
+    
+    Every chunk gets a content-hash id, so ingesting the same material twice
+    overwrites instead of duplicating.
+    """
+    ids, texts, metadatas = [], [], []
+    document_ids = []
+    seen = set()
+    
+    for doc in bulk_request.documents:
+        if bulk_request.chunk:
+            chunks = chunk_text(doc.content, bulk_request.chunk_size, bulk_request.chunk_overlap)
+        else:
+            chunks = [doc.content] if doc.content.strip() else []
+        parent_hash = content_hash(doc.content)
+        chunk_ids = []
+        for index, text in enumerate(chunks):
+            doc_id = chunk_id(bulk_request.track, text)
+            chunk_ids.append(doc_id)
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            ids.append(doc_id)
+            texts.append(text)
+            # Pre-chunked uploads (chunk=false) may supply their own chunk_index/parent_hash
+            metadatas.append({
+                "chunk_index": index,
+                "chunk_count": len(chunks),
+                "parent_hash": parent_hash,
+                **doc.metadata,
+                "content_hash": content_hash(text)
+            })
+        document_ids.append(chunk_ids)
+    
+    batches = upsert_chunks(bulk_request.track, collection, ids, texts, metadatas)
+    
+    return {
+        "documents": len(bulk_request.documents),
+        "chunks": len(ids),
+        "batches": batches,
+        "document_ids": document_ids
+    }
+
+@router.post("/add_documents", dependencies=[Depends(require_services)])
+async def add_documents(bulk_request: BulkDocumentRequest):
+    """
+    Add many documents to a track's knowledge base in one call
+    
+    Documents are split into overlapping chunks, embedded in large batches and
+    upserted with content-hash ids, which makes re-ingestion idempotent.
+    `document_ids` lists the chunk ids created for each input document.
+    """
+    if bulk_request.track not in COLLECTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown track: {bulk_request.track}. Valid tracks: {list(COLLECTIONS.keys())}"
+        )
+    apply_track_chunking(bulk_request.track, bulk_request)
+    if bulk_request.chunk and bulk_request.chunk_overlap >= bulk_request.chunk_size:
+        raise HTTPException(status_code=400, detail="chunk_overlap must be smaller than chunk_size")
+    
+    try:
+        collection = await run_blocking(COLLECTIONS.open, bulk_request.track)
+        result = await run_blocking(ingest_documents, collection, bulk_request)
+        publish_track_change(bulk_request.track)
+        
+        print(f"✅ Ingested {result['documents']} documents ({result['chunks']} chunks) into {bulk_request.track}")
+        
+        return {
+            "status": "success",
+            "message": f"{result['chunks']} chunks added to {bulk_request.track} knowledge base",
+            **result
+        }
+        
+    except Exception as e:
+        print(f"❌ Error adding documents: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Incremental re-indexing
+# Each chunk written by /reindex carries `source` and `source_hash` metadata.
+# A refresh re-embeds only sources whose hash changed, writes the new chunks
+# first and only then deletes (tombstones) chunks that no longer belong to any
+# current source, so the track never goes without context mid-refresh.
+REINDEX_PAGE_SIZE = 5000
+
+def load_source_index(collection, sources: Optional[List[str]] = None) -> Dict[str, dict]:
+    """Map each stored source to its chunk ids and source hash"""
+    index: Dict[str, dict] = {}
+    
+    def collect(result):
+        for doc_id, meta in zip(result["ids"], result["metadatas"]):
+            source = (meta or {}).get("source")
+            if source is None:
+                continue
+            entry = index.setdefault(source, {"ids": [], "source_hash": None})
+            entry["ids"].append(doc_id)
+            entry["source_hash"] = entry["source_hash"] or meta.get("source_hash")
+    
+    if sources is not None:
+        for start in range(0, len(sources), REINDEX_PAGE_SIZE):
+            names = sources[start:start + REINDEX_PAGE_SIZE]
+            if names:
+                collect(collection.get(where={"source": {"$in": names}}, include=["metadatas"]))
+        return index
+    
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=REINDEX_PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        collect(page)
+        offset += len(page["ids"])
+    return index
+
+def reindex_track(collection, track: str, reindex_request: ReindexRequest) -> dict:
+    """Apply a set of source changes to a track's collection (runs on the retrieval pool)"""
+    names = [src.source for src in reindex_request.sources]
+    lookup = None if reindex_request.prune else names + list(reindex_request.removed)
+    stored = load_source_index(collection, lookup)
+    
+    ids, texts, metadatas = [], [], []
+    keep_ids = set()
+    stale_ids = set()
+    added = updated = unchanged = 0
+    
+    for src in reindex_request.sources:
+        if src.chunks is not None:
+            chunks = [c for c in src.chunks if c.strip()]
+            source_hash = src.source_hash or content_hash("\n".join(chunks))
+        else:
+            text = src.content or ""
+            chunks = chunk_text(text, reindex_request.chunk_size, reindex_request.chunk_overlap)
+            source_hash = src.source_hash or content_hash(text)
+        
+        previous = stored.get(src.source)
+        if previous and previous["source_hash"] == source_hash:
+            unchanged += 1
+            keep_ids.update(previous["ids"])
+            continue
+        
+        if previous:
+            updated += 1
+            stale_ids.update(previous["ids"])
+        else:
+            added += 1
+        
+        for index, text in enumerate(chunks):
+            doc_id = chunk_id(track, text)
+            keep_ids.add(doc_id)
+            ids.append(doc_id)
+            texts.append(text)
+            metadatas.append({
+                "chunk_index": index,
+                "chunk_count": len(chunks),
+                **src.metadata,
+                "source": src.source,
+                "source_hash": source_hash,
+                "parent_hash": source_hash,
+                "content_hash": content_hash(text)
+            })
+    
+    # Tombstone removed sources (explicitly listed, or missing from a full snapshot when pruning)
+    listed = set(names)
+    removed = set(reindex_request.removed)
+    if reindex_request.prune:
+        removed.update(source for source in stored if source not in listed)
+    tombstoned = 0
+    for source in removed:
+        if source in stored and source not in listed:
+            stale_ids.update(stored[source]["ids"])
+            tombstoned += 1
+    
+    # Write first, delete second: readers always see either old or new chunks
+    upsert_chunks(track, collection, ids, texts, metadatas)
+    
+    # Identical chunks can move between sources, so never delete an id that is still in use
+    stale_ids -= keep_ids
+    stale = sorted(stale_ids)
+    for start in range(0, len(stale), REINDEX_PAGE_SIZE):
+        collection.delete(ids=stale[start:start + REINDEX_PAGE_SIZE])
+    unindex_chunks(track, stale)
+    sync_document_count(track)
+    
+    return {
+        "added": added,
+        "updated": updated,
+        "unchanged": unchanged,
+        "tombstoned": tombstoned,
+        "chunks_upserted": len(ids),
+        "chunks_deleted": len(stale)
+    }
+
+@router.post("/reindex/{track}", dependencies=[Depends(require_services)])
+async def reindex(track: str, reindex_request: ReindexRequest):
+    """
+    Incrementally refresh a track's knowledge base
+    
+    Only sources whose content hash changed are re-chunked and re-embedded;
+    unchanged sources cost one metadata lookup. Sources listed in `removed`
+    (or, with prune=true, every stored source missing from `sources`) are
+    tombstoned: their chunks are deleted after the new chunks are written.
+    """
+    if track not in COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"Track '{track}' not found")
+    apply_track_chunking(track, reindex_request)
+    if reindex_request.chunk_overlap >= reindex_request.chunk_size:
+        raise HTTPException(status_code=400, detail="chunk_overlap must be smaller than chunk_size")
+    
+    try:
+        collection = await run_blocking(COLLECTIONS.open, track)
+        result = await run_blocking(reindex_track, collection, track, reindex_request)
+        if result["chunks_upserted"] or result["chunks_deleted"]:
+            publish_track_change(track)
+        
+        print(f"🔄 Reindexed {track}: {result['added']} added, {result['updated']} updated, "
+              f"{result['unchanged']} unchanged, {result['tombstoned']} tombstoned")
+        
+        return {"status": "success", "track": track, **result}
+        
+    except Exception as e:
+        print(f"❌ Error reindexing {track}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Readiness
+# /health is a liveness probe answered from memory; /ready actually round-trips
+# to Chroma and Ollama, each bounded by RAG_READY_TIMEOUT seconds.
+READY_TIMEOUT = float(os.environ.get("RAG_READY_TIMEOUT", "2"))
+
+async def reconcile_document_counts():
+    """Periodically correct the cached document counts against Chroma"""
+    while True:
+        await asyncio.sleep(COUNT_RECONCILE_SECONDS)
         try:
-            collections_status[track] = collection.count() if collection else 0
-        except:
-            collections_status[track] = -1  # Error state
+            drift = await run_blocking(document_counts.reconcile, collection_counters())
+            if drift:
+                print(f"🔢 Reconciled document counts: {drift}")
+        except Exception as e:
+            print(f"❌ Error reconciling document counts: {e}")
+
+def config_mtime() -> Optional[float]:
+    try:
+        return os.stat(CONFIG_PATH).st_mtime
+    except FileNotFoundError:
+        return None
+
+def reload_config():
+    """Apply a changed track configuration: new tracks open on first use, removed ones are dropped"""
+    global rag_config
+    try:
+        config = load_config(CONFIG_PATH)
+    except Exception as e:
+        print(f"❌ Not reloading {CONFIG_PATH}: {e}")
+        return
+    diff = COLLECTIONS.update(config)
+    rag_config = config
+    for track in diff["removed"]:
+        KEYWORD_INDEXES.pop(track, None)
+        FILTER_INDEXES.pop(track, None)
+        QUANTIZED_INDEXES.pop(track, None)
+    for track in diff["removed"] + diff["changed"]:
+        response_cache.invalidate_track(track)
+    track_revisions.watch(diff["added"])
+    print(f"⚙️  Reloaded track configuration: {', '.join(f'{k} {v}' for k, v in diff.items() if v) or 'no changes'}")
+
+async def watch_config():
+    """Periodically reload the track configuration when its file changes, so tracks can be added without a restart"""
+    loaded = config_mtime()
+    while True:
+        await asyncio.sleep(CONFIG_RELOAD_SECONDS)
+        mtime = config_mtime()
+        if mtime != loaded:
+            loaded = mtime
+            reload_config()
+
+async def sync_tracks():
+    """Periodically pick up writes made by other worker processes"""
+    while True:
+        await asyncio.sleep(SYNC_SECONDS)
+        for track in track_revisions.changed():
+            revision = track_revisions.get(track)
+            try:
+                await run_blocking(resync_track, track)
+                response_cache.invalidate_track(track)
+                track_revisions.mark_synced(track, revision)
+                print(f"🔁 Synced {track} (revision {revision}) from another worker")
+            except Exception as e:
+                print(f"❌ Error syncing {track}: {e}")
+
+async def watch_batch_jobs():
+    """Keep this worker's batch jobs marked alive, and resume jobs nobody is running (after a restart or a crash)"""
+    while True:
+        try:
+            await run_blocking(batch_store.heartbeat, list(batch_tasks))
+            for job_id in await run_blocking(batch_store.claim_stale, BATCH_STALE_SECONDS):
+                if job_id not in batch_tasks:
+                    print(f"📦 Resuming batch {job_id}")
+                    start_batch_job(job_id)
+        except Exception as e:
+            print(f"❌ Error checking batch jobs: {e}")
+        await asyncio.sleep(max(1.0, BATCH_STALE_SECONDS / 4))
+
+def init_services():
+    """
+    Load everything the routes need (blocking; runs once per process)
+    
+    Opens Chroma, loads the ONNX embedding model and runs it once so the
+    first query doesn't pay for session setup, and opens the tracks marked
+    preload (the others open on first use). Each step is timed in
+    STARTUP["timings"].
+    """
+    global chroma_client, embedding_function, track_revisions, batch_store, content_store
+    timings = RequestTimings()
+    with timings.stage("chroma"):
+        chroma_client = open_chroma_client()
+    with timings.stage("embedding_model"):
+        embedding_function = load_embedding_function()
+        embedding_service.embedding_function = embedding_function
+        try:
+            embedding_function(["warm up"])
+        except Exception as e:
+            print(f"⚠️  Embedding model warm-up failed (will retry on first use): {e}")
+    with timings.stage("collections"):
+        preload_tracks()
+    track_revisions = TrackRevisions(STATE_DIR, COLLECTIONS.keys())
+    batch_store = BatchJobStore(BATCH_DB_PATH)
+    content_store = ContentStore(CONTENT_DIR)
+    content_store.prune(CONTENT_KEEP_VERSIONS)
+    pruned = batch_store.prune(BATCH_RETENTION_SECONDS)
+    if pruned:
+        print(f"🧹 Deleted {pruned} finished batch job(s) older than {BATCH_RETENTION_SECONDS / 86400:g} days")
+    STARTUP.update(status="ready", timings=timings.as_dict())
+    print(f"✅ Services ready in {STARTUP['timings']['total_ms'] / 1000:.1f}s")
+
+async def start_services(tasks: List[asyncio.Task]):
+    """Run init_services() off the event loop, then start the tasks that depend on it"""
+    try:
+        if STARTUP["status"] != "ready":
+            await run_blocking(init_services)
+    except Exception as e:
+        STARTUP.update(status="failed", error=str(e))
+        print(f"❌ Startup failed: {e}")
+        return
+    if COUNT_RECONCILE_SECONDS > 0:
+        tasks.append(asyncio.create_task(reconcile_document_counts()))
+    if SYNC_SECONDS > 0:
+        tasks.append(asyncio.create_task(sync_tracks()))
+    if CONFIG_RELOAD_SECONDS > 0:
+        tasks.append(asyncio.create_task(watch_config()))
+    tasks.append(asyncio.create_task(watch_batch_jobs()))
+
+async def warm_up_ollama():
+    """Create the Ollama client off the event loop (ollama/httpx import slowly), then load pinned models"""
+    await run_blocking(lambda: ollama_manager.client)
+    await ollama_manager.warm_up()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start this worker's initialization and background tasks; stop them on shutdown
     
+    The server starts accepting connections immediately; heavy initialization
+    runs in the background and readiness is reported by /health and /ready.
+    """
+    tasks = []
+    tasks.append(asyncio.create_task(start_services(tasks)))
+    # Warm up in the background so startup isn't blocked by a model load; /ready waits for it
+    tasks.append(asyncio.create_task(warm_up_ollama()))
+    if ollama_manager.pinned_models and OLLAMA_REPIN_SECONDS > 0:
+        tasks.append(asyncio.create_task(ollama_manager.keep_pinned(OLLAMA_REPIN_SECONDS)))
+    yield
+    # Unfinished batch jobs keep their pending items and are resumed later
+    for task in tasks + list(batch_tasks.values()):
+        task.cancel()
+
+async def check_dependency(name: str, probe) -> dict:
+    """Run one readiness probe with a timeout"""
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(probe(), timeout=READY_TIMEOUT)
+        status = {"ok": True}
+    except asyncio.TimeoutError:
+        status = {"ok": False, "error": f"{name} did not respond within {READY_TIMEOUT}s"}
+    except Exception as e:
+        status = {"ok": False, "error": str(e)}
+    status["ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return status
+
+@router.get("/health")
+async def health_check():
+    """Liveness probe: answers from memory without touching Chroma or Ollama"""
     return {
-        "status": "healthy",
-        "collections": collections_status,
+        "status": {"ready": "healthy"}.get(STARTUP["status"], STARTUP["status"]),
+        "startup": STARTUP,
+        "collections": {track: document_counts.get(track) if COLLECTIONS.is_open(track) else None for track in COLLECTIONS},
         "embedding_function": "ONNXMiniLM_L6_V2",
         "embedding_dimension": 384,
         "database_path": db_path
     }
 
-@app.get("/stats")
+@router.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 when startup finished, Chroma and Ollama respond and pinned models are warm, 503 otherwise"""
+    if STARTUP["status"] != "ready":
+        chroma = {"ok": False, "error": STARTUP["error"] or "starting"}
+        ollama_status = await check_dependency("Ollama", ollama_manager.client.list)
+    else:
+        chroma, ollama_status = await asyncio.gather(
+            check_dependency("Chroma", lambda: run_blocking(chroma_client.heartbeat)),
+            check_dependency("Ollama", ollama_manager.client.list)
+        )
+    ollama_status["warm_up_done"] = ollama_manager.warm_up_done
+    ollama_status["models"] = ollama_manager.warm
+    ready = chroma["ok"] and ollama_status["ok"] and ollama_manager.warm_up_done
+    return JSON_RESPONSE(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "unavailable", "chroma": chroma, "ollama": ollama_status}
+    )
+
+@router.get("/stats", dependencies=[Depends(require_services)])
 async def get_stats():
     """Get detailed statistics about the knowledge base"""
     stats = {}
     total_docs = 0
     
-    for track_name, collection in COLLECTIONS.items():
-        if collection:
-            try:
-                count = collection.count()
-                stats[track_name] = {
-                    "document_count": count,
-                    "status": "active"
-                }
-                total_docs += count
-            except Exception as e:
-                stats[track_name] = {
-                    "document_count": 0,
-                    "status": "error",
-                    "error": str(e)
-                }
+    for track_name in COLLECTIONS:
+        if not COLLECTIONS.is_open(track_name):
+            stats[track_name] = {"status": "not opened"}
+            continue
+        count = document_counts.get(track_name)
+        stats[track_name] = {
+            "document_count": count,
+            "keyword_index": KEYWORD_INDEXES[track_name].stats(),
+            "filter_index": FILTER_INDEXES[track_name].stats(),
+            "quantized_index": QUANTIZED_INDEXES[track_name].stats() if track_name in QUANTIZED_INDEXES else None,
+            "hnsw": {key: value for key, value in (COLLECTIONS.open(track_name).metadata or {}).items() if key.startswith("hnsw:")},
+            "status": "active"
+        }
+        total_docs += count
     
     return {
         "tracks": stats,
         "total_documents": total_docs,
+        "document_counts": document_counts.stats(),
+        "response_cache": response_cache.stats(),
+        "embedding_cache": embedding_service.stats(),
+        "embedding_models": {model: service.stats() for model, service in embedding_services.items()},
+        "collection_registry": COLLECTIONS.stats(),
+        "reranker": reranker.stats(),
+        "ollama": ollama_manager.stats(),
+        "scheduler": generation_scheduler.stats(),
+        "single_flight": single_flight.stats(),
+        "sessions": sessions.stats(),
+        "batch_jobs": {**batch_store.stats(), "running_here": sorted(batch_tasks)},
+        "content_store": content_store.stats(),
+        "track_revisions": track_revisions.stats(),
+        "startup": STARTUP,
         "embedding_function": "ONNXMiniLM_L6_V2",
         "embedding_dimension": 384,
         "database_path": db_path
     }
 
-@app.delete("/collection/{track}")
+@router.get("/metrics")
+async def metrics():
+    """Stage latency histograms and request counters in Prometheus text format"""
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@router.delete("/collection/{track}", dependencies=[Depends(require_services)])
 async def clear_collection(track: str):
     """Clear all documents from a track's collection (use with caution!)"""
     if track not in COLLECTIONS:
         raise HTTPException(status_code=404, detail=f"Track '{track}' not found")
     
     try:
-        # Delete and recreate collection
-        chroma_client.delete_collection(name=track)
-        COLLECTIONS[track] = chroma_client.create_collection(
-            name=track,
-            embedding_function=embedding_function,
-            metadata={"description": f"Knowledge base for {track} track"}
-        )
+        # Delete and recreate collection (with the track's current HNSW settings)
+        await run_blocking(COLLECTIONS.open, track)
+        await run_blocking(chroma_client.delete_collection, name=track)
+        COLLECTIONS.close(track)
+        await run_blocking(COLLECTIONS.open, track)
+        publish_track_change(track)
         return {
             "status": "success",
             "message": f"Collection '{track}' cleared"
@@ -280,23 +2373,80 @@ async def clear_collection(track: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/")
+@router.delete("/session/{session_id}")
+async def end_session(session_id: str):
+    """Forget a multi-turn session's stored context"""
+    if not sessions.drop(session_id):
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found")
+    return {"status": "success", "message": f"Session '{session_id}' ended"}
+
+@router.get("/tracks")
+async def list_tracks():
+    """Configured tracks with their settings, and whether this worker has opened them yet"""
+    return {
+        "config": COLLECTIONS.config.source,
+        "tracks": {
+            track: {
+                **COLLECTIONS.settings(track).model_dump(exclude={"name"}),
+                "open": COLLECTIONS.is_open(track),
+                "document_count": document_counts.get(track) if COLLECTIONS.is_open(track) else None
+            }
+            for track in COLLECTIONS
+        }
+    }
+
+@router.get("/")
 async def root():
     """API information"""
     return {
         "service": "Workforce Development RAG Service",
         "version": "1.0.0",
         "endpoints": {
-            "POST /generate": "Generate content with RAG",
+            "POST /generate": "Generate content with RAG (stream=true for NDJSON/SSE token streaming)",
+            "POST /generate/batch": "Queue prompts for offline generation (poll or stream the results)",
+            "GET /generate/batch/{job_id}": "Batch job status (/results to poll, /stream to follow)",
+            "DELETE /generate/batch/{job_id}": "Cancel a batch job",
+            "GET /content/{track}/{topic}": "Stored lesson/quiz content (ETag / If-None-Match, gzip/brotli)",
+            "PUT /content/{track}/{topic}": "Generate and store content for the track's current corpus",
+            "POST /embed": "Embed a batch of texts",
             "POST /add_document": "Add document to knowledge base",
-            "GET /health": "Health check",
+            "POST /add_documents": "Bulk add documents (chunked, batched embedding)",
+            "POST /reindex/{track}": "Incrementally update a track (changed sources only)",
+            "GET /health": "Liveness check (cached counts, no I/O)",
+            "GET /ready": "Readiness check (Chroma and Ollama reachable)",
             "GET /stats": "Get statistics",
-            "DELETE /collection/{track}": "Clear collection"
+            "GET /tracks": "Configured tracks and their settings",
+            "GET /metrics": "Prometheus metrics (per-stage latency by track and model)",
+            "DELETE /collection/{track}": "Clear collection",
+            "DELETE /session/{session_id}": "End a multi-turn session"
         },
         "tracks": list(COLLECTIONS.keys())
     }
 
+def create_app() -> FastAPI:
+    """
+    Application factory
+    
+    Used by multi-worker servers, each worker process builds its own app:
+        uvicorn rag_service:create_app --factory --workers 4
+        gunicorn -c gunicorn.conf.py "rag_service:create_app()"
+    """
+    application = FastAPI(
+        title="Workforce Dev RAG Service",
+        version="1.0.0",
+        lifespan=lifespan,
+        default_response_class=JSON_RESPONSE
+    )
+    application.include_router(router)
+    if COMPRESS_MIN_BYTES > 0:
+        application.add_middleware(CompressionMiddleware, minimum_size=COMPRESS_MIN_BYTES)
+    return application
+
+app = create_app()
+
 if __name__ == "__main__":
+    import uvicorn
+    
     print("🚀 Starting RAG Service...")
     print(f"📊 Database path: {os.path.abspath(db_path)}")
     if db_path == RAG_DB_PATH:
@@ -305,17 +2455,31 @@ if __name__ == "__main__":
         print(f"⚠️  Using fallback local database at: {LOCAL_DB_PATH}")
         print(f"   (Primary RAG database not found at: {RAG_DB_PATH})")
     print(f"📊 Embedding function: ONNXMiniLM_L6_V2 (384 dimensions)")
-    print(f"📚 Available tracks: {list(COLLECTIONS.keys())}")
-    print(f"📚 Collections status:")
-    for track_name, collection in COLLECTIONS.items():
-        if collection:
-            count = collection.count()
-            print(f"   - {track_name}: {count} documents")
-    
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=8000,
-        log_level="info"
-    )
+    print(f"⚙️  Track configuration: {rag_config.source or 'built-in defaults'}")
+    print(f"📚 Available tracks: {list(COLLECTIONS.keys())} (collections open on first use)")
+    
+    print(f"⚙️  Concurrent generations per model: {MODEL_CONCURRENCY} (overrides: {MODEL_CONCURRENCY_OVERRIDES or 'none'})")
+    
+    workers = int(os.environ.get("RAG_WORKERS", "1"))
+    if workers > 1:
+        if not CHROMA_HOST:
+            print("❌ RAG_WORKERS > 1 needs a shared Chroma server: start `chroma run --path <db> --port 8001`")
+            print("   and set RAG_CHROMA_HOST (several processes must not open the same PersistentClient)")
+            sys.exit(1)
+        print(f"👥 Starting {workers} worker processes")
+        uvicorn.run(
+            "rag_service:create_app",
+            factory=True,
+            host="0.0.0.0",
+            port=8000,
+            workers=workers,
+            log_level="info"
+        )
+    else:
+        uvicorn.run(
+            app,
+            host="0.0.0.0",
+            port=8000,
+            log_level="info"
+        )
 
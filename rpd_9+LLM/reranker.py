@@ -0,0 +1,160 @@
+"""
+Cross-Encoder Reranker for the RAG Service
+Scores (query, chunk) pairs with a small local ONNX cross-encoder on CPU
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+
+class CrossEncoderReranker:
+    """
+    Batched, cached cross-encoder scoring
+
+    `model_dir` must contain an ONNX export of a sequence-classification
+    cross-encoder (`model.onnx`) and its `tokenizer.json`, for example
+    cross-encoder/ms-marco-MiniLM-L-6-v2. onnxruntime and tokenizers are
+    already installed with ChromaDB, so no extra dependencies are needed.
+    The model loads on first use; scores are cached per (query hash, doc id).
+    """
+
+    def __init__(
+        self,
+        model_dir: Optional[str],
+        cache_size: int = 8192,
+        max_length: int = 256,
+        batch_size: int = 32
+    ):
+        self.model_dir = Path(model_dir) if model_dir else None
+        self.cache_size = cache_size
+        self.max_length = max_length
+        self.batch_size = max(1, batch_size)
+        self._session = None
+        self._tokenizer = None
+        self._input_names: List[str] = []
+        self._load_error: Optional[str] = None
+        self._load_lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.model_dir.name if self.model_dir else None
+
+    @property
+    def available(self) -> bool:
+        """True if the model is configured and loads successfully"""
+        return self._ensure_loaded()
+
+    @property
+    def unavailable_reason(self) -> Optional[str]:
+        if self.model_dir is None:
+            return "no reranker model configured (set RAG_RERANKER_MODEL_DIR)"
+        return self._load_error
+
+    def _ensure_loaded(self) -> bool:
+        if self._session is not None:
+            return True
+        if self.model_dir is None or self._load_error:
+            return False
+        with self._load_lock:
+            if self._session is not None:
+                return True
+            try:
+                import onnxruntime
+                from tokenizers import Tokenizer
+
+                tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+                tokenizer.enable_truncation(max_length=self.max_length)
+                tokenizer.enable_padding()
+                session = onnxruntime.InferenceSession(
+                    str(self.model_dir / "model.onnx"),
+                    providers=["CPUExecutionProvider"]
+                )
+                self._input_names = [i.name for i in session.get_inputs()]
+                self._tokenizer = tokenizer
+                self._session = session
+                print(f"✅ Loaded reranker: {self.model_dir}")
+            except Exception as e:
+                self._load_error = f"failed to load reranker from {self.model_dir}: {e}"
+                print(f"❌ {self._load_error}")
+                return False
+        return True
+
+    def _score_batch(self, query: str, documents: List[str]) -> List[float]:
+        """Run the cross-encoder on (query, document) pairs"""
+        encodings = self._tokenizer.encode_batch([(query, doc) for doc in documents])
+        feeds = {}
+        arrays = {
+            "input_ids": [e.ids for e in encodings],
+            "attention_mask": [e.attention_mask for e in encodings],
+            "token_type_ids": [e.type_ids for e in encodings],
+        }
+        for name in self._input_names:
+            feeds[name] = np.asarray(arrays[name], dtype=np.int64)
+        logits = self._session.run(None, feeds)[0]
+        # Single-logit relevance models return (batch, 1); two-class models return (batch, 2)
+        scores = logits[:, -1] if logits.ndim == 2 else logits
+        return [float(x) for x in scores]
+
+    def score(self, query: str, hits: List[dict]) -> List[float]:
+        """Relevance score for every hit, computing only uncached pairs"""
+        query_hash = hashlib.sha256(query.encode("utf-8")).hexdigest()
+        scores: List[Optional[float]] = [None] * len(hits)
+        missing = []
+        with self._cache_lock:
+            for i, hit in enumerate(hits):
+                cached = self._cache.get((query_hash, hit["id"]))
+                if cached is not None:
+                    self._cache.move_to_end((query_hash, hit["id"]))
+                    scores[i] = cached
+                    self.cache_hits += 1
+                else:
+                    missing.append(i)
+                    self.cache_misses += 1
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            batch_scores = self._score_batch(query, [hits[i]["document"] for i in batch])
+            with self._cache_lock:
+                for i, value in zip(batch, batch_scores):
+                    scores[i] = value
+                    self._cache[(query_hash, hits[i]["id"])] = value
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return scores
+
+    def rerank(self, query: str, hits: List[dict], top_k: int) -> Tuple[List[dict], Dict[str, object]]:
+        """Reorder hits by cross-encoder score and keep the top_k"""
+        info: Dict[str, object] = {"applied": False, "candidates": len(hits), "model": self.name}
+        if not hits:
+            return hits, info
+        if not self._ensure_loaded():
+            info["reason"] = self.unavailable_reason
+            return hits[:top_k], info
+
+        started = time.perf_counter()
+        scores = self.score(query, hits)
+        ranked = sorted(zip(scores, range(len(hits))), key=lambda item: item[0], reverse=True)
+        reranked = [{**hits[i], "rerank_score": score} for score, i in ranked[:top_k]]
+        info.update({"applied": True, "ms": round((time.perf_counter() - started) * 1000, 2)})
+        return reranked, info
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "model_dir": str(self.model_dir) if self.model_dir else None,
+            "loaded": self._session is not None,
+            "error": self._load_error,
+            "cache_entries": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses
+        }
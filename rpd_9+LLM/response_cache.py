@@ -0,0 +1,178 @@
+"""
+Response Cache for the RAG Service
+Caches generated answers so repeated prompts skip retrieval and generation
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import time
+
+import numpy as np
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace and case so trivially different prompts share a key"""
+    return " ".join(prompt.lower().split())
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of /generate responses
+
+    Lookups try an exact match on a hash of (model, track, top_k, retrieval
+    settings, normalized prompt) first. If that misses and semantic matching
+    is enabled, the query embedding is compared against cached entries with
+    the same model, track, top_k and retrieval settings, and the best entry
+    above the similarity threshold is returned. `retrieval` is any string
+    identifying the other settings that change the retrieved references
+    ("" for none).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 3600,
+        semantic: bool = True,
+        semantic_threshold: float = 0.97
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic = semantic
+        self.semantic_threshold = semantic_threshold
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(model: str, track: Optional[str], top_k: int, prompt: str, retrieval: str = "") -> str:
+        """Hash the request fields that determine the generated answer"""
+        fields = [model, track or "", top_k, normalize_prompt(prompt)]
+        if retrieval:
+            fields.append(retrieval)
+        raw = json.dumps(fields)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, entry: dict, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry["created"] > self.ttl_seconds
+
+    def get_exact(self, key: str) -> Optional[dict]:
+        """Return the cached value for an exact key, or None"""
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry, time.time()):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.exact_hits += 1
+        return entry["value"]
+
+    def get_semantic(
+        self,
+        model: str,
+        track: Optional[str],
+        top_k: int,
+        embedding: List[float],
+        retrieval: str = ""
+    ) -> Tuple[Optional[dict], float]:
+        """Return (value, similarity) for the closest cached prompt above the threshold"""
+        if not (self.enabled and self.semantic) or embedding is None:
+            self.misses += 1
+            return None, 0.0
+
+        now = time.time()
+        query = np.asarray(embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query) or 1.0
+        best_key, best_score = None, -1.0
+        expired = []
+
+        for key, entry in self._entries.items():
+            if self._expired(entry, now):
+                expired.append(key)
+                continue
+            if entry["scope"] != (model, track or "", top_k, retrieval) or entry["embedding"] is None:
+                continue
+            score = float(np.dot(query, entry["embedding"]) / (query_norm * entry["norm"]))
+            if score > best_score:
+                best_key, best_score = key, score
+
+        for key in expired:
+            del self._entries[key]
+
+        if best_key is not None and best_score >= self.semantic_threshold:
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return self._entries[best_key]["value"], best_score
+
+        self.misses += 1
+        return None, max(best_score, 0.0)
+
+    def put(
+        self,
+        key: str,
+        model: str,
+        track: Optional[str],
+        top_k: int,
+        embedding: Optional[List[float]],
+        value: dict,
+        retrieval: str = ""
+    ):
+        """Store a response, evicting the least recently used entries when full"""
+        if not self.enabled:
+            return
+        vector = None
+        norm = 1.0
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = float(np.linalg.norm(vector)) or 1.0
+        self._entries[key] = {
+            "scope": (model, track or "", top_k, retrieval),
+            "embedding": vector,
+            "norm": norm,
+            "value": value,
+            "created": time.time()
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate_track(self, track: str) -> int:
+        """Drop every cached response generated from a track's knowledge base"""
+        # Multi-track requests are scoped as "hvac+nursing"
+        stale = [key for key, entry in self._entries.items() if track in entry["scope"][1].split("+")]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "semantic": self.semantic,
+            "semantic_threshold": self.semantic_threshold,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
@@ -0,0 +1,113 @@
+"""
+Session Store for the RAG Service
+Keeps Ollama's context between the turns of a multi-turn /generate session
+"""
+
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import time
+
+
+class SessionStore:
+    """
+    LRU + TTL store of chat sessions
+
+    Each session holds the `context` token array Ollama returned for its last
+    turn and the ids of the reference chunks already placed in that context.
+    Passing the context back lets Ollama reuse the evaluated prefix instead of
+    prefilling the whole conversation again, and references it has already
+    seen don't need to be sent twice.
+
+    Sessions expire `ttl_seconds` after their last turn; beyond
+    `max_sessions` the least recently used are evicted. A context longer than
+    `max_context_tokens` is not kept (the model would truncate it, and the
+    references at its start with it), so the next turn starts over. Tokens
+    are stored as 32-bit ints rather than Python lists.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 1800, max_context_tokens: int = 32768):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_context_tokens = max_context_tokens
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.resets = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_sessions > 0
+
+    def _expired(self, session: dict, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - session["updated"] > self.ttl_seconds
+
+    def get(self, session_id: str, model: str) -> Optional[dict]:
+        """
+        The session's state for its next turn, or None to start a new one
+
+        Returns {"context": [...], "references": {...}, "turns": n}. Context
+        tokens only mean something to the model that produced them, so a
+        session continued with a different model starts over.
+        """
+        if not self.enabled:
+            return None
+        session = self._sessions.get(session_id)
+        if session is not None and self._expired(session, time.time()):
+            del self._sessions[session_id]
+            self.expirations += 1
+            session = None
+        if session is None or session["model"] != model:
+            self.misses += 1
+            return None
+        self._sessions.move_to_end(session_id)
+        self.hits += 1
+        return {
+            "context": session["context"].tolist(),
+            "references": set(session["references"]),
+            "turns": session["turns"]
+        }
+
+    def save(self, session_id: str, model: str, context: Optional[List[int]], references: Iterable[str], turns: int):
+        """Record a finished turn, evicting the least recently used sessions when full"""
+        if not self.enabled:
+            return
+        if not context or len(context) > self.max_context_tokens:
+            if self._sessions.pop(session_id, None) is not None:
+                self.resets += 1
+            return
+        self._sessions[session_id] = {
+            "model": model,
+            "context": array("i", context),
+            "references": frozenset(references),
+            "turns": turns,
+            "updated": time.time()
+        }
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def drop(self, session_id: str) -> bool:
+        """End a session; returns whether it existed"""
+        return self._sessions.pop(session_id, None) is not None
+
+    def clear(self):
+        self._sessions.clear()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "max_context_tokens": self.max_context_tokens,
+            "context_tokens": sum(len(session["context"]) for session in self._sessions.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "resets": self.resets
+        }
@@ -0,0 +1,138 @@
+"""
+Single-Flight Request Coalescing for the RAG Service
+Concurrent identical /generate requests share one upstream generation
+"""
+
+from typing import AsyncIterator, Callable, Dict, List, Optional
+import asyncio
+
+
+class Subscription:
+    """One client's interest in a flight; leave() is idempotent"""
+
+    def __init__(self, flight: "Flight"):
+        self.flight = flight
+        self.left = False
+
+    def leave(self):
+        if not self.left:
+            self.left = True
+            self.flight._detach()
+
+
+class Flight:
+    """
+    One running generation and the chunks it has produced so far
+
+    Chunks are kept for the life of the flight, so a subscriber that joins
+    late replays everything from the first chunk and then follows live.
+    """
+
+    def __init__(self, key: Optional[str]):
+        self.key = key
+        self.chunks: List[dict] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._event = asyncio.Event()
+
+    def publish(self, chunk: dict):
+        self.chunks.append(chunk)
+        self._wake()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._wake()
+
+    def _wake(self):
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    def subscribe(self) -> Subscription:
+        self.subscribers += 1
+        return Subscription(self)
+
+    def _detach(self):
+        self.subscribers -= 1
+        # Nobody is listening any more: stop generating
+        if self.subscribers <= 0 and not self.done and self.task is not None:
+            self.task.cancel()
+
+    async def first(self) -> dict:
+        """Wait for the first chunk; re-raise the producer's error if it failed before producing one"""
+        while not self.chunks:
+            if self.done:
+                raise self.error or RuntimeError("generation produced no output")
+            await self._event.wait()
+        return self.chunks[0]
+
+    async def stream(self, subscription: Subscription) -> AsyncIterator[dict]:
+        """Every chunk from the start, then new chunks as they are published"""
+        index = 0
+        try:
+            while True:
+                if index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._event.wait()
+        finally:
+            subscription.leave()
+
+
+class SingleFlight:
+    """
+    Registry of in-flight generations keyed by request identity
+
+    `join(key, producer)` attaches to the running flight for `key`, or starts
+    `producer()` (an async generator of chunks) as a background task if there
+    is none. A key of None always starts a private, uncoalesced flight. The
+    producer runs detached from any one client, so the leader disconnecting
+    does not cut off followers; it is cancelled once every subscriber leaves.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key: Optional[str], producer: Callable[[], AsyncIterator[dict]]):
+        """Return (flight, subscription, is_leader)"""
+        flight = self._flights.get(key) if key is not None else None
+        if flight is not None and not flight.done:
+            self.followers += 1
+            return flight, flight.subscribe(), False
+
+        flight = Flight(key)
+        if key is not None:
+            self._flights[key] = flight
+        self.leaders += 1
+        subscription = flight.subscribe()
+        flight.task = asyncio.create_task(self._run(flight, producer))
+        return flight, subscription, True
+
+    async def _run(self, flight: Flight, producer: Callable[[], AsyncIterator[dict]]):
+        try:
+            async for chunk in producer():
+                flight.publish(chunk)
+            flight.finish()
+        except asyncio.CancelledError:
+            flight.finish(RuntimeError("generation cancelled"))
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            if flight.key is not None and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers
+        }
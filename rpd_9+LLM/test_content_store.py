@@ -0,0 +1,95 @@
+"""
+Tests for content_store.py and the conditional GET on /content/{track}/{topic}
+"""
+
+import gzip
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import rag_service as rs
+from content_store import ContentStore, choose_encoding, parse_etags
+
+LESSON = json.dumps({"lesson": "Check the condenser coil before the compressor. " * 20}).encode("utf-8")
+
+
+def test_parse_etags_strips_weak_quotes_and_encoding_suffixes():
+    assert parse_etags(None) == []
+    assert parse_etags('"abc"') == ["abc"]
+    assert parse_etags('W/"abc-gzip", "def-br" ,*') == ["abc", "def", "*"]
+
+
+@pytest.mark.parametrize("accept, available, expected", [
+    (None, ["br", "gzip"], "identity"),
+    ("gzip, br", ["br", "gzip"], "br"),
+    ("gzip, br;q=0", ["br", "gzip"], "gzip"),
+    ("br", ["gzip"], "identity"),
+    ("*", ["gzip"], "gzip"),
+    ("*, gzip;q=0", ["gzip"], "identity"),
+    ("gzip;q=bad", ["gzip"], "identity"),
+])
+def test_choose_encoding(accept, available, expected):
+    assert choose_encoding(accept, available) == expected
+
+
+def test_put_lookup_and_read(tmp_path):
+    store = ContentStore(str(tmp_path))
+    old = store.put("hvac", "lesson-1", "m", "v1", b"short")
+    new = store.put("hvac", "lesson-1", "m", "v2", LESSON)
+
+    assert store.lookup("hvac", "lesson-1", "m", "v1")["digest"] == old["digest"]
+    assert store.lookup("hvac", "lesson-1", "m")["digest"] == new["digest"]  # Latest of any version
+    assert store.lookup("hvac", "lesson-1", "m", "v3") is None
+    assert store.lookup("hvac", "lesson-1", "other", "v2") is None
+
+    assert store.encodings(old["digest"]) == []  # Below compress_min_bytes
+    assert "gzip" in store.encodings(new["digest"])
+    assert store.read(new["digest"]) == LESSON
+    assert gzip.decompress(store.read(new["digest"], "gzip")) == LESSON
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(rs.STARTUP, "status", "ready")
+    monkeypatch.setattr(rs, "content_store", ContentStore(str(tmp_path)))
+    monkeypatch.setattr(rs, "corpus_version", lambda track: "v2")
+    rs.content_store.put("hvac", "lesson-1", "gpt-oss:20b", "v1", b'{"lesson": "old"}')
+    return TestClient(rs.create_app())
+
+
+def test_conditional_get_returns_304_for_a_matching_etag(client):
+    entry = rs.content_store.put("hvac", "lesson-1", "gpt-oss:20b", "v2", LESSON)
+    first = client.get("/content/hvac/lesson-1", headers={"Accept-Encoding": "identity"})
+    assert first.status_code == 200
+    assert first.content == LESSON
+    assert first.headers["etag"] == f'"{entry["digest"]}"'
+    assert first.headers["x-corpus-version"] == "v2"
+
+    for etag in (first.headers["etag"], f'W/"{entry["digest"]}-gzip"', '"stale", ' + first.headers["etag"], "*"):
+        revalidated = client.get("/content/hvac/lesson-1", headers={"If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        assert revalidated.headers["etag"] == first.headers["etag"]
+
+    assert client.get("/content/hvac/lesson-1", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_compressed_variant_has_its_own_etag(client):
+    entry = rs.content_store.put("hvac", "lesson-1", "gpt-oss:20b", "v2", LESSON)
+    response = client.get("/content/hvac/lesson-1", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == f'"{entry["digest"]}-gzip"'
+    assert response.content == LESSON  # Decoded by the client
+    revalidated = client.get("/content/hvac/lesson-1", headers={"If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304
+
+
+def test_older_corpus_version_is_404_unless_stale_is_allowed(client):
+    assert client.get("/content/hvac/lesson-1").status_code == 404
+    stale = client.get("/content/hvac/lesson-1", params={"allow_stale": "true"})
+    assert stale.status_code == 200
+    assert stale.headers["x-content-stale"] == "true"
+    assert stale.headers["x-corpus-version"] == "v1"
+    assert client.get("/content/unknown-track/lesson-1").status_code == 404
@@ -0,0 +1,168 @@
+"""
+Tests for generation_scheduler.py: admission, priorities, deadlines and Retry-After
+"""
+
+import asyncio
+
+import pytest
+
+from generation_scheduler import GenerationScheduler, SchedulerRejected
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_admits_up_to_the_slot_count_then_queues():
+    async def scenario():
+        scheduler = GenerationScheduler(default_slots=2, max_queue=4)
+        first = await scheduler.acquire("m")
+        second = await scheduler.acquire("m")
+        waiter = asyncio.create_task(scheduler.acquire("m"))
+        await asyncio.sleep(0.01)
+        queued = scheduler.queued()
+        first.release()
+        first.release()  # Idempotent: frees one slot only
+        third = await asyncio.wait_for(waiter, timeout=1)
+        stats = scheduler.stats()["models"]["m"]
+        second.release()
+        third.release()
+        return queued, stats, scheduler.stats()["models"]["m"]
+
+    queued, busy, idle = run(scenario())
+    assert queued == 1
+    assert busy["active"] == 2 and busy["queued"] == 0
+    assert idle["active"] == 0
+
+
+def test_interactive_requests_are_dispatched_before_background():
+    async def scenario():
+        scheduler = GenerationScheduler(default_slots=1, max_queue=4)
+        lease = await scheduler.acquire("m")
+        order = []
+
+        async def wait(name, priority):
+            async with await scheduler.acquire("m", priority):
+                order.append(name)
+
+        tasks = [asyncio.create_task(wait("background", "background"))]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.create_task(wait("interactive", "interactive")))
+        await asyncio.sleep(0.01)
+        lease.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(scenario()) == ["interactive", "background"]
+
+
+def test_full_queue_rejects_with_retry_after():
+    async def scenario():
+        scheduler = GenerationScheduler(default_slots=1, max_queue=1, initial_service_seconds=10)
+        lease = await scheduler.acquire("m")
+        waiter = asyncio.create_task(scheduler.acquire("m"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(SchedulerRejected) as rejected:
+            await scheduler.acquire("m")
+        with pytest.raises(SchedulerRejected) as checked:
+            scheduler.check_admission("m")
+        lease.release()
+        (await waiter).release()
+        return scheduler, rejected.value, checked.value
+
+    scheduler, rejected, checked = run(scenario())
+    assert rejected.reason == checked.reason == "queue_full"
+    # One request waiting on one slot that takes ~10s: the next is free in about 20s
+    assert rejected.retry_after == checked.retry_after == 20
+    assert scheduler.rejected == 2 and scheduler.admitted == 2
+
+
+def test_check_admission_passes_while_a_slot_or_queue_space_is_free():
+    async def scenario():
+        scheduler = GenerationScheduler(default_slots=1, max_queue=1)
+        scheduler.check_admission("m")
+        lease = await scheduler.acquire("m")
+        scheduler.check_admission("m")  # The queue still has room
+        lease.release()
+        return scheduler
+
+    scheduler = run(scenario())
+    assert scheduler.rejected == 0 and scheduler.queued() == 0
+
+
+def test_background_requests_use_only_their_share_of_the_queue():
+    async def scenario():
+        scheduler = GenerationScheduler(default_slots=1, max_queue=2, background_share=0.5)
+        lease = await scheduler.acquire("m")
+        background = asyncio.create_task(scheduler.acquire("m", "background"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(SchedulerRejected):
+            await scheduler.acquire("m", "background")
+        interactive = asyncio.create_task(scheduler.acquire("m", "interactive"))
+        await asyncio.sleep(0.01)
+        queued = scheduler.queued()
+        lease.release()
+        (await interactive).release()
+        (await background).release()
+        return queued
+
+    assert run(scenario()) == 2
+
+
+def test_deadline_drops_the_waiter_and_frees_its_queue_place():
+    async def scenario():
+        scheduler = GenerationScheduler(default_slots=1, max_queue=1)
+        lease = await scheduler.acquire("m")
+        with pytest.raises(SchedulerRejected) as dropped:
+            await scheduler.acquire("m", timeout=0.05)
+        queued_after = scheduler.queued()
+        # The expired waiter must not take the slot when it frees up
+        lease.release()
+        stats = scheduler.stats()
+        return dropped.value, queued_after, stats
+
+    dropped, queued_after, stats = run(scenario())
+    assert dropped.reason == "deadline"
+    assert dropped.retry_after >= 1
+    assert queued_after == 0
+    assert stats["dropped"] == 1 and stats["models"]["m"]["active"] == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = GenerationScheduler(default_slots=1, max_queue=1)
+        lease = await scheduler.acquire("m")
+        waiter = asyncio.create_task(scheduler.acquire("m"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        queued = scheduler.queued()
+        lease.release()
+        return queued, scheduler.stats()["models"]["m"]["active"]
+
+    assert run(scenario()) == (0, 0)
+
+
+def test_retry_after_spreads_queued_work_over_the_slots():
+    scheduler = GenerationScheduler(default_slots=4, initial_service_seconds=10)
+    assert scheduler.retry_after("m") == 3  # ceil(10 * 1 / 4)
+    scheduler = GenerationScheduler(default_slots=1, initial_service_seconds=1000)
+    assert scheduler.retry_after("m") == 300  # Capped
+
+
+def test_unconfigured_models_share_the_other_queue():
+    async def scenario():
+        scheduler = GenerationScheduler(default_slots=1, slot_overrides={"big": 1}, max_queue=4, models={"small"})
+        leases = [await scheduler.acquire(model) for model in ("small", "big", "client-a")]
+        waiter = asyncio.create_task(scheduler.acquire("client-b"))
+        await asyncio.sleep(0.01)
+        models = scheduler.stats()["models"]
+        for lease in leases:
+            lease.release()
+        (await waiter).release()
+        return models
+
+    models = run(scenario())
+    assert set(models) == {"small", "big", "other"}
+    assert models["other"]["active"] == 1 and models["other"]["queued"] == 1
@@ -0,0 +1,91 @@
+"""
+Tests for quantized_index.py: int8 candidates re-scored with exact distances
+"""
+
+import numpy as np
+import pytest
+
+import rag_service as rs
+from filtered_search import exact_distances
+from quantized_index import QuantizedIndex
+
+
+class FakeCollection:
+    """The part of a Chroma collection exact_search uses: get by ids"""
+
+    def __init__(self, ids, embeddings):
+        self.rows = {doc_id: vector for doc_id, vector in zip(ids, embeddings)}
+
+    def get(self, ids, include):
+        found = [doc_id for doc_id in ids if doc_id in self.rows]
+        page = {"ids": found}
+        if "embeddings" in include:
+            page["embeddings"] = np.array([self.rows[doc_id] for doc_id in found])
+        if "documents" in include:
+            page["documents"] = [f"text of {doc_id}" for doc_id in found]
+        if "metadatas" in include:
+            page["metadatas"] = [{"id": doc_id} for doc_id in found]
+        return page
+
+
+def corpus(rows=600, dim=32, seed=7):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(rows, dim)).astype(np.float32)
+    ids = [f"chunk-{i:04d}" for i in range(rows)]
+    queries = rng.normal(size=(4, dim)).astype(np.float32)
+    return ids, embeddings, queries
+
+
+def brute_force(ids, embeddings, query, n, space, among=None):
+    distances = exact_distances(embeddings, query, space)
+    order = [i for i in np.argsort(distances) if among is None or ids[i] in among]
+    return [ids[i] for i in order[:n]]
+
+
+@pytest.mark.parametrize("space", ["l2", "cosine"])
+def test_rescored_candidates_match_brute_force(tmp_path, space):
+    ids, embeddings, queries = corpus()
+    index = QuantizedIndex(str(tmp_path), "hvac", space=space)
+    index.add(ids, embeddings)
+    collection = FakeCollection(ids, embeddings)
+
+    results = rs.quantized_search(collection, index, queries.tolist(), 5)
+    for query, hits in zip(queries, results):
+        assert [hit["id"] for hit in hits] == brute_force(ids, embeddings, query, 5, space)
+        exact = exact_distances(np.array([collection.rows[hit["id"]] for hit in hits]), query, space)
+        assert [hit["distance"] for hit in hits] == pytest.approx(exact.tolist(), rel=1e-5)
+        assert hits[0]["document"] == f"text of {hits[0]['id']}"
+
+
+def test_candidates_respect_allowed_and_removed_ids(tmp_path):
+    ids, embeddings, queries = corpus()
+    index = QuantizedIndex(str(tmp_path), "hvac")
+    index.add(ids, embeddings)
+    index.compact()
+    allowed = set(ids[::3])
+    removed = set(ids[::2])
+    index.remove(removed)
+
+    for hits in index.candidates(queries, 20, allowed=allowed):
+        assert len(hits) == 20
+        assert set(hits) <= allowed - removed
+    assert all(set(hits).isdisjoint(removed) for hits in index.candidates(queries, 50))
+    assert index.candidates(queries, 5, allowed=set()) == [[] for _ in queries]
+
+
+def test_pending_chunks_are_searched_before_and_after_compaction(tmp_path):
+    ids, embeddings, queries = corpus()
+    index = QuantizedIndex(str(tmp_path), "hvac", signature="model-a")
+    index.add(ids[:550], embeddings[:550])
+    index.compact()
+    index.add(ids[550:], embeddings[550:])  # Below compact_fraction: kept in memory
+    assert index.stats()["pending"] == 50
+    before = index.candidates(queries, 10)
+
+    index.compact()
+    reloaded = QuantizedIndex(str(tmp_path), "hvac", signature="model-a")
+    assert reloaded.load()
+    assert len(reloaded) == len(ids)
+    assert reloaded.candidates(queries, 10) == before
+    # Built by another embedding model: the files must not be reused
+    assert not QuantizedIndex(str(tmp_path), "hvac", signature="model-b").load()
@@ -0,0 +1,83 @@
+"""
+Tests for response cache keys: answers are only shared between requests that
+would have retrieved the same references
+"""
+
+import pytest
+from pydantic import ValidationError
+
+import rag_service as rs
+from response_cache import ResponseCache
+
+
+def signature(**fields):
+    fields.setdefault("prompt", "Why does the compressor trip?")
+    fields.setdefault("track", "hvac")
+    fields.setdefault("top_k", 3)
+    return rs.retrieval_signature(rs.GenerateRequest(**fields))
+
+
+def test_make_key_separates_retrieval_settings():
+    base = ResponseCache.make_key("m", "hvac", 3, "Why does it trip?")
+    assert ResponseCache.make_key("m", "hvac", 3, "  why does it TRIP?") == base
+    assert ResponseCache.make_key("m", "hvac", 3, "Why does it trip?", "") == base
+    keys = {
+        base,
+        ResponseCache.make_key("m", "hvac", 3, "Why does it trip?", '{"hybrid": true}'),
+        ResponseCache.make_key("m", "hvac", 3, "Why does it trip?", '{"hybrid": false}'),
+        ResponseCache.make_key("m", "nursing", 3, "Why does it trip?"),
+        ResponseCache.make_key("m", "hvac", 5, "Why does it trip?"),
+        ResponseCache.make_key("other", "hvac", 3, "Why does it trip?"),
+    }
+    assert len(keys) == 6
+
+
+def test_semantic_lookup_is_scoped_by_retrieval_settings():
+    cache = ResponseCache(max_entries=8, semantic_threshold=0.9)
+    embedding = [1.0, 0.0, 0.0]
+    key = ResponseCache.make_key("m", "hvac", 3, "q", "hybrid")
+    cache.put(key, "m", "hvac", 3, embedding, {"response": "hybrid answer"}, retrieval="hybrid")
+
+    value, score = cache.get_semantic("m", "hvac", 3, [0.99, 0.1, 0.0], retrieval="hybrid")
+    assert value == {"response": "hybrid answer"} and score > 0.9
+    value, _ = cache.get_semantic("m", "hvac", 3, embedding, retrieval="vector")
+    assert value is None
+    value, _ = cache.get_semantic("m", "hvac", 3, embedding)
+    assert value is None
+    assert cache.get_exact(ResponseCache.make_key("m", "hvac", 3, "q", "vector")) is None
+
+
+@pytest.mark.parametrize("changed", [
+    {"hybrid": not rs.HYBRID_SEARCH},
+    {"rerank": True},
+    {"context_tokens": 123},
+    {"where": {"difficulty": "beginner"}},
+    {"where_document": {"$contains": "R-410A"}},
+])
+def test_signature_changes_with_each_retrieval_setting(changed):
+    assert signature(**changed) != signature()
+
+
+def test_signature_includes_rerank_candidates_only_when_reranking():
+    assert signature(rerank=True, candidates=10) != signature(rerank=True, candidates=40)
+    assert signature(candidates=10) == signature(candidates=40)
+
+
+def test_signature_includes_track_quota_only_for_several_tracks():
+    assert signature(track_quota=1) == signature(track_quota=2)
+    several = {"track": None, "tracks": ["hvac", "nursing"]}
+    assert signature(track_quota=1, **several) != signature(track_quota=2, **several)
+    # The default quota is derived from top_k, so a different top_k changes it too
+    assert signature(top_k=2, **several) != signature(top_k=8, **several)
+
+
+def test_signature_is_canonical():
+    where = {"difficulty": "beginner", "module": {"$in": ["3", "4"]}}
+    reordered = {"module": {"$in": ["3", "4"]}, "difficulty": "beginner"}
+    assert signature(where=where) == signature(where=reordered)
+
+
+@pytest.mark.parametrize("field", ["top_k", "candidates", "context_tokens", "track_quota"])
+def test_generate_request_rejects_zero_sizes(field):
+    with pytest.raises(ValidationError):
+        rs.GenerateRequest(prompt="q", **{field: 0})
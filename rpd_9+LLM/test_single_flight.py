@@ -0,0 +1,145 @@
+"""
+Tests for single_flight.py: leader/follower fan-out and cancellation
+"""
+
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def collect(flight, subscription):
+    return [chunk async for chunk in flight.stream(subscription)]
+
+
+def counting_producer(calls, chunks=3, delay=0.01):
+    def producer():
+        calls.append(1)
+
+        async def generate():
+            for i in range(chunks):
+                await asyncio.sleep(delay)
+                yield {"i": i}
+        return generate()
+    return producer
+
+
+def test_followers_share_the_leaders_generation():
+    async def scenario():
+        registry, calls = SingleFlight(), []
+        producer = counting_producer(calls)
+        leader_flight, leader_sub, leader = registry.join("k", producer)
+        follower_flight, follower_sub, follower = registry.join("k", producer)
+        assert leader and not follower
+        assert follower_flight is leader_flight
+        results = await asyncio.gather(collect(leader_flight, leader_sub), collect(follower_flight, follower_sub))
+        return registry, calls, results
+
+    registry, calls, results = run(scenario())
+    assert len(calls) == 1
+    assert results[0] == results[1] == [{"i": 0}, {"i": 1}, {"i": 2}]
+    assert registry.stats() == {"in_flight": 0, "leaders": 1, "followers": 1}
+
+
+def test_late_follower_replays_from_the_first_chunk():
+    async def scenario():
+        registry, calls = SingleFlight(), []
+        flight, leader_sub, _ = registry.join("k", counting_producer(calls, chunks=4, delay=0.02))
+        await flight.first()
+        await asyncio.sleep(0.03)
+        assert not flight.done
+        _, follower_sub, leader = registry.join("k", counting_producer(calls))
+        assert not leader
+        return calls, await collect(flight, follower_sub), await collect(flight, leader_sub)
+
+    calls, follower_chunks, leader_chunks = run(scenario())
+    assert len(calls) == 1
+    assert follower_chunks == leader_chunks == [{"i": i} for i in range(4)]
+
+
+def test_different_and_none_keys_are_never_coalesced():
+    async def scenario():
+        registry, calls = SingleFlight(), []
+        joined = [registry.join(key, counting_producer(calls)) for key in ("a", "b", None, None)]
+        assert all(leader for _, _, leader in joined)
+        assert len({id(flight) for flight, _, _ in joined}) == 4
+        await asyncio.gather(*[collect(flight, sub) for flight, sub, _ in joined])
+        return calls
+
+    assert len(run(scenario())) == 4
+
+
+def test_finished_flight_is_not_joined():
+    async def scenario():
+        registry, calls = SingleFlight(), []
+        flight, sub, _ = registry.join("k", counting_producer(calls, chunks=1))
+        await collect(flight, sub)
+        second, sub, leader = registry.join("k", counting_producer(calls, chunks=1))
+        assert second is not flight
+        await collect(second, sub)
+        return leader, calls
+
+    leader, calls = run(scenario())
+    assert leader
+    assert len(calls) == 2
+
+
+def test_producer_is_cancelled_once_every_subscriber_leaves():
+    async def scenario():
+        registry = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def generate():
+            yield {"i": 0}
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            yield {"i": 1}
+
+        flight, first_sub, _ = registry.join("k", generate)
+        _, second_sub, _ = registry.join("k", generate)
+        await flight.first()
+
+        first_sub.leave()
+        first_sub.leave()  # Idempotent: must not count as the second subscriber leaving
+        await asyncio.sleep(0.01)
+        still_running = not flight.task.done()
+
+        second_sub.leave()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        await asyncio.sleep(0)
+        return registry, flight, still_running
+
+    registry, flight, still_running = run(scenario())
+    assert still_running
+    assert flight.done and isinstance(flight.error, RuntimeError)
+    assert registry.stats()["in_flight"] == 0
+
+
+def test_producer_error_reaches_every_subscriber():
+    async def scenario():
+        registry = SingleFlight()
+
+        async def generate():
+            raise ValueError("ollama unavailable")
+            yield  # pragma: no cover
+
+        flight, first_sub, _ = registry.join("k", generate)
+        _, second_sub, _ = registry.join("k", generate)
+        errors = []
+        for sub in (first_sub, second_sub):
+            with pytest.raises(ValueError):
+                await flight.first()
+            sub.leave()
+            errors.append(flight.error)
+        return errors
+
+    errors = run(scenario())
+    assert all(isinstance(error, ValueError) for error in errors)
@@ -0,0 +1,66 @@
+"""
+Track Revisions for the RAG Service
+Lets several worker processes notice each other's writes to a track
+"""
+
+from typing import Dict, Iterable, List
+import os
+
+
+class TrackRevisions:
+    """
+    Per-track write counters shared through a directory
+
+    Each track has a file that grows by one byte per write, so `bump` is a
+    single O_APPEND write (atomic across processes, no locking) and the
+    current revision is just the file size. Every worker remembers the last
+    revision it synced; a track whose revision moved was written by another
+    worker, so its in-process state (keyword index, counts, cached answers)
+    must be refreshed.
+    """
+
+    def __init__(self, directory: str, tracks: Iterable[str]):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._seen: Dict[str, int] = {track: self.get(track) for track in tracks}
+
+    def _path(self, track: str) -> str:
+        return os.path.join(self.directory, f"{track}.rev")
+
+    def get(self, track: str) -> int:
+        try:
+            return os.stat(self._path(track)).st_size
+        except FileNotFoundError:
+            return 0
+
+    def bump(self, track: str) -> int:
+        """Record a write made by this process"""
+        fd = os.open(self._path(track), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, b".")
+        finally:
+            os.close(fd)
+        revision = self.get(track)
+        # Only our own write since the last sync: nothing to refresh
+        if revision == self._seen.get(track, 0) + 1:
+            self._seen[track] = revision
+        return revision
+
+    def watch(self, tracks: Iterable[str]):
+        """Start following tracks added after startup"""
+        for track in tracks:
+            self._seen.setdefault(track, self.get(track))
+
+    def changed(self) -> List[str]:
+        """Tracks written by another process since they were last synced"""
+        return [track for track, seen in self._seen.items() if self.get(track) != seen]
+
+    def mark_synced(self, track: str, revision: int):
+        self._seen[track] = revision
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "directory": self.directory,
+            "revisions": {track: self.get(track) for track in self._seen},
+            "synced": dict(self._seen)
+        }